@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from .models import (
     Categoria, Fornecedor, Produto, MovimentacaoEstoque, 
-    InventarioFisico, ItemInventario
+    InventarioFisico, ItemInventario, SnapshotEstoque, ChaveIdempotencia, Tarefa,
+    MovimentacaoDiaria, PrevisaoDemanda, AlertaEstoque, InscricaoPush,
 )
 
 
@@ -26,7 +27,7 @@ class ProdutoAdmin(admin.ModelAdmin):
         'codigo', 'nome', 'categoria', 'quantidade_atual', 
         'quantidade_minima', 'estoque_status', 'preco_venda', 'ativo'
     ]
-    list_filter = ['categoria', 'fornecedor', 'ativo', 'criado_em']
+    list_filter = ['categoria', 'fornecedor', 'ativo', 'abaixo_minimo', 'criado_em']
     search_fields = ['codigo', 'nome', 'qr_code']
     readonly_fields = ['qr_code', 'criado_em', 'atualizado_em']
     
@@ -49,13 +50,14 @@ class ProdutoAdmin(admin.ModelAdmin):
     )
 
     def estoque_status(self, obj):
-        if obj.estoque_baixo:
+        if obj.abaixo_minimo:
             return format_html(
                 '<span style="color: red; font-weight: bold;">⚠️ Baixo</span>'
             )
         return format_html('<span style="color: green;">✓ Normal</span>')
     
     estoque_status.short_description = 'Status Estoque'
+    estoque_status.admin_order_field = 'abaixo_minimo'
 
 
 @admin.register(MovimentacaoEstoque)
@@ -94,3 +96,71 @@ class ItemInventarioAdmin(admin.ModelAdmin):
     list_filter = ['inventario', 'contado_em']
     search_fields = ['produto__nome', 'produto__codigo']
     readonly_fields = ['diferenca']
+
+
+@admin.register(SnapshotEstoque)
+class SnapshotEstoqueAdmin(admin.ModelAdmin):
+    list_display = [
+        'data', 'dimensao', 'nome', 'total_produtos',
+        'quantidade', 'valor_custo', 'valor_venda'
+    ]
+    list_filter = ['dimensao', 'data']
+    search_fields = ['nome']
+    date_hierarchy = 'data'
+    readonly_fields = ['atualizado_em']
+
+
+@admin.register(MovimentacaoDiaria)
+class MovimentacaoDiariaAdmin(admin.ModelAdmin):
+    list_display = ['dia', 'produto', 'tipo', 'quantidade', 'variacao', 'movimentacoes']
+    list_filter = ['tipo']
+    search_fields = ['produto__nome', 'produto__codigo']
+    date_hierarchy = 'dia'
+    raw_id_fields = ['produto']
+    list_select_related = ['produto']
+
+
+@admin.register(PrevisaoDemanda)
+class PrevisaoDemandaAdmin(admin.ModelAdmin):
+    list_display = [
+        'produto', 'demanda_diaria', 'media_diaria', 'desvio_diario',
+        'estoque_seguranca', 'ponto_pedido', 'calculado_em'
+    ]
+    search_fields = ['produto__nome', 'produto__codigo']
+    list_select_related = ['produto']
+    readonly_fields = ['calculado_em']
+
+
+@admin.register(AlertaEstoque)
+class AlertaEstoqueAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'quantidade', 'quantidade_minima', 'criado_em', 'enviado_em']
+    search_fields = ['produto__nome', 'produto__codigo']
+    date_hierarchy = 'criado_em'
+    list_select_related = ['produto']
+    raw_id_fields = ['produto', 'movimentacao']
+
+
+@admin.register(InscricaoPush)
+class InscricaoPushAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'endpoint', 'criado_em']
+    search_fields = ['usuario__username', 'endpoint']
+    list_select_related = ['usuario']
+
+
+@admin.register(ChaveIdempotencia)
+class ChaveIdempotenciaAdmin(admin.ModelAdmin):
+    list_display = ['chave', 'usuario', 'criado_em']
+    search_fields = ['chave', 'usuario__username']
+    date_hierarchy = 'criado_em'
+    readonly_fields = ['usuario', 'chave', 'resposta', 'criado_em']
+
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'nome', 'status', 'progresso', 'tentativas', 'criado_por', 'criado_em', 'concluida_em']
+    list_filter = ['status', 'nome']
+    date_hierarchy = 'criado_em'
+    readonly_fields = [
+        'nome', 'argumentos', 'tentativas', 'progresso', 'mensagem', 'resultado', 'erro',
+        'worker', 'expira_em', 'criado_por', 'criado_em', 'iniciada_em', 'concluida_em',
+    ]
@@ -0,0 +1,201 @@
+"""
+Alertas de estoque baixo enviados por Web Push
+
+Em vez de consultar o catálogo inteiro, cada movimentação confirmada é
+comparada com o mínimo do produto: há alerta quando
+``quantidade_anterior > quantidade_minima >= quantidade_atual`` (o estoque
+acabou de cruzar o mínimo). ``registrar_alertas`` é chamado pelo signal
+``movimentacoes_registradas``.
+
+- Um produto com alerta ainda não enviado, ou criado há menos de
+  ``ALERTAS_REPETICAO_HORAS``, não gera outro (entradas e saídas em volta
+  do mínimo não viram uma enxurrada de notificações);
+- o primeiro alerta pendente agenda a tarefa ``enviar_alertas`` para daqui
+  a ``ALERTAS_INTERVALO_SEGUNDOS``; ela junta todos os pendentes em uma
+  única notificação para cada navegador inscrito.
+
+O envio passa pelo backend de ``PUSH_BACKEND``: ``WebPush`` usa o pacote
+opcional ``pywebpush`` com as chaves VAPID de ``PUSH_VAPID_*``; ``PushLocal``
+guarda as mensagens em memória (testes e desenvolvimento).
+"""
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .fila import enfileirar
+from .models import AlertaEstoque, InscricaoPush, Produto, Tarefa
+
+
+logger = logging.getLogger('estoque.alertas')
+
+# Produtos consultados por vez ao comparar com o mínimo
+TAMANHO_BLOCO = 900
+
+# Produtos citados no texto da notificação; os demais viram "e mais N"
+PRODUTOS_NO_RESUMO = 5
+
+
+class InscricaoExpirada(Exception):
+    """O serviço de push não reconhece mais a inscrição (HTTP 404/410)"""
+
+
+class WebPush:
+    """Envio pelo protocolo Web Push com VAPID (pacote ``pywebpush``)"""
+
+    def __init__(self):
+        self.chave_privada = getattr(settings, 'PUSH_VAPID_CHAVE_PRIVADA', '')
+        self.contato = getattr(settings, 'PUSH_VAPID_CONTATO', '')
+
+    def disponivel(self):
+        if not self.chave_privada:
+            return False
+        try:
+            import pywebpush  # noqa: F401
+        except ImportError:
+            logger.warning('Web Push desativado: instale o pacote pywebpush.')
+            return False
+        return True
+
+    def enviar(self, inscricao, mensagem):
+        from pywebpush import WebPushException, webpush
+
+        try:
+            webpush(
+                subscription_info={
+                    'endpoint': inscricao.endpoint,
+                    'keys': {'p256dh': inscricao.p256dh, 'auth': inscricao.auth},
+                },
+                data=json.dumps(mensagem),
+                vapid_private_key=self.chave_privada,
+                vapid_claims={'sub': self.contato},
+                ttl=24 * 60 * 60,
+            )
+        except WebPushException as exc:
+            if exc.response is not None and exc.response.status_code in (404, 410):
+                raise InscricaoExpirada(inscricao.endpoint)
+            raise
+
+
+class PushLocal:
+    """Serviço de push em memória: guarda ``(endpoint, mensagem)`` em ``enviadas``"""
+
+    enviadas = []
+    # Endpoints tratados como cancelados pelo navegador
+    expirados = set()
+
+    def disponivel(self):
+        return True
+
+    def enviar(self, inscricao, mensagem):
+        if inscricao.endpoint in self.expirados:
+            raise InscricaoExpirada(inscricao.endpoint)
+        self.enviadas.append((inscricao.endpoint, mensagem))
+
+
+def obter_envio():
+    """Instancia o backend de envio configurado"""
+    return import_string(getattr(settings, 'PUSH_BACKEND', 'estoque.alertas.WebPush'))()
+
+
+def registrar_alertas(movimentacoes):
+    """Grava os alertas das movimentações que cruzaram o mínimo e agenda o envio"""
+    candidatas = {}
+    for movimentacao in movimentacoes:
+        # Só saídas e ajustes para baixo podem cruzar o mínimo
+        if movimentacao.quantidade_atual < movimentacao.quantidade_anterior:
+            candidatas.setdefault(movimentacao.produto_id, []).append(movimentacao)
+    if not candidatas:
+        return []
+
+    ids = list(candidatas)
+    minimos = {}
+    for inicio in range(0, len(ids), TAMANHO_BLOCO):
+        minimos.update(Produto.objects.filter(
+            pk__in=ids[inicio:inicio + TAMANHO_BLOCO], ativo=True
+        ).values_list('id', 'quantidade_minima'))
+
+    alertas = []
+    for produto_id, minimo in minimos.items():
+        for movimentacao in candidatas[produto_id]:
+            if movimentacao.quantidade_anterior > minimo >= movimentacao.quantidade_atual:
+                alertas.append(AlertaEstoque(
+                    produto_id=produto_id,
+                    movimentacao_id=movimentacao.pk,
+                    quantidade=movimentacao.quantidade_atual,
+                    quantidade_minima=minimo,
+                ))
+                break
+    if not alertas:
+        return []
+
+    repeticao = timezone.now() - timedelta(hours=getattr(settings, 'ALERTAS_REPETICAO_HORAS', 12))
+    produtos = [alerta.produto_id for alerta in alertas]
+    recentes = set()
+    for inicio in range(0, len(produtos), TAMANHO_BLOCO):
+        recentes.update(AlertaEstoque.objects.filter(
+            Q(enviado_em__isnull=True) | Q(criado_em__gte=repeticao),
+            produto_id__in=produtos[inicio:inicio + TAMANHO_BLOCO],
+        ).values_list('produto_id', flat=True))
+    alertas = AlertaEstoque.objects.bulk_create(
+        [alerta for alerta in alertas if alerta.produto_id not in recentes]
+    )
+
+    if alertas and not Tarefa.objects.filter(nome='enviar_alertas', status='PENDENTE').exists():
+        intervalo = getattr(settings, 'ALERTAS_INTERVALO_SEGUNDOS', 300)
+        enfileirar('enviar_alertas', atraso=timedelta(seconds=intervalo))
+    return alertas
+
+
+def montar_resumo(alertas, total):
+    """Notificação única com os primeiros ``alertas`` pendentes e o ``total`` deles"""
+    nomes = [
+        f'{alerta.produto.nome} ({alerta.quantidade.normalize():f} {alerta.produto.unidade_medida})'
+        for alerta in alertas[:PRODUTOS_NO_RESUMO]
+    ]
+    if total > len(nomes):
+        nomes.append(f'e mais {total - len(nomes)}')
+    return {
+        'titulo': 'Estoque baixo' if total == 1 else f'{total} produtos com estoque baixo',
+        'corpo': ', '.join(nomes),
+        'url': reverse('estoque:estoque_baixo'),
+        'tag': 'estoque-baixo',
+    }
+
+
+def enviar_resumo():
+    """
+    Envia os alertas pendentes em uma notificação para cada inscrição.
+
+    Inscrições canceladas pelo navegador são removidas. Retorna o número de
+    notificações entregues ao serviço de push.
+    """
+    pendentes = AlertaEstoque.objects.filter(enviado_em__isnull=True)
+    resumo = pendentes.aggregate(total=Count('id'), ultimo=Max('id'))
+    if not resumo['total']:
+        return 0
+
+    envio = obter_envio()
+    entregues = 0
+    if envio.disponivel():
+        primeiros = list(pendentes.select_related('produto').order_by('criado_em', 'id')[:PRODUTOS_NO_RESUMO])
+        mensagem = montar_resumo(primeiros, resumo['total'])
+        for inscricao in InscricaoPush.objects.filter(usuario__is_active=True).iterator():
+            try:
+                envio.enviar(inscricao, mensagem)
+            except InscricaoExpirada:
+                inscricao.delete()
+            except Exception:
+                # Um navegador fora do ar não impede os demais
+                logger.exception('Falha no envio de push para %s', inscricao.endpoint)
+            else:
+                entregues += 1
+
+    # Alertas criados durante o envio ficam para o próximo resumo
+    pendentes.filter(pk__lte=resumo['ultimo']).update(enviado_em=timezone.now())
+    return entregues
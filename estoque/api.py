@@ -0,0 +1,283 @@
+"""
+API JSON (v1): produtos, categorias, fornecedores e movimentações
+
+Leitura de todos os recursos e criação de movimentações. As linhas são
+lidas com ``values()`` (sem instanciar modelos) e as listas usam a mesma
+paginação por cursor e os mesmos filtros das páginas HTML, então cada
+chamada custa uma consulta além da sessão.
+
+Parâmetros comuns das listas:
+
+- ``fields``: campos separados por vírgula (padrão: todos);
+- ``limite``: registros por página (até ``MAXIMO_POR_PAGINA``);
+- ``cursor``: vem pronto em ``proxima`` e ``anterior`` da resposta; um
+  cursor adulterado ou de outra ``ordem`` responde 400.
+
+Produtos aceitam ``search``, ``categoria``, ``fornecedor``, ``estoque_baixo``
+e ``ordem`` como em ``/produtos/``; movimentações aceitam ``produto``,
+``tipo``, ``data_inicio`` e ``data_fim`` como em ``/movimentacoes/`` (ver
+estoque/filtros.py). Um filtro fora do formato responde 400.
+
+``POST /api/v1/movimentacoes/`` registra uma entrada ou saída (objeto com
+``produto``, ``tipo``, ``quantidade``, ``motivo``, ``documento`` e
+``observacao``) ou um lote (``{"itens": [...]}``) pela mesma função das
+movimentações em lote. Com o cabeçalho ``Idempotency-Key`` a requisição é
+processada uma única vez e as repetições recebem a resposta guardada, com
+``Idempotent-Replayed: true``. A autenticação é a sessão do sistema, com o
+token CSRF no cabeçalho ``X-CSRFToken``.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from .filtros import FiltroInvalido, filtrar_movimentacoes, filtrar_produtos
+from .idempotencia import TAMANHO_MAXIMO_CHAVE, ChaveReutilizada, processar_uma_vez
+from .models import Categoria, Fornecedor, MovimentacaoEstoque, Produto
+from .paginacao import CursorInvalido, paginar_por_cursor
+from .services import registrar_movimentacoes_em_lote
+
+
+POR_PAGINA = 50
+MAXIMO_POR_PAGINA = 500
+
+# Separa as chaves da API das chaves da fila offline do mesmo usuário
+PREFIXO_CHAVE = 'api:'
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro da requisição fora do formato aceito"""
+
+
+def _url_imagem(caminho):
+    return Produto._meta.get_field('imagem').storage.url(caminho) if caminho else None
+
+
+class Recurso:
+    """
+    Campos públicos de um modelo.
+
+    ``campos`` mapeia o nome na API para o caminho do ORM lido com
+    ``values()``; ``conversoes`` transforma valores que não saem prontos do
+    banco (ex.: caminho da imagem em URL).
+    """
+
+    def __init__(self, campos, conversoes=None):
+        self.campos = campos
+        self.conversoes = conversoes or {}
+
+    def selecionar(self, params):
+        """Nomes pedidos em ``fields``, na ordem pedida e sem repetição"""
+        pedidos = [nome.strip() for nome in params.get('fields', '').split(',') if nome.strip()]
+        if not pedidos:
+            return list(self.campos)
+        invalidos = [nome for nome in pedidos if nome not in self.campos]
+        if invalidos:
+            raise ParametroInvalido(
+                f'Campos inválidos: {", ".join(invalidos)}. Disponíveis: {", ".join(self.campos)}.'
+            )
+        return list(dict.fromkeys(pedidos))
+
+    def colunas(self, nomes, extras=()):
+        return list(dict.fromkeys([self.campos[nome] for nome in nomes] + list(extras)))
+
+    def serializar(self, linha, nomes):
+        dados = {}
+        for nome in nomes:
+            valor = linha[self.campos[nome]]
+            if nome in self.conversoes:
+                valor = self.conversoes[nome](valor)
+            dados[nome] = valor
+        return dados
+
+
+PRODUTO = Recurso(
+    {
+        'id': 'id',
+        'codigo': 'codigo',
+        'nome': 'nome',
+        'descricao': 'descricao',
+        'categoria': 'categoria_id',
+        'categoria_nome': 'categoria__nome',
+        'fornecedor': 'fornecedor_id',
+        'fornecedor_nome': 'fornecedor__nome',
+        'quantidade_atual': 'quantidade_atual',
+        'quantidade_minima': 'quantidade_minima',
+        'preco_custo': 'preco_custo',
+        'preco_venda': 'preco_venda',
+        'unidade_medida': 'unidade_medida',
+        'localizacao': 'localizacao',
+        'qr_code': 'qr_code',
+        'imagem': 'imagem',
+        'criado_em': 'criado_em',
+        'atualizado_em': 'atualizado_em',
+    },
+    conversoes={'imagem': _url_imagem},
+)
+
+CATEGORIA = Recurso({
+    'id': 'id',
+    'nome': 'nome',
+    'descricao': 'descricao',
+    'criado_em': 'criado_em',
+})
+
+FORNECEDOR = Recurso({
+    'id': 'id',
+    'nome': 'nome',
+    'cnpj': 'cnpj',
+    'telefone': 'telefone',
+    'email': 'email',
+    'endereco': 'endereco',
+    'criado_em': 'criado_em',
+})
+
+MOVIMENTACAO = Recurso({
+    'id': 'id',
+    'produto': 'produto_id',
+    'produto_codigo': 'produto__codigo',
+    'produto_nome': 'produto__nome',
+    'tipo': 'tipo',
+    'quantidade': 'quantidade',
+    'quantidade_anterior': 'quantidade_anterior',
+    'quantidade_atual': 'quantidade_atual',
+    'motivo': 'motivo',
+    'observacao': 'observacao',
+    'documento': 'documento',
+    'usuario': 'usuario__username',
+    'data_movimentacao': 'data_movimentacao',
+    'criado_em': 'criado_em',
+})
+
+
+def _api(*metodos):
+    """Requisição autenticada com um dos métodos; parâmetros inválidos viram 400 em JSON"""
+    def decorador(view):
+        @require_http_methods(metodos or ['GET'])
+        @wraps(view)
+        def envoltorio(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+            try:
+                return view(request, *args, **kwargs)
+            except (ParametroInvalido, FiltroInvalido, CursorInvalido) as exc:
+                return JsonResponse({'erro': str(exc)}, status=400)
+        return envoltorio
+    return decorador
+
+
+def _por_pagina(params):
+    try:
+        por_pagina = int(params.get('limite', POR_PAGINA))
+    except ValueError:
+        raise ParametroInvalido('"limite" deve ser um número inteiro.')
+    return max(1, min(por_pagina, MAXIMO_POR_PAGINA))
+
+
+def _listar(request, recurso, queryset, ordenacao):
+    nomes = recurso.selecionar(request.GET)
+    por_pagina = _por_pagina(request.GET)
+
+    # As colunas da ordenação entram na consulta para gerar o cursor
+    colunas = recurso.colunas(nomes, [ordem.lstrip('-') for ordem in ordenacao])
+    pagina = paginar_por_cursor(queryset.values(*colunas), ordenacao, request.GET, por_pagina, estrito=True)
+
+    def url(consulta):
+        return request.build_absolute_uri(f'{request.path}{consulta}') if consulta else None
+
+    return JsonResponse({
+        'resultados': [recurso.serializar(linha, nomes) for linha in pagina],
+        'proxima': url(pagina.url_proxima),
+        'anterior': url(pagina.url_anterior),
+    })
+
+
+def _detalhar(request, recurso, queryset, pk):
+    nomes = recurso.selecionar(request.GET)
+    linha = queryset.filter(pk=pk).values(*recurso.colunas(nomes)).first()
+    if linha is None:
+        return JsonResponse({'erro': 'Registro não encontrado.'}, status=404)
+    return JsonResponse(recurso.serializar(linha, nomes))
+
+
+@_api()
+def produto_list(request):
+    produtos, _ = filtrar_produtos(request.GET)
+    return _listar(request, PRODUTO, produtos, produtos.query.order_by)
+
+
+@_api()
+def produto_detail(request, pk):
+    return _detalhar(request, PRODUTO, Produto.objects.filter(ativo=True), pk)
+
+
+@_api()
+def categoria_list(request):
+    return _listar(request, CATEGORIA, Categoria.objects.all(), ['nome', 'id'])
+
+
+@_api()
+def fornecedor_list(request):
+    return _listar(request, FORNECEDOR, Fornecedor.objects.filter(ativo=True), ['nome', 'id'])
+
+
+@_api('GET', 'POST')
+def movimentacao_list(request):
+    if request.method == 'POST':
+        return _criar_movimentacoes(request)
+    movimentacoes, _ = filtrar_movimentacoes(request.GET)
+    return _listar(request, MOVIMENTACAO, movimentacoes, movimentacoes.query.order_by)
+
+
+def _criar_movimentacoes(request):
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        raise ParametroInvalido('JSON inválido.')
+
+    lote = isinstance(dados, dict) and 'itens' in dados
+    itens = dados['itens'] if lote else [dados]
+    if not isinstance(itens, list):
+        raise ParametroInvalido('"itens" deve ser uma lista.')
+
+    def registrar():
+        resultados = registrar_movimentacoes_em_lote(itens, request.user)
+        if lote:
+            aplicadas = sum(1 for resultado in resultados if resultado['status'] == 'ok')
+            return {'status': 200, 'corpo': {
+                'aplicadas': aplicadas,
+                'rejeitadas': len(resultados) - aplicadas,
+                'resultados': resultados,
+            }}
+        resultado = resultados[0]
+        del resultado['linha']
+        return {'status': 201 if resultado['status'] == 'ok' else 400, 'corpo': resultado}
+
+    chave = request.headers.get('Idempotency-Key')
+    if chave is not None and not 0 < len(chave) <= TAMANHO_MAXIMO_CHAVE - len(PREFIXO_CHAVE):
+        raise ParametroInvalido('Idempotency-Key vazia ou longa demais.')
+
+    try:
+        if chave is None:
+            resposta, repetida = registrar(), False
+        else:
+            resposta, repetida = processar_uma_vez(
+                request.user, PREFIXO_CHAVE + chave, hashlib.sha256(request.body).hexdigest(), registrar
+            )
+    except ChaveReutilizada as exc:
+        return JsonResponse({'erro': str(exc)}, status=422)
+    except ValueError as exc:
+        # Lote acima do limite: nada é gravado, nem a chave
+        return JsonResponse({'erro': str(exc)}, status=400)
+
+    resposta_http = JsonResponse(resposta['corpo'], status=resposta['status'])
+    if repetida:
+        resposta_http['Idempotent-Replayed'] = 'true'
+    return resposta_http
+
+
+@_api()
+def movimentacao_detail(request, pk):
+    return _detalhar(request, MOVIMENTACAO, MovimentacaoEstoque.objects.all(), pk)
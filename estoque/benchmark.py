@@ -0,0 +1,189 @@
+"""
+Benchmark das views mais usadas, executadas pelo cliente de teste do Django
+
+Cada cenário é uma requisição real (URLs, middlewares, templates) medida
+em número de consultas, latência p50/p95 e pico de memória alocada. Os
+parâmetros das requisições são sorteados com uma semente fixa, então dois
+commits medidos sobre o mesmo banco executam exatamente as mesmas
+requisições e os resultados podem ser comparados.
+"""
+import json
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import MovimentacaoEstoque, Produto
+from .paginacao import gerar_cursor
+
+
+def percentil(valores, p):
+    """Percentil pelo método do vizinho mais próximo"""
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class Benchmark:
+    """Sorteia as requisições de cada cenário e mede a execução"""
+
+    def __init__(self, semente=42):
+        self.aleatorio = random.Random(semente)
+        self.cliente = Client()
+        usuario, _ = User.objects.get_or_create(username='benchmark')
+        self.cliente.force_login(usuario)
+
+        ultimo = Produto.objects.filter(ativo=True).order_by('-pk').values_list('pk', flat=True).first()
+        if ultimo is None:
+            raise ValueError('Nenhum produto ativo cadastrado.')
+        self.produtos = list(Produto.objects.filter(
+            ativo=True, pk__in=[self.aleatorio.randint(1, ultimo) for _ in range(400)]
+        ).order_by('pk').values('pk', 'codigo', 'nome', 'qr_code')[:200])
+
+    def _produto(self):
+        return self.aleatorio.choice(self.produtos)
+
+    def _termo(self):
+        produto = self._produto()
+        if self.aleatorio.random() < 0.5:
+            return produto['codigo'][:max(2, len(produto['codigo']) - 2)]
+        return produto['nome'].split()[0]
+
+    def _cursor_pagina_2(self):
+        ordenacao = ['-data_movimentacao', '-id']
+        ultima_da_primeira = MovimentacaoEstoque.objects.order_by(*ordenacao)[29]
+        return gerar_cursor(ultima_da_primeira, ordenacao, 'proxima')
+
+    # Cenários: cada um devolve (método, url, dados) da próxima requisição
+
+    def dashboard(self):
+        return 'get', reverse('estoque:dashboard'), None
+
+    def dashboard_sem_cache(self):
+        cache.clear()
+        return 'get', reverse('estoque:dashboard'), None
+
+    def produto_list(self):
+        return 'get', reverse('estoque:produto_list'), None
+
+    def produto_list_busca(self):
+        return 'get', reverse('estoque:produto_list'), {'search': self._termo()}
+
+    def buscar_produtos_htmx(self):
+        return 'get', reverse('estoque:buscar_produtos_htmx'), {'search': self._termo()}
+
+    def buscar_qr(self):
+        return 'post', reverse('estoque:buscar_qr'), {'qr_code': self._produto()['qr_code']}
+
+    def movimentacao_list(self):
+        return 'get', reverse('estoque:movimentacao_list'), None
+
+    def movimentacao_list_pagina_2(self):
+        return 'get', reverse('estoque:movimentacao_list'), {'cursor': self._cursor_pagina_2()}
+
+    def giro_estoque(self):
+        return 'get', reverse('estoque:giro_estoque'), {'dias': 365}
+
+    def entrada_estoque(self):
+        # Entradas e saídas de 1 unidade se compensam entre as repetições
+        url = reverse('estoque:entrada_estoque', args=[self._produto()['pk']])
+        return 'post', url, {'quantidade': '1', 'motivo': 'Benchmark'}
+
+    def saida_estoque(self):
+        url = reverse('estoque:saida_estoque', args=[self._produto()['pk']])
+        return 'post', url, {'quantidade': '1', 'motivo': 'Benchmark'}
+
+    def movimentacao_lote(self):
+        itens = [
+            {'produto': produto['codigo'], 'tipo': tipo, 'quantidade': '1', 'motivo': 'Benchmark'}
+            for produto in self.aleatorio.sample(self.produtos, min(10, len(self.produtos)))
+            for tipo in ('ENTRADA', 'SAIDA')
+        ]
+        return 'post', reverse('estoque:movimentacao_lote'), json.dumps({'itens': itens})
+
+    CENARIOS = [
+        'dashboard', 'dashboard_sem_cache', 'produto_list', 'produto_list_busca',
+        'buscar_produtos_htmx', 'buscar_qr', 'movimentacao_list', 'movimentacao_list_pagina_2',
+        'giro_estoque', 'entrada_estoque', 'saida_estoque', 'movimentacao_lote',
+    ]
+
+    def _requisitar(self, metodo, url, dados):
+        if metodo == 'get':
+            return self.cliente.get(url, dados, secure=True)
+        if isinstance(dados, str):
+            return self.cliente.post(url, dados, content_type='application/json', secure=True)
+        return self.cliente.post(url, dados, secure=True)
+
+    def medir(self, cenario, repeticoes=30, aquecimento=3):
+        preparar = getattr(self, cenario)
+        tempos, consultas = [], []
+
+        for indice in range(aquecimento + repeticoes):
+            requisicao = preparar()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                resposta = self._requisitar(*requisicao)
+                duracao = time.perf_counter() - inicio
+            if resposta.status_code >= 400:
+                raise RuntimeError(f'{cenario}: HTTP {resposta.status_code} em {requisicao[1]}')
+            if indice >= aquecimento:
+                tempos.append(duracao)
+                consultas.append(len(capturadas))
+
+        # Memória medida à parte: o tracemalloc deixa as requisições mais lentas
+        requisicao = preparar()
+        tracemalloc.start()
+        self._requisitar(*requisicao)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'consultas': max(consultas),
+            'p50_ms': round(percentil(tempos, 50) * 1000, 2),
+            'p95_ms': round(percentil(tempos, 95) * 1000, 2),
+            'max_ms': round(max(tempos) * 1000, 2),
+            'memoria_kb': round(pico / 1024),
+        }
+
+    def executar(self, cenarios=None, repeticoes=30, aquecimento=3):
+        # O cliente de teste usa o host "testserver" e, com DEBUG desligado,
+        # as requisições seguras evitam o redirecionamento para HTTPS
+        with override_settings(ALLOWED_HOSTS=['*']):
+            return {
+                cenario: self.medir(cenario, repeticoes, aquecimento)
+                for cenario in cenarios or self.CENARIOS
+            }
+
+
+def comparar(atual, anterior, tolerancia=0.25):
+    """
+    Linhas ``(cenario, metrica, anterior, atual, variacao, piorou)`` para os
+    cenários presentes nos dois resultados.
+
+    Uma consulta a mais sempre conta como piora; p50 e memória pioram acima
+    da ``tolerancia`` (25%). O p95 é instável com poucas repetições e só é
+    exibido, e diferenças de latência abaixo de 1 ms são ignoradas.
+    """
+    linhas = []
+    for cenario, metricas in atual.items():
+        if cenario not in anterior:
+            continue
+        for metrica in ('consultas', 'p50_ms', 'p95_ms', 'memoria_kb'):
+            antes, depois = anterior[cenario][metrica], metricas[metrica]
+            variacao = (depois - antes) / antes if antes else 0
+            if metrica == 'consultas':
+                piorou = depois > antes
+            elif metrica == 'p50_ms':
+                piorou = variacao > tolerancia and depois - antes > 1
+            elif metrica == 'memoria_kb':
+                piorou = variacao > tolerancia
+            else:
+                piorou = False
+            linhas.append((cenario, metrica, antes, depois, variacao, piorou))
+    return linhas
@@ -0,0 +1,158 @@
+"""
+Backends de busca de produtos
+
+O backend é escolhido pela setting ``ESTOQUE_BUSCA_BACKEND`` (caminho da
+classe) ou, se ela não existir, pelo banco em uso: trigramas no PostgreSQL,
+FTS5 no SQLite e ``icontains`` nos demais.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Produto
+
+
+class BuscaSimples:
+    """Busca por substring com icontains (lê a tabela inteira)"""
+
+    def filtrar(self, produtos, termo):
+        """Restringe o queryset aos produtos que casam com o termo"""
+        return produtos.filter(
+            Q(nome__icontains=termo) |
+            Q(codigo__icontains=termo) |
+            Q(qr_code__icontains=termo)
+        )
+
+    def ranquear(self, produtos, termo):
+        """Como ``filtrar``, ordenando pelos resultados mais relevantes"""
+        return self.filtrar(produtos, termo)
+
+    def indexar(self, produtos):
+        """Atualiza o índice de busca dos produtos informados"""
+
+    def remover(self, ids):
+        """Remove produtos do índice de busca"""
+
+    def reindexar(self):
+        """Reconstrói o índice de busca a partir da tabela de produtos"""
+
+
+class BuscaPostgres(BuscaSimples):
+    """
+    pg_trgm: substring no nome e prefixo no código usam os índices GIN de
+    trigramas sobre ``UPPER(coluna)``; o QR code é comparado por igualdade.
+    """
+
+    def filtrar(self, produtos, termo):
+        return produtos.filter(
+            Q(nome__icontains=termo) |
+            Q(codigo__istartswith=termo) |
+            Q(qr_code=termo)
+        )
+
+    def ranquear(self, produtos, termo):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        return self.filtrar(produtos, termo).annotate(
+            relevancia=TrigramSimilarity('nome', termo) + Case(
+                When(Q(codigo__istartswith=termo) | Q(qr_code=termo), then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        ).order_by('-relevancia', 'nome')
+
+
+class BuscaSQLite(BuscaSimples):
+    """
+    FTS5: tabela ``estoque_produto_fts`` com rowid igual ao id do produto,
+    mantida pelos signals de ``Produto``. Cada palavra do termo é buscada
+    como prefixo, sem acentos, em código, nome, QR code e descrição.
+    """
+
+    TABELA = 'estoque_produto_fts'
+    COLUNAS = ('codigo', 'nome', 'qr_code', 'descricao')
+    # Pesos do bm25 na ordem das colunas
+    PESOS = '10.0, 5.0, 10.0, 1.0'
+
+    def _expressao(self, termo):
+        return ' '.join(f'"{palavra}"*' for palavra in re.findall(r'\w+', termo))
+
+    def filtrar(self, produtos, termo):
+        expressao = self._expressao(termo)
+        if not expressao:
+            return super().filtrar(produtos, termo)
+        return produtos.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {self.TABELA} WHERE {self.TABELA} MATCH %s', [expressao]
+        ))
+
+    def ranquear(self, produtos, termo):
+        expressao = self._expressao(termo)
+        if not expressao:
+            return super().ranquear(produtos, termo)
+        # bm25() só existe na consulta que faz o MATCH: subconsulta pelo rowid
+        # de cada produto já filtrado
+        relevancia = RawSQL(
+            f'SELECT -bm25({self.TABELA}, {self.PESOS}) FROM {self.TABELA} '
+            f'WHERE {self.TABELA} MATCH %s AND {self.TABELA}.rowid = {Produto._meta.db_table}.id',
+            [expressao],
+            output_field=FloatField(),
+        )
+        return self.filtrar(produtos, termo).annotate(relevancia=relevancia).order_by('-relevancia', 'nome')
+
+    def indexar(self, produtos):
+        linhas = [
+            (p.pk, p.codigo, p.nome, p.qr_code or '', p.descricao or '')
+            for p in produtos
+        ]
+        if not linhas:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.TABELA} WHERE rowid = %s', [(linha[0],) for linha in linhas]
+            )
+            cursor.executemany(
+                f'INSERT INTO {self.TABELA} (rowid, {", ".join(self.COLUNAS)}) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                linhas,
+            )
+
+    def remover(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.TABELA} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def reindexar(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABELA}')
+            cursor.execute(
+                f'INSERT INTO {self.TABELA} (rowid, {", ".join(self.COLUNAS)}) '
+                f"SELECT id, codigo, nome, COALESCE(qr_code, ''), COALESCE(descricao, '') "
+                f'FROM {Produto._meta.db_table}'
+            )
+
+
+BACKENDS_POR_BANCO = {
+    'postgresql': BuscaPostgres,
+    'sqlite': BuscaSQLite,
+}
+
+
+def obter_backend():
+    """Instancia o backend configurado ou o adequado ao banco em uso"""
+    caminho = getattr(settings, 'ESTOQUE_BUSCA_BACKEND', None)
+    if caminho:
+        return import_string(caminho)()
+    return BACKENDS_POR_BANCO.get(connection.vendor, BuscaSimples)()
+
+
+def buscar_produtos(produtos, termo):
+    """Filtra o queryset pelo termo de busca, sem alterar a ordenação"""
+    return obter_backend().filtrar(produtos, termo)
+
+
+def ranquear_produtos(produtos, termo):
+    """Filtra o queryset pelo termo e ordena por relevância"""
+    return obter_backend().ranquear(produtos, termo)
@@ -0,0 +1,82 @@
+"""
+Validadores para GET condicional (``ETag`` / ``Last-Modified``)
+
+Usados com ``django.views.decorators.http.condition``: quando o navegador
+ou o Service Worker reenviam a ``ETag`` recebida e nada mudou, a view
+responde ``304 Not Modified`` sem executar consultas de listagem nem
+renderizar templates.
+
+Os dados entram na ETag por uma única consulta indexada: o
+``atualizado_em`` mais recente dos produtos e o maior id de movimentação
+(toda movimentação atualiza também o produto). Alterações em categorias e
+fornecedores não mudam a ETag. A ETag também muda com a sessão, o token
+CSRF (formulários da página em cache) e o cabeçalho ``HX-Request``, e não é
+gerada quando há mensagens pendentes, que precisam ser exibidas.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Subquery
+
+from .models import MovimentacaoEstoque, Produto
+
+
+def _variante(request):
+    """Partes da ETag que não dependem dos dados, ou None se houver mensagens"""
+    if len(messages.get_messages(request)):
+        return None
+    return [
+        # Cookies em vez da sessão: não custam consulta ao banco
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        request.headers.get('HX-Request', ''),
+    ]
+
+
+def _etag(partes):
+    return hashlib.md5('|'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+
+def ultima_alteracao_estoque():
+    """``(atualizado_em mais recente dos produtos, id da última movimentação)``"""
+    ultima_movimentacao = MovimentacaoEstoque.objects.order_by('-id').values('id')[:1]
+    return Produto.objects.order_by('-atualizado_em').annotate(
+        ultima_movimentacao=Subquery(ultima_movimentacao)
+    ).values_list('atualizado_em', 'ultima_movimentacao').first() or (None, None)
+
+
+def etag_estoque(request, *args, **kwargs):
+    """ETag das páginas que dependem do catálogo inteiro (lista, dashboard)"""
+    variante = _variante(request)
+    if variante is None:
+        return None
+    atualizado_em, ultima_movimentacao = ultima_alteracao_estoque()
+    return _etag(variante + [
+        atualizado_em.isoformat() if atualizado_em else '', ultima_movimentacao or 0
+    ])
+
+
+def _atualizacao_produto(request, pk):
+    # Guardado na requisição: ETag e Last-Modified saem da mesma consulta
+    cache = request.__dict__.setdefault('_atualizacao_produto', {})
+    if pk not in cache:
+        cache[pk] = Produto.objects.filter(pk=pk, ativo=True).values_list(
+            'atualizado_em', flat=True
+        ).first()
+    return cache[pk]
+
+
+def etag_produto(request, pk):
+    """ETag das páginas de um produto"""
+    variante = _variante(request)
+    atualizado_em = _atualizacao_produto(request, pk)
+    if variante is None or atualizado_em is None:
+        return None
+    return _etag(variante + [pk, atualizado_em.isoformat()])
+
+
+def ultima_modificacao_produto(request, pk):
+    if _variante(request) is None:
+        return None
+    return _atualizacao_produto(request, pk)
@@ -0,0 +1,177 @@
+"""
+Geração de dados sintéticos em lote para testes de carga e benchmarks
+"""
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import Categoria, Fornecedor, Produto, MovimentacaoEstoque, gerar_qr_code
+
+
+PALAVRAS = [
+    'Mouse', 'Teclado', 'Monitor', 'Cabo', 'Parafuso', 'Martelo', 'Chave',
+    'Papel', 'Caneta', 'Detergente', 'Sabão', 'Lâmpada', 'Fita', 'Tomada',
+    'Adaptador', 'Bateria', 'Pilha', 'Luva', 'Óculos', 'Filtro',
+]
+
+ADJETIVOS = [
+    'Óptico', 'USB', 'Elétrico', 'Inox', 'Reforçado', 'Branco', 'Preto',
+    'Industrial', 'Compacto', 'Profissional',
+]
+
+
+def gerar_produtos(total, lote=5000, prefixo=None):
+    """Insere ``total`` produtos sintéticos e devolve o prefixo usado nos códigos"""
+    prefixo = prefixo or uuid.uuid4().hex[:6].upper()
+    categoria, _ = Categoria.objects.get_or_create(nome='Carga Sintética')
+
+    for inicio in range(0, total, lote):
+        Produto.objects.bulk_create([
+            Produto(
+                codigo=f'{prefixo}-{i}',
+                nome=f'{PALAVRAS[i % len(PALAVRAS)]} {ADJETIVOS[i // len(PALAVRAS) % len(ADJETIVOS)]} {i}',
+                categoria=categoria,
+                quantidade_atual=Decimal(i % 100),
+                quantidade_minima=Decimal(10),
+                preco_custo=Decimal(i % 50 + 1),
+                preco_venda=Decimal(i % 50 + 2),
+                qr_code=f'PROD-{prefixo}-{i}',
+                ativo=i % 20 != 0,
+            )
+            for i in range(inicio, min(inicio + lote, total))
+        ])
+
+    return prefixo
+
+
+def gerar_movimentacoes(produtos, lote=5000):
+    """Insere uma movimentação para cada produto do queryset informado"""
+    usuario, _ = User.objects.get_or_create(username='carga_sintetica')
+    agora = timezone.now()
+    movimentacoes = []
+
+    for indice, produto in enumerate(produtos.only('id', 'quantidade_atual').iterator(chunk_size=lote)):
+        movimentacoes.append(MovimentacaoEstoque(
+            produto=produto,
+            tipo=('ENTRADA', 'SAIDA', 'AJUSTE')[indice % 3],
+            quantidade=Decimal(1),
+            quantidade_anterior=produto.quantidade_atual,
+            quantidade_atual=produto.quantidade_atual,
+            motivo='Carga sintética',
+            usuario=usuario,
+            data_movimentacao=agora - timedelta(minutes=indice),
+        ))
+        if len(movimentacoes) >= lote:
+            MovimentacaoEstoque.objects.bulk_create(movimentacoes)
+            movimentacoes = []
+
+    MovimentacaoEstoque.objects.bulk_create(movimentacoes)
+
+
+MOTIVOS = {
+    'ENTRADA': ['Compra', 'Devolução de cliente', 'Transferência recebida'],
+    'SAIDA': ['Venda', 'Consumo interno', 'Perda', 'Transferência enviada'],
+    'AJUSTE': ['Inventário'],
+}
+
+
+def gerar_catalogo(categorias=10, fornecedores=20, produtos=1000, movimentacoes=10000,
+                   dias=90, semente=42, lote=5000, prefixo=None):
+    """
+    Cria um catálogo completo com histórico de movimentações coerente.
+
+    Com a mesma ``semente`` os nomes, preços, quantidades e a sequência de
+    movimentações se repetem, para que benchmarks de commits diferentes
+    rodem sobre dados equivalentes. O estoque de cada produto é o saldo da
+    sua última movimentação. Retorna o prefixo usado nos códigos.
+    """
+    aleatorio = random.Random(semente)
+    prefixo = prefixo or uuid.uuid4().hex[:6].upper()
+    usuario, _ = User.objects.get_or_create(username='carga_sintetica')
+
+    Categoria.objects.bulk_create(
+        [Categoria(nome=f'{prefixo} Categoria {i}') for i in range(categorias)]
+    )
+    Fornecedor.objects.bulk_create(
+        [Fornecedor(nome=f'{prefixo} Fornecedor {i}') for i in range(fornecedores)]
+    )
+    ids_categorias = list(Categoria.objects.filter(
+        nome__startswith=f'{prefixo} Categoria '
+    ).values_list('pk', flat=True))
+    ids_fornecedores = list(Fornecedor.objects.filter(
+        nome__startswith=f'{prefixo} Fornecedor '
+    ).values_list('pk', flat=True)) or [None]
+
+    # Estoque inicial de cada produto, antes da primeira movimentação gerada
+    saldos = {}
+    for inicio in range(0, produtos, lote):
+        novos = []
+        for i in range(inicio, min(inicio + lote, produtos)):
+            codigo = f'{prefixo}-{i}'
+            custo = Decimal(aleatorio.randint(100, 50000)) / 100
+            saldos[codigo] = Decimal(aleatorio.randint(0, 200))
+            novos.append(Produto(
+                codigo=codigo,
+                nome=f'{aleatorio.choice(PALAVRAS)} {aleatorio.choice(ADJETIVOS)} {i}',
+                categoria_id=aleatorio.choice(ids_categorias),
+                fornecedor_id=aleatorio.choice(ids_fornecedores),
+                quantidade_atual=saldos[codigo],
+                quantidade_minima=Decimal(aleatorio.choice([0, 5, 10, 20])),
+                preco_custo=custo,
+                preco_venda=(custo * Decimal(aleatorio.uniform(1.1, 2.0))).quantize(Decimal('0.01')),
+                qr_code=gerar_qr_code(codigo),
+                ativo=aleatorio.random() > 0.05,
+            ))
+        Produto.objects.bulk_create(novos)
+
+    ids_produtos = dict(Produto.objects.filter(
+        codigo__startswith=f'{prefixo}-'
+    ).values_list('codigo', 'pk'))
+    codigos = sorted(ids_produtos, key=lambda codigo: int(codigo.rsplit('-', 1)[1]))
+
+    # Movimentações em ordem cronológica, do mais antigo até agora
+    agora = timezone.now()
+    intervalo = timedelta(days=dias) / max(movimentacoes, 1)
+    pendentes = []
+    for indice in range(movimentacoes):
+        codigo = aleatorio.choice(codigos) if codigos else None
+        if codigo is None:
+            break
+        anterior = saldos[codigo]
+        sorteio = aleatorio.random()
+        if sorteio < 0.05:
+            tipo, atual = 'AJUSTE', Decimal(aleatorio.randint(0, 200))
+            quantidade = abs(atual - anterior)
+        elif sorteio < 0.55 or anterior < 1:
+            tipo, quantidade = 'ENTRADA', Decimal(aleatorio.randint(1, 50))
+            atual = anterior + quantidade
+        else:
+            tipo, quantidade = 'SAIDA', Decimal(aleatorio.randint(1, int(min(anterior, 30))))
+            atual = anterior - quantidade
+        saldos[codigo] = atual
+        pendentes.append(MovimentacaoEstoque(
+            produto_id=ids_produtos[codigo],
+            tipo=tipo,
+            quantidade=quantidade,
+            quantidade_anterior=anterior,
+            quantidade_atual=atual,
+            motivo=aleatorio.choice(MOTIVOS[tipo]),
+            usuario=usuario,
+            data_movimentacao=agora - intervalo * (movimentacoes - indice),
+        ))
+        if len(pendentes) >= lote:
+            MovimentacaoEstoque.objects.bulk_create(pendentes)
+            pendentes = []
+    MovimentacaoEstoque.objects.bulk_create(pendentes)
+
+    # Saldo final de cada produto movimentado
+    atualizados = [
+        Produto(pk=ids_produtos[codigo], quantidade_atual=saldo) for codigo, saldo in saldos.items()
+    ]
+    Produto.objects.bulk_update(atualizados, ['quantidade_atual'], batch_size=lote)
+
+    return prefixo
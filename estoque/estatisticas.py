@@ -0,0 +1,126 @@
+"""
+Estatísticas do dashboard guardadas no cache do Django
+
+Os números são calculados em uma única agregação sobre ``Produto`` e ficam
+no cache até que um produto ou movimentação mude (ver ``signals.py``).
+As listas vão para o cache como dicionários só com os campos exibidos:
+instâncias levariam junto tudo o que carregam (o ``User`` do autor da
+movimentação, com o hash da senha).
+Com vários workers o cache precisa ser compartilhado (banco ou arquivo)
+para que a invalidação alcance todos; ``DASHBOARD_CACHE_TIMEOUT`` limita
+por quanto tempo um valor pode ficar desatualizado.
+
+Os contadores de acertos e falhas ficam no cache ``contadores``, na memória
+de cada processo: no cache em banco cada incremento custaria mais consultas
+que a própria leitura das estatísticas.
+"""
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models import Count, F, Q, Sum
+
+from .models import Produto, MovimentacaoEstoque
+
+
+CHAVE_DASHBOARD = 'estoque:dashboard'
+CHAVE_ACERTOS = 'estoque:dashboard:acertos'
+CHAVE_FALHAS = 'estoque:dashboard:falhas'
+
+TIPOS_MOVIMENTACAO = dict(MovimentacaoEstoque.TIPO_CHOICES)
+
+
+def calcular_estatisticas():
+    """Consulta o banco e monta o contexto do dashboard"""
+    estatisticas = Produto.objects.filter(ativo=True).aggregate(
+        total_produtos=Count('id'),
+        produtos_baixo_estoque=Count('id', filter=Q(abaixo_minimo=True)),
+        valor_total_estoque=Sum(F('quantidade_atual') * F('preco_custo')),
+    )
+    estatisticas['valor_total_estoque'] = estatisticas['valor_total_estoque'] or 0
+    estatisticas['total_movimentacoes'] = MovimentacaoEstoque.objects.count()
+
+    estatisticas['produtos_alerta'] = list(Produto.objects.filter(
+        ativo=True,
+        abaixo_minimo=True
+    ).values('nome', 'codigo', 'quantidade_atual', 'quantidade_minima', 'unidade_medida')[:5])
+    estatisticas['ultimas_movimentacoes'] = [
+        resumir_movimentacao(linha)
+        for linha in MovimentacaoEstoque.objects.order_by('-data_movimentacao').values(
+            'tipo', 'quantidade', 'motivo', 'data_movimentacao',
+            'produto__nome', 'produto__unidade_medida',
+            'usuario__username', 'usuario__first_name', 'usuario__last_name',
+        )[:10]
+    ]
+
+    return estatisticas
+
+
+def resumir_movimentacao(linha):
+    """
+    Campos de uma movimentação exibidos no dashboard, a partir de uma linha
+    de ``values()`` com os nomes de ``calcular_estatisticas``
+    """
+    nome_completo = f"{linha['usuario__first_name']} {linha['usuario__last_name']}".strip()
+    return {
+        'tipo': linha['tipo'],
+        'tipo_display': TIPOS_MOVIMENTACAO[linha['tipo']],
+        'quantidade': linha['quantidade'],
+        'motivo': linha['motivo'],
+        'data_movimentacao': linha['data_movimentacao'],
+        'produto_nome': linha['produto__nome'],
+        'unidade_medida': linha['produto__unidade_medida'],
+        'usuario': nome_completo or linha['usuario__username'],
+    }
+
+
+def resumo_de_instancia(movimentacao):
+    """O mesmo resumo para uma movimentação já carregada (com produto e usuário)"""
+    return resumir_movimentacao({
+        'tipo': movimentacao.tipo,
+        'quantidade': movimentacao.quantidade,
+        'motivo': movimentacao.motivo,
+        'data_movimentacao': movimentacao.data_movimentacao,
+        'produto__nome': movimentacao.produto.nome,
+        'produto__unidade_medida': movimentacao.produto.unidade_medida,
+        'usuario__username': movimentacao.usuario.username,
+        'usuario__first_name': movimentacao.usuario.first_name,
+        'usuario__last_name': movimentacao.usuario.last_name,
+    })
+
+
+def estatisticas_dashboard():
+    """Estatísticas do cache, recalculadas apenas quando ausentes"""
+    estatisticas = cache.get(CHAVE_DASHBOARD)
+    if estatisticas is None:
+        _contar(CHAVE_FALHAS)
+        estatisticas = calcular_estatisticas()
+        cache.set(CHAVE_DASHBOARD, estatisticas, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    else:
+        _contar(CHAVE_ACERTOS)
+    return estatisticas
+
+
+def invalidar_dashboard():
+    cache.delete(CHAVE_DASHBOARD)
+
+
+def contadores_cache():
+    """Acertos e falhas do cache do dashboard neste processo, desde o seu início"""
+    contadores = caches['contadores'].get_many([CHAVE_ACERTOS, CHAVE_FALHAS])
+    acertos = contadores.get(CHAVE_ACERTOS, 0)
+    falhas = contadores.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    return {
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': round(acertos / total, 4) if total else None,
+    }
+
+
+def _contar(chave):
+    # add() não sobrescreve um contador existente; incr() é atômico no locmem
+    contadores = caches['contadores']
+    contadores.add(chave, 0, None)
+    try:
+        contadores.incr(chave)
+    except ValueError:
+        contadores.set(chave, 1, None)
@@ -0,0 +1,318 @@
+"""
+Atualizações ao vivo do dashboard e das páginas de produto (Server-Sent Events)
+
+A view ``eventos`` mantém uma conexão aberta por navegador (extensão ``sse``
+do HTMX) e só funciona servida por ASGI; sob WSGI responde 204, que faz o
+``EventSource`` desistir, e a página continua estática. Os eventos levam o
+HTML pronto para a troca, renderizado uma vez para todas as conexões:
+
+- ``movimentacao``: item das últimas movimentações (dashboard) ou linha do
+  histórico (página do produto);
+- ``estoque``: quadro de estoque atual do produto;
+- ``estatisticas`` e ``alerta``: cartões de totais e lista de estoque baixo
+  do dashboard.
+
+``central`` distribui os eventos em memória para as conexões do processo.
+As movimentações chegam por dois caminhos:
+
+- ``publicar``, chamado pelo signal ``movimentacoes_registradas`` depois do
+  commit, entrega na hora as gravadas pelo próprio processo;
+- enquanto houver conexões abertas, o processo consulta o banco a cada
+  ``EVENTOS_CONSULTA_SEGUNDOS`` pelas movimentações com id maior que o
+  último visto, para pegar as gravadas por outros processos (outros workers
+  do servidor, ``processar_tarefas``, admin). É uma consulta por processo,
+  independente do número de navegadores; as já publicadas são ignoradas.
+  Com ``0`` a consulta é desligada (servidor de um único processo). Um
+  acúmulo maior que ``LIMITE_CONSULTA`` (fechamento de inventário,
+  importação) não é repassado: vira uma única atualização com as
+  movimentações mais recentes e o estoque atual dos produtos abertos.
+
+Produtos e usuários das movimentações são lidos numa consulta só, e os
+cartões do dashboard são recalculados no máximo uma vez a cada
+``EVENTOS_ESTATISTICAS_SEGUNDOS``, fora da requisição que gravou (``0``
+recalcula a cada publicação).
+"""
+import asyncio
+import copy
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connections
+from django.db.models import Max
+from django.template.loader import render_to_string
+
+from .estatisticas import estatisticas_dashboard, resumo_de_instancia
+from .models import MovimentacaoEstoque, Produto
+
+
+logger = logging.getLogger('estoque.eventos')
+
+# Eventos à espera de envio por conexão; um navegador lento perde os mais antigos
+TAMANHO_FILA = 100
+
+# Movimentações lidas por consulta ao banco; acima disso, uma atualização só
+LIMITE_CONSULTA = 200
+
+# Movimentações enviadas na atualização que substitui um acúmulo
+RECENTES_NA_ATUALIZACAO = 10
+
+# Campos dos produtos usados nos eventos
+CAMPOS_PRODUTO = ['id', 'nome', 'unidade_medida', 'quantidade_atual', 'quantidade_minima']
+
+# Ids publicados pelo processo lembrados para a consulta ao banco não repetir
+IDS_LEMBRADOS = 5000
+
+# Espera do EventSource antes de reconectar (milissegundos)
+RECONEXAO_MS = 5000
+
+
+class Assinatura:
+    """Conexão aberta: eventos do dashboard (``produto_id=None``) ou de um produto"""
+
+    def __init__(self, produto_id, loop):
+        self.produto_id = produto_id
+        self.loop = loop
+        self.fila = asyncio.Queue(TAMANHO_FILA)
+
+    def entregar(self, nome, dados):
+        # Executado no loop da conexão (call_soon_threadsafe)
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait((nome, dados))
+
+
+class Central:
+    """Distribuição em memória dos eventos para as conexões deste processo"""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._assinaturas = set()
+        # dict como conjunto ordenado: os ids mais antigos saem primeiro
+        self._publicadas = {}
+        self._ultimo_id = None
+        self._consulta = None
+        self._estatisticas_agendadas = False
+
+    def assinar(self, produto_id=None):
+        """Registra uma conexão; chamado dentro do loop que vai ler a fila"""
+        loop = asyncio.get_running_loop()
+        assinatura = Assinatura(produto_id, loop)
+        with self._trava:
+            self._assinaturas.add(assinatura)
+        intervalo = getattr(settings, 'EVENTOS_CONSULTA_SEGUNDOS', 5)
+        if intervalo and (self._consulta is None or self._consulta.done()
+                          or self._consulta.get_loop() is not loop):
+            self._consulta = loop.create_task(self._consultar_periodicamente(intervalo))
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            self._assinaturas.discard(assinatura)
+            vazia = not self._assinaturas
+        if vazia and self._consulta is not None:
+            self._consulta.cancel()
+            self._consulta = None
+            # Sem conexões, o que foi gravado nesse meio tempo não interessa
+            self._ultimo_id = None
+
+    def publicar(self, movimentacoes, recarregar=False):
+        """
+        Envia as movimentações às conexões abertas; pode ser chamado de qualquer
+        thread. Com ``recarregar``, as páginas de produto abertas recebem o
+        estoque atual mesmo sem movimentação do produto.
+        """
+        with self._trava:
+            for movimentacao in movimentacoes:
+                self._publicadas[movimentacao.pk] = None
+            while len(self._publicadas) > IDS_LEMBRADOS:
+                del self._publicadas[next(iter(self._publicadas))]
+            # Conexões cujo loop terminou sem passar por cancelar()
+            self._assinaturas = {
+                assinatura for assinatura in self._assinaturas if not assinatura.loop.is_closed()
+            }
+            assinaturas = list(self._assinaturas)
+        if not assinaturas:
+            return
+
+        produtos = {assinatura.produto_id for assinatura in assinaturas}
+        eventos = self._renderizar(movimentacoes, produtos, recarregar)
+        if None in produtos:
+            intervalo = getattr(settings, 'EVENTOS_ESTATISTICAS_SEGUNDOS', 5)
+            if intervalo:
+                self._agendar_estatisticas(intervalo)
+            else:
+                eventos[None] += self._renderizar_estatisticas()
+        self._entregar(assinaturas, eventos)
+
+    def _entregar(self, assinaturas, eventos):
+        for assinatura in assinaturas:
+            for nome, dados in eventos.get(assinatura.produto_id, ()):
+                try:
+                    assinatura.loop.call_soon_threadsafe(assinatura.entregar, nome, dados)
+                except RuntimeError:
+                    # Loop encerrado durante a renderização
+                    with self._trava:
+                        self._assinaturas.discard(assinatura)
+                    break
+
+    def _renderizar(self, movimentacoes, produtos, recarregar=False):
+        """``{produto_id ou None: [(evento, html), ...]}`` para quem está assinando"""
+        ids = {mov.produto_id for mov in movimentacoes}
+        if recarregar:
+            ids |= produtos - {None}
+        carregados = Produto.objects.only(*CAMPOS_PRODUTO).in_bulk(ids)
+        usuarios = User.objects.only('id', 'username', 'first_name', 'last_name').in_bulk(
+            {mov.usuario_id for mov in movimentacoes}
+        )
+        # Cópias com os relacionamentos já carregados: as movimentações do
+        # lote e do inventário só trazem alguns campos do produto, ou só o id
+        completas = []
+        for mov in movimentacoes:
+            mov = copy.copy(mov)
+            mov.produto = carregados[mov.produto_id]
+            mov.usuario = usuarios[mov.usuario_id]
+            completas.append(mov)
+
+        eventos = {}
+        if None in produtos:
+            eventos[None] = [
+                (
+                    'movimentacao',
+                    render_to_string('estoque/partials/movimentacao_item.html', {'mov': resumo_de_instancia(mov)}),
+                )
+                for mov in completas
+            ]
+
+        quantidades = {}
+        if recarregar:
+            quantidades = {
+                produto_id: carregados[produto_id].quantidade_atual
+                for produto_id in produtos if produto_id in carregados
+            }
+        for mov in completas:
+            if mov.produto_id in produtos:
+                eventos.setdefault(mov.produto_id, []).append((
+                    'movimentacao',
+                    render_to_string(
+                        'estoque/partials/movimentacao_historico.html', {'mov': mov, 'produto': mov.produto}
+                    ),
+                ))
+                if not recarregar:
+                    # A última movimentação publicada, não o que outro
+                    # processo possa ter gravado depois
+                    quantidades[mov.produto_id] = mov.quantidade_atual
+        for produto_id, quantidade in quantidades.items():
+            produto = copy.copy(carregados[produto_id])
+            produto.quantidade_atual = quantidade
+            eventos.setdefault(produto_id, []).append((
+                'estoque',
+                render_to_string('estoque/partials/produto_estoque_atual.html', {'produto': produto}),
+            ))
+        return eventos
+
+    def _renderizar_estatisticas(self):
+        # signals.invalidar_estatisticas já descartou o cache
+        estatisticas = estatisticas_dashboard()
+        return [
+            ('estatisticas', render_to_string('estoque/partials/estatisticas_dashboard.html', estatisticas)),
+            ('alerta', render_to_string('estoque/partials/produtos_alerta.html', estatisticas)),
+        ]
+
+    def _agendar_estatisticas(self, intervalo):
+        """Um recálculo dos cartões para todas as publicações dos próximos ``intervalo`` segundos"""
+        with self._trava:
+            if self._estatisticas_agendadas:
+                return
+            self._estatisticas_agendadas = True
+        temporizador = threading.Timer(intervalo, self._publicar_estatisticas)
+        temporizador.daemon = True
+        temporizador.start()
+
+    def _publicar_estatisticas(self):
+        with self._trava:
+            self._estatisticas_agendadas = False
+            assinaturas = [assinatura for assinatura in self._assinaturas if assinatura.produto_id is None]
+        if not assinaturas:
+            return
+        try:
+            self._entregar(assinaturas, {None: self._renderizar_estatisticas()})
+        except Exception:
+            logger.exception('Falha ao publicar as estatísticas do dashboard')
+        finally:
+            # Thread do temporizador, que termina aqui
+            connections.close_all()
+
+    def consultar_banco(self):
+        """
+        Publica as movimentações gravadas por outros processos desde a última
+        consulta. A primeira só marca o ponto de partida.
+        """
+        if self._ultimo_id is None:
+            self._ultimo_id = MovimentacaoEstoque.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+            return []
+        novas = list(MovimentacaoEstoque.objects.filter(pk__gt=self._ultimo_id).order_by('pk')[:LIMITE_CONSULTA + 1])
+        if not novas:
+            return []
+        if len(novas) > LIMITE_CONSULTA:
+            # Acúmulo grande: uma atualização só, em vez de repassar tudo
+            ultimo = MovimentacaoEstoque.objects.aggregate(ultimo=Max('id'))['ultimo']
+            recentes = list(MovimentacaoEstoque.objects.filter(
+                pk__gt=self._ultimo_id, pk__lte=ultimo
+            ).order_by('-pk')[:RECENTES_NA_ATUALIZACAO])
+            self._ultimo_id = ultimo
+            recentes.reverse()
+            self.publicar(recentes, recarregar=True)
+            return recentes
+        self._ultimo_id = novas[-1].pk
+        with self._trava:
+            novas = [mov for mov in novas if mov.pk not in self._publicadas]
+        if novas:
+            self.publicar(novas)
+        return novas
+
+    def _consultar_e_fechar(self):
+        try:
+            return self.consultar_banco()
+        finally:
+            # Thread do executor: não passa pelo fim de requisição do Django
+            close_old_connections()
+
+    async def _consultar_periodicamente(self, intervalo):
+        # Fora da thread das views síncronas, que o ASGI compartilha
+        consultar = sync_to_async(self._consultar_e_fechar, thread_sensitive=False)
+        while True:
+            try:
+                await consultar()
+            except Exception:
+                logger.exception('Falha ao consultar novas movimentações')
+            await asyncio.sleep(intervalo)
+
+
+central = Central()
+
+
+def formatar(nome, dados):
+    """Evento no formato ``text/event-stream`` (uma linha ``data:`` por linha do HTML)"""
+    linhas = ''.join(f'data: {linha}\n' for linha in dados.splitlines() or [''])
+    return f'event: {nome}\n{linhas}\n'
+
+
+async def transmitir(produto_id=None):
+    """Corpo da resposta: eventos da conexão até o navegador desconectar"""
+    assinatura = central.assinar(produto_id)
+    espera = getattr(settings, 'EVENTOS_PING_SEGUNDOS', 15)
+    try:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+        while True:
+            try:
+                nome, dados = await asyncio.wait_for(assinatura.fila.get(), espera)
+            except asyncio.TimeoutError:
+                # Comentário: mantém proxies com a conexão aberta e revela desconexões
+                yield ': ping\n\n'
+                continue
+            yield formatar(nome, dados)
+    finally:
+        central.cancelar(assinatura)
@@ -0,0 +1,228 @@
+"""
+Exportação de dados em CSV e XLSX por streaming
+
+As linhas chegam de um iterável (tipicamente ``values_list().iterator()``)
+e são escritas na resposta à medida que são lidas, então o uso de memória
+não depende do número de registros e o download começa de imediato. O XLSX
+é gerado sem dependências: um zip gravado em modo sem seek, com as células
+como strings inline e uma nova planilha a cada limite de linhas do Excel.
+
+Servida por ASGI (``assincrono=True``), a resposta recebe um iterador
+assíncrono que pede cada pedaço ao gerador síncrono numa thread: o Django
+transformaria um iterador síncrono em lista antes de enviar o primeiro byte.
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+# Linhas por planilha no Excel, descontando o cabeçalho
+LINHAS_POR_PLANILHA = 1048575
+
+# Linhas acumuladas antes de entregar um pedaço da resposta
+LINHAS_POR_PEDACO = 500
+
+CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def formatar_valor(valor):
+    """Converte datas para o fuso local e None para vazio"""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime('%d/%m/%Y %H:%M')
+    return valor
+
+
+class _Buffer:
+    """Arquivo somente de escrita cujo conteúdo é retirado pelo gerador da resposta"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+async def _pedacos_assincronos(pedacos):
+    """Entrega os pedaços de um gerador síncrono um a um, sem bloquear o loop"""
+    # thread_sensitive: o gerador e o cursor do banco ficam sempre na mesma thread
+    proximo = sync_to_async(next)
+    fim = object()
+    try:
+        while (pedaco := await proximo(pedacos, fim)) is not fim:
+            yield pedaco
+    finally:
+        # Cliente desconectado: fecha o cursor do banco na thread dele
+        await sync_to_async(pedacos.close)()
+
+
+def _resposta(conteudo, content_type, nome_arquivo, assincrono):
+    if assincrono:
+        conteudo = _pedacos_assincronos(conteudo)
+    resposta = StreamingHttpResponse(conteudo, content_type=content_type)
+    resposta['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return resposta
+
+
+def exportar_csv(nome_arquivo, cabecalho, linhas, assincrono=False):
+    """CSV separado por ponto e vírgula, com BOM para o Excel reconhecer UTF-8"""
+
+    class Eco:
+        def write(self, valor):
+            return valor
+
+    escritor = csv.writer(Eco(), delimiter=';')
+
+    def gerar():
+        yield '\ufeff' + escritor.writerow(cabecalho)
+        pedaco = []
+        for linha in linhas:
+            pedaco.append(escritor.writerow([formatar_valor(valor) for valor in linha]))
+            if len(pedaco) >= LINHAS_POR_PEDACO:
+                yield ''.join(pedaco)
+                pedaco = []
+        if pedaco:
+            yield ''.join(pedaco)
+
+    return _resposta(gerar(), 'text/csv; charset=utf-8', nome_arquivo, assincrono)
+
+
+def _celula(valor):
+    valor = formatar_valor(valor)
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xml(valores):
+    return '<row>' + ''.join(_celula(valor) for valor in valores) + '</row>'
+
+
+INICIO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+FIM_PLANILHA = '</sheetData></worksheet>'
+
+
+def _arquivos_finais(titulo, total_planilhas):
+    """Partes do pacote que dependem do número de planilhas geradas"""
+    nomes = [titulo[:31]] if total_planilhas == 1 else [
+        f'{titulo[:27]} {numero}' for numero in range(1, total_planilhas + 1)
+    ]
+    planilhas = ''.join(
+        f'<sheet name="{escape(nome)}" sheetId="{numero}" r:id="rId{numero}"/>'
+        for numero, nome in enumerate(nomes, start=1)
+    )
+    relacoes = ''.join(
+        f'<Relationship Id="rId{numero}" '
+        f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{numero}.xml"/>'
+        for numero in range(1, total_planilhas + 1)
+    )
+    tipos = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{numero}.xml" '
+        f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for numero in range(1, total_planilhas + 1)
+    )
+    return {
+        'xl/workbook.xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{planilhas}</sheets></workbook>'
+        ),
+        'xl/_rels/workbook.xml.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{relacoes}</Relationships>'
+        ),
+        '_rels/.rels': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ),
+        '[Content_Types].xml': (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f'{tipos}</Types>'
+        ),
+    }
+
+
+def exportar_xlsx(nome_arquivo, titulo, cabecalho, linhas, assincrono=False):
+    """Planilha XLSX gravada por streaming, sem montar o arquivo em memória"""
+
+    def gerar():
+        buffer = _Buffer()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as pacote:
+            total_planilhas = 0
+            planilha = None
+            linhas_na_planilha = LINHAS_POR_PLANILHA
+            pedaco = []
+
+            for linha in linhas:
+                if linhas_na_planilha >= LINHAS_POR_PLANILHA:
+                    if planilha is not None:
+                        planilha.write((''.join(pedaco) + FIM_PLANILHA).encode())
+                        planilha.close()
+                        pedaco = []
+                    total_planilhas += 1
+                    planilha = pacote.open(
+                        f'xl/worksheets/sheet{total_planilhas}.xml', 'w', force_zip64=True
+                    )
+                    planilha.write((INICIO_PLANILHA + _linha_xml(cabecalho)).encode())
+                    linhas_na_planilha = 0
+
+                pedaco.append(_linha_xml(linha))
+                linhas_na_planilha += 1
+                if len(pedaco) >= LINHAS_POR_PEDACO:
+                    planilha.write(''.join(pedaco).encode())
+                    pedaco = []
+                    yield buffer.retirar()
+
+            if planilha is None:
+                total_planilhas = 1
+                planilha = pacote.open('xl/worksheets/sheet1.xml', 'w')
+                planilha.write((INICIO_PLANILHA + _linha_xml(cabecalho)).encode())
+            planilha.write((''.join(pedaco) + FIM_PLANILHA).encode())
+            planilha.close()
+
+            for nome, conteudo in _arquivos_finais(titulo, total_planilhas).items():
+                pacote.writestr(nome, conteudo)
+
+        yield buffer.retirar()
+
+    return _resposta(
+        gerar(),
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        nome_arquivo,
+        assincrono,
+    )
@@ -0,0 +1,206 @@
+"""
+Fila de tarefas no banco de dados (sem broker externo)
+
+Operações demoradas viram uma ``Tarefa`` e são executadas pelo comando
+``processar_tarefas``, que pode rodar com vários processos e threads:
+
+- ``@tarefa`` registra a função pelo nome; ela recebe a ``Tarefa`` (para
+  ``registrar_progresso``) e os argumentos, e o retorno vira ``resultado``;
+- ``enfileirar`` cria a tarefa; dentro de uma transação ela só fica visível
+  ao worker depois do commit, junto com os dados de que depende;
+- cada worker reserva a próxima tarefa pronta com ``SKIP LOCKED`` no
+  PostgreSQL ou com um UPDATE condicional nos demais bancos;
+- uma falha agenda nova tentativa com espera exponencial até
+  ``maximo_tentativas``; exceções em ``definitivas`` falham na hora;
+- a reserva vale ``TAREFAS_TEMPO_LIMITE`` segundos, renovados a cada
+  progresso; a tarefa de um worker que parou volta para a fila.
+
+Sem worker (``TAREFAS_NA_REQUISICAO``), as tarefas sem atraso são executadas
+pelo próprio processo logo depois do commit que as criou. Tarefas agendadas
+para depois e novas tentativas continuam esperando um ``processar_tarefas``
+(por exemplo ``--uma-vez`` num cron).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarefa
+
+
+logger = logging.getLogger('estoque.fila')
+
+TAREFAS = {}
+
+# Segundos entre as buscas de reservas expiradas de cada worker
+INTERVALO_RECUPERACAO = 30
+
+
+class TarefaDesconhecida(Exception):
+    """Nenhuma função registrada com o nome da tarefa"""
+
+
+def tarefa(nome=None, tentativas=3, definitivas=()):
+    """Registra a função como tarefa; ``definitivas`` são exceções que não adianta repetir"""
+    def registrar(funcao):
+        funcao.nome_tarefa = nome or funcao.__name__
+        funcao.maximo_tentativas = tentativas
+        funcao.falhas_definitivas = tuple(definitivas)
+        TAREFAS[funcao.nome_tarefa] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(nome, usuario=None, atraso=None, **argumentos):
+    """Cria a tarefa ``nome`` com os argumentos (serializáveis em JSON)"""
+    if nome not in TAREFAS:
+        raise TarefaDesconhecida(f'Tarefa não registrada: {nome}')
+    criada = Tarefa.objects.create(
+        nome=nome,
+        argumentos=argumentos,
+        maximo_tentativas=TAREFAS[nome].maximo_tentativas,
+        executar_apos=timezone.now() + (atraso or timedelta()),
+        criado_por=usuario if usuario is not None and usuario.is_authenticated else None,
+    )
+    if atraso is None and getattr(settings, 'TAREFAS_NA_REQUISICAO', False):
+        transaction.on_commit(lambda: executar_agora(criada.pk))
+    return criada
+
+
+def nome_worker():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'[:100]
+
+
+def _validade():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'TAREFAS_TEMPO_LIMITE', 600))
+
+
+def _reserva(worker, agora):
+    return {
+        'status': 'EXECUTANDO', 'worker': worker, 'expira_em': _validade(),
+        'iniciada_em': agora, 'tentativas': F('tentativas') + 1,
+    }
+
+
+def reservar(worker=None):
+    """Reserva a próxima tarefa pronta para o worker, ou None se não houver"""
+    worker = worker or nome_worker()
+    agora = timezone.now()
+    prontas = Tarefa.objects.filter(status='PENDENTE', executar_apos__lte=agora).order_by(
+        'executar_apos', 'id'
+    )
+    reserva = _reserva(worker, agora)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = prontas.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Tarefa.objects.filter(pk=pk).update(**reserva)
+        return Tarefa.objects.get(pk=pk)
+
+    # Sem SKIP LOCKED: vence quem mudar o status primeiro
+    for pk in prontas.values_list('pk', flat=True)[:10]:
+        if Tarefa.objects.filter(pk=pk, status='PENDENTE').update(**reserva):
+            return Tarefa.objects.get(pk=pk)
+    return None
+
+
+def executar_agora(pk):
+    """
+    Reserva e executa a tarefa ``pk`` no próprio processo (sem worker).
+
+    Retorna False se ela já foi reservada por outro ou não está pendente.
+    """
+    worker = nome_worker()
+    if not Tarefa.objects.filter(pk=pk, status='PENDENTE').update(**_reserva(worker, timezone.now())):
+        return False
+    return executar(Tarefa.objects.get(pk=pk))
+
+
+def atraso_nova_tentativa(tentativa):
+    """Espera exponencial com variação aleatória, para os workers não repetirem juntos"""
+    base = getattr(settings, 'TAREFAS_ATRASO_BASE', 10)
+    atraso = min(base * 2 ** (tentativa - 1), 3600)
+    return timedelta(seconds=atraso + random.uniform(0, base))
+
+
+def executar(tarefa_reservada):
+    """Executa uma tarefa reservada e grava o resultado ou a falha"""
+    funcao = TAREFAS.get(tarefa_reservada.nome)
+    reserva = Tarefa.objects.filter(pk=tarefa_reservada.pk, worker=tarefa_reservada.worker)
+    try:
+        if funcao is None:
+            raise TarefaDesconhecida(f'Tarefa não registrada: {tarefa_reservada.nome}')
+        resultado = funcao(tarefa_reservada, **tarefa_reservada.argumentos)
+    except Exception as exc:
+        definitiva = funcao is None or isinstance(exc, funcao.falhas_definitivas)
+        erro = ''.join(traceback.format_exception(exc))[-5000:]
+        if definitiva or tarefa_reservada.tentativas >= tarefa_reservada.maximo_tentativas:
+            logger.exception('Tarefa %s #%s falhou', tarefa_reservada.nome, tarefa_reservada.pk)
+            reserva.update(status='FALHOU', erro=erro, concluida_em=timezone.now(), expira_em=None)
+            tarefa_reservada.status = 'FALHOU'
+        else:
+            logger.warning('Tarefa %s #%s falhou, nova tentativa agendada: %s',
+                           tarefa_reservada.nome, tarefa_reservada.pk, exc)
+            reserva.update(
+                status='PENDENTE', erro=erro, worker='', expira_em=None,
+                executar_apos=timezone.now() + atraso_nova_tentativa(tarefa_reservada.tentativas),
+            )
+            tarefa_reservada.status = 'PENDENTE'
+        return False
+
+    reserva.update(
+        status='CONCLUIDA', resultado=resultado, progresso=100, erro='',
+        concluida_em=timezone.now(), expira_em=None,
+    )
+    tarefa_reservada.status = 'CONCLUIDA'
+    tarefa_reservada.resultado = resultado
+    return True
+
+
+def recuperar_expiradas():
+    """Devolve à fila (ou encerra) tarefas de workers que pararam sem concluir"""
+    expiradas = Tarefa.objects.filter(status='EXECUTANDO', expira_em__lt=timezone.now())
+    falharam = expiradas.filter(tentativas__gte=F('maximo_tentativas')).update(
+        status='FALHOU', erro='Worker parou sem concluir a tarefa.',
+        concluida_em=timezone.now(), expira_em=None,
+    )
+    voltaram = expiradas.update(
+        status='PENDENTE', worker='', expira_em=None, executar_apos=timezone.now(),
+    )
+    return voltaram + falharam
+
+
+def executar_pendentes(parar=None, intervalo=1.0, uma_vez=False):
+    """
+    Laço de um worker: reserva e executa tarefas até ``parar`` ser sinalizado.
+
+    Com ``uma_vez`` termina quando não houver mais tarefas prontas.
+    Retorna o número de tarefas executadas.
+    """
+    parar = parar or threading.Event()
+    executadas = 0
+    proxima_recuperacao = 0
+    while not parar.is_set():
+        if time.monotonic() >= proxima_recuperacao:
+            recuperar_expiradas()
+            proxima_recuperacao = time.monotonic() + INTERVALO_RECUPERACAO
+        reservada = reservar()
+        if reservada is None:
+            if uma_vez:
+                break
+            parar.wait(intervalo)
+            continue
+        executar(reservada)
+        executadas += 1
+    return executadas
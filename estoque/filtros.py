@@ -0,0 +1,133 @@
+"""
+Filtros das listas de produtos e movimentações
+
+Usados pelas páginas HTML, pelas exportações e pela API JSON, para que os
+mesmos parâmetros deem o mesmo resultado em todas. Cada função devolve o
+queryset já ordenado para a paginação por cursor (``order_by`` termina no
+id) e os valores aplicados, para os formulários de filtro.
+
+Um parâmetro fora do formato levanta ``FiltroInvalido``: as páginas
+respondem 400 e a API responde 400 com o erro em JSON.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.core.exceptions import BadRequest
+from django.utils import timezone
+
+from .busca import buscar_produtos
+from .models import MovimentacaoEstoque, Produto
+
+
+ORDENS_PRODUTO = ['nome', '-nome', 'quantidade_atual', '-quantidade_atual', 'codigo', '-codigo']
+
+TIPOS_MOVIMENTACAO = [tipo for tipo, _ in MovimentacaoEstoque.TIPO_CHOICES]
+
+VERDADEIROS = ('1', 'true', 'on')
+FALSOS = ('0', 'false', 'off')
+
+
+class FiltroInvalido(BadRequest):
+    """Parâmetro de filtro fora do formato aceito"""
+
+
+def _inteiro(params, nome):
+    valor = params.get(nome)
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise FiltroInvalido(f'"{nome}" deve ser um número inteiro.')
+
+
+def _booleano(params, nome):
+    valor = (params.get(nome) or '').lower()
+    if valor and valor not in VERDADEIROS + FALSOS:
+        raise FiltroInvalido(f'"{nome}" deve ser 1 ou 0.')
+    return valor in VERDADEIROS
+
+
+def _data(params, nome):
+    valor = params.get(nome)
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise FiltroInvalido(f'"{nome}" deve ser uma data no formato AAAA-MM-DD.')
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def filtrar_produtos(params):
+    """Produtos ativos com busca, filtros e ordenação da lista de produtos"""
+    produtos = Produto.objects.filter(ativo=True).select_related('categoria', 'fornecedor')
+
+    search = params.get('search', '')
+    if search:
+        produtos = buscar_produtos(produtos, search)
+
+    categoria_id = _inteiro(params, 'categoria')
+    if categoria_id is not None:
+        produtos = produtos.filter(categoria_id=categoria_id)
+
+    fornecedor_id = _inteiro(params, 'fornecedor')
+    if fornecedor_id is not None:
+        produtos = produtos.filter(fornecedor_id=fornecedor_id)
+
+    estoque_baixo = _booleano(params, 'estoque_baixo')
+    if estoque_baixo:
+        produtos = produtos.filter(abaixo_minimo=True)
+
+    # Ordenação desconhecida volta para o nome, como na página
+    ordem = params.get('ordem', 'nome')
+    if ordem not in ORDENS_PRODUTO:
+        ordem = 'nome'
+    produtos = produtos.order_by(ordem, '-id' if ordem.startswith('-') else 'id')
+
+    filtros = {
+        'search': search,
+        'categoria_id': str(categoria_id) if categoria_id is not None else None,
+        'fornecedor_id': str(fornecedor_id) if fornecedor_id is not None else None,
+        'estoque_baixo': '1' if estoque_baixo else None,
+        'ordem': ordem,
+    }
+    return produtos, filtros
+
+
+def filtrar_movimentacoes(params):
+    """Movimentações por produto, tipo e período, da mais recente para a mais antiga"""
+    movimentacoes = MovimentacaoEstoque.objects.select_related(
+        'produto', 'usuario'
+    ).order_by('-data_movimentacao', '-id')
+
+    produto_id = _inteiro(params, 'produto')
+    if produto_id is not None:
+        movimentacoes = movimentacoes.filter(produto_id=produto_id)
+
+    tipo = params.get('tipo')
+    if tipo and tipo not in TIPOS_MOVIMENTACAO:
+        raise FiltroInvalido(f'"tipo" deve ser um de: {", ".join(TIPOS_MOVIMENTACAO)}.')
+    if tipo:
+        movimentacoes = movimentacoes.filter(tipo=tipo)
+
+    # Intervalo pelo horário local, sem __date, para usar o índice mov_data_idx
+    data_inicio = _data(params, 'data_inicio')
+    if data_inicio:
+        movimentacoes = movimentacoes.filter(data_movimentacao__gte=_inicio_do_dia(data_inicio))
+
+    data_fim = _data(params, 'data_fim')
+    if data_fim:
+        movimentacoes = movimentacoes.filter(
+            data_movimentacao__lt=_inicio_do_dia(data_fim + timedelta(days=1))
+        )
+
+    filtros = {
+        'tipo': tipo,
+        'produto_id': str(produto_id) if produto_id is not None else None,
+        'data_inicio': data_inicio.isoformat() if data_inicio else '',
+        'data_fim': data_fim.isoformat() if data_fim else '',
+    }
+    return movimentacoes, filtros
@@ -1,6 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from .models import Produto, MovimentacaoEstoque, Categoria, Fornecedor
+from .models import Produto, MovimentacaoEstoque, Categoria, Fornecedor, InventarioFisico
 
 
 class ProdutoForm(forms.ModelForm):
@@ -278,3 +278,71 @@ class FiltroMovimentacaoForm(forms.Form):
             'class': 'form-control'
         })
     )
+
+
+class ImportacaoProdutosForm(forms.Form):
+    arquivo = forms.FileField(
+        label='Planilha de produtos',
+        help_text='Arquivo .csv (separado por ; ou ,) ou .xlsx com a coluna "Código" na primeira linha',
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data['arquivo']
+        if not arquivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise ValidationError('Envie um arquivo .csv ou .xlsx.')
+        return arquivo
+
+
+class InventarioForm(forms.ModelForm):
+    """Abertura de inventário, com filtros opcionais dos produtos contados"""
+
+    categoria = forms.ModelChoiceField(
+        queryset=Categoria.objects.all(),
+        required=False,
+        empty_label='Todas as categorias',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    fornecedor = forms.ModelChoiceField(
+        queryset=Fornecedor.objects.filter(ativo=True),
+        required=False,
+        empty_label='Todos os fornecedores',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    localizacao = forms.CharField(
+        label='Localização',
+        required=False,
+        help_text='Apenas produtos cuja localização começa com este texto',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex: Estante A'})
+    )
+
+    class Meta:
+        model = InventarioFisico
+        fields = ['nome', 'descricao']
+        widgets = {
+            'nome': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ex: Inventário anual 2025'}),
+            'descricao': forms.Textarea(attrs={'class': 'form-control', 'rows': 2}),
+        }
+        labels = {
+            'descricao': 'Descrição',
+        }
+
+
+class ContagemForm(forms.Form):
+    produto = forms.CharField(
+        label='Código ou QR code',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'autofocus': True, 'autocomplete': 'off'})
+    )
+    quantidade = forms.DecimalField(
+        min_value=0,
+        max_digits=10,
+        decimal_places=2,
+        initial=1,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'})
+    )
+    somar = forms.BooleanField(
+        label='Somar à contagem anterior',
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
@@ -0,0 +1,212 @@
+"""
+Giro de estoque a partir do resumo diário (``MovimentacaoDiaria``)
+
+Agrupar ``MovimentacaoEstoque`` por produto ao longo de meses percorre todo
+o histórico. O resumo guarda uma linha por produto, dia e tipo com as somas
+de quantidade e de variação do estoque e o número de movimentações:
+
+- ``acumular_movimentacoes`` soma as movimentações ao resumo dentro da
+  transação que as gravou (chamada por ``services.notificar_movimentacoes``),
+  com um ``INSERT ... ON CONFLICT DO UPDATE`` por bloco; os produtos já estão
+  bloqueados, então o resumo nunca diverge das movimentações;
+- ``reconstruir_resumo`` recalcula um período a partir das movimentações
+  (comando ``resumo_movimentacoes``), para o histórico anterior ao resumo e
+  para movimentações alteradas ou excluídas pelo admin;
+- ``relatorio_giro`` monta os produtos mais movimentados, a curva ABC e o
+  giro do período lendo só o resumo.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import MovimentacaoDiaria, MovimentacaoEstoque, Produto
+
+
+# Linhas por INSERT (seis parâmetros cada, abaixo do limite do SQLite)
+TAMANHO_BLOCO = 150
+
+# Linhas do resumo reconstruído guardadas em memória antes de cada gravação
+LINHAS_POR_GRAVACAO = 5000
+
+# Participação acumulada no valor consumido até onde vai cada classe
+CLASSES_ABC = (('A', Decimal('0.80')), ('B', Decimal('0.95')), ('C', None))
+
+
+def _somar(totais):
+    """Soma ``{(produto_id, dia, tipo): [quantidade, variacao, movimentacoes]}`` ao resumo"""
+    nome = connection.ops.quote_name
+    campo = MovimentacaoDiaria._meta.get_field
+    tabela = nome(MovimentacaoDiaria._meta.db_table)
+    produto, dia, tipo, quantidade, variacao, movimentacoes = (
+        nome(campo(nome_campo).column)
+        for nome_campo in ('produto', 'dia', 'tipo', 'quantidade', 'variacao', 'movimentacoes')
+    )
+    atualizar = ', '.join(
+        f'{coluna} = {tabela}.{coluna} + EXCLUDED.{coluna}'
+        for coluna in (quantidade, variacao, movimentacoes)
+    )
+
+    adaptar_dia = connection.ops.adapt_datefield_value
+    linhas = [
+        (produto_id, adaptar_dia(dia), tipo, *valores)
+        for (produto_id, dia, tipo), valores in totais.items()
+    ]
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(linhas), TAMANHO_BLOCO):
+            bloco = linhas[inicio:inicio + TAMANHO_BLOCO]
+            cursor.execute(
+                f'INSERT INTO {tabela} ({produto}, {dia}, {tipo}, {quantidade}, {variacao}, {movimentacoes}) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(bloco))} '
+                f'ON CONFLICT ({produto}, {dia}, {tipo}) DO UPDATE SET {atualizar}',
+                [valor for linha in bloco for valor in linha],
+            )
+
+
+def acumular_movimentacoes(movimentacoes):
+    """Soma as movimentações ao resumo do dia em que aconteceram"""
+    totais = {}
+    for movimentacao in movimentacoes:
+        chave = (
+            movimentacao.produto_id,
+            timezone.localdate(movimentacao.data_movimentacao),
+            movimentacao.tipo,
+        )
+        total = totais.setdefault(chave, [Decimal(0), Decimal(0), 0])
+        total[0] += movimentacao.quantidade
+        total[1] += movimentacao.quantidade_atual - movimentacao.quantidade_anterior
+        total[2] += 1
+    if totais:
+        _somar(totais)
+
+
+def reconstruir_resumo(inicio=None, fim=None):
+    """
+    Recalcula o resumo dos dias entre ``inicio`` e ``fim`` (inclusive; sem
+    limites, todo o histórico) a partir das movimentações.
+
+    Retorna o número de linhas gravadas. O agrupamento é lido em ordem de
+    dia e produto e gravado a cada ``LINHAS_POR_GRAVACAO`` linhas, sem
+    guardar o histórico inteiro em memória.
+    """
+    movimentacoes = MovimentacaoEstoque.objects.order_by()
+    resumo = MovimentacaoDiaria.objects.all()
+    if inicio:
+        movimentacoes = movimentacoes.filter(data_movimentacao__date__gte=inicio)
+        resumo = resumo.filter(dia__gte=inicio)
+    if fim:
+        movimentacoes = movimentacoes.filter(data_movimentacao__date__lte=fim)
+        resumo = resumo.filter(dia__lte=fim)
+
+    # Agregado no banco: só as linhas do resumo chegam ao Python
+    linhas = movimentacoes.values('produto_id', 'tipo', dia=TruncDate('data_movimentacao')).annotate(
+        soma_quantidade=Sum('quantidade'),
+        soma_variacao=Sum(F('quantidade_atual') - F('quantidade_anterior')),
+        total=Count('id'),
+    ).values_list(
+        'produto_id', 'dia', 'tipo', 'soma_quantidade', 'soma_variacao', 'total'
+    ).order_by('dia', 'produto_id', 'tipo')
+
+    gravadas = 0
+    with transaction.atomic():
+        resumo.delete()
+        totais = {}
+        for produto_id, dia, tipo, quantidade, variacao, total in linhas.iterator(chunk_size=2000):
+            # Cada chave aparece uma vez no agrupamento: os blocos não se sobrepõem
+            totais[(produto_id, dia, tipo)] = [quantidade, variacao, total]
+            if len(totais) >= LINHAS_POR_GRAVACAO:
+                _somar(totais)
+                gravadas += len(totais)
+                totais = {}
+        if totais:
+            _somar(totais)
+            gravadas += len(totais)
+    return gravadas
+
+
+def _classificar(valores, total):
+    """Classe ABC de cada produto, pelo valor consumido em ordem decrescente"""
+    classes = {}
+    acumulado = Decimal(0)
+    indice = 0
+    for produto_id, valor in valores:
+        # Entra na classe enquanto o acumulado antes dele não passou do limite
+        while CLASSES_ABC[indice][1] is not None and acumulado >= total * CLASSES_ABC[indice][1]:
+            indice += 1
+        classes[produto_id] = CLASSES_ABC[indice][0]
+        acumulado += valor
+    return classes
+
+
+def relatorio_giro(dias=90, limite=20, hoje=None):
+    """
+    Produtos mais movimentados, curva ABC e giro dos últimos ``dias``.
+
+    - ``mais_movimentados``: os ``limite`` produtos com maior quantidade
+      movimentada, com entradas, saídas, giro (saídas sobre o estoque médio)
+      e dias de cobertura (estoque atual sobre a saída média diária);
+    - ``curva_abc``: produtos e valor consumido (saídas a preço de custo
+      atual) de cada classe.
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = hoje - timedelta(days=dias - 1)
+    periodo = MovimentacaoDiaria.objects.filter(dia__gte=inicio, produto__ativo=True).order_by()
+    zero = Value(Decimal(0), output_field=DecimalField(max_digits=16, decimal_places=2))
+
+    mais_movimentados = list(periodo.values('produto_id').annotate(
+        movimentado=Sum('quantidade'),
+        entradas=Coalesce(Sum('quantidade', filter=Q(tipo='ENTRADA')), zero),
+        saidas=Coalesce(Sum('quantidade', filter=Q(tipo='SAIDA')), zero),
+        variacao_periodo=Sum('variacao'),
+        total_movimentacoes=Sum('movimentacoes'),
+    ).order_by('-movimentado', 'produto_id')[:limite])
+
+    consumo = periodo.filter(tipo='SAIDA').values('produto_id').annotate(
+        valor=Sum(F('quantidade') * F('produto__preco_custo'))
+    ).order_by('-valor', 'produto_id').values_list('produto_id', 'valor')
+    valores = list(consumo)
+    valor_total = sum((valor for _, valor in valores), Decimal(0))
+    classes = _classificar(valores, valor_total)
+
+    por_classe = {classe: [0, Decimal(0)] for classe, _ in CLASSES_ABC}
+    for produto_id, valor in valores:
+        por_classe[classes[produto_id]][0] += 1
+        por_classe[classes[produto_id]][1] += valor
+    curva_abc = [
+        {
+            'classe': classe,
+            'produtos': produtos,
+            'valor': valor,
+            'percentual': float(valor / valor_total * 100) if valor_total else 0,
+        }
+        for classe, (produtos, valor) in por_classe.items()
+    ]
+
+    produtos = Produto.objects.in_bulk(
+        [linha['produto_id'] for linha in mais_movimentados]
+    )
+    for linha in mais_movimentados:
+        produto = produtos[linha['produto_id']]
+        # Estoque no início do período: o atual menos o que variou desde então
+        estoque_inicial = produto.quantidade_atual - linha['variacao_periodo']
+        estoque_medio = (estoque_inicial + produto.quantidade_atual) / 2
+        saida_diaria = linha['saidas'] / dias
+        linha.update(
+            produto=produto,
+            classe=classes.get(produto.pk, 'C'),
+            estoque_medio=estoque_medio,
+            giro=linha['saidas'] / estoque_medio if estoque_medio > 0 else None,
+            cobertura_dias=produto.quantidade_atual / saida_diaria if saida_diaria else None,
+        )
+
+    return {
+        'inicio': inicio,
+        'fim': hoje,
+        'mais_movimentados': mais_movimentados,
+        'curva_abc': curva_abc,
+        'valor_consumido': valor_total,
+        'produtos_com_saida': len(valores),
+    }
@@ -0,0 +1,90 @@
+"""
+Chaves de idempotência (``ChaveIdempotencia``)
+
+O cliente gera uma chave por operação e a reenvia em cada tentativa. Dentro
+da transação da operação, ``reservar_chaves`` insere as chaves ainda não
+vistas; uma chave inserida por outra requisição em andamento faz o INSERT
+esperar até ela terminar. Assim cada chave é processada uma única vez e as
+repetições recebem a resposta guardada por ``gravar_respostas``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChaveIdempotencia
+
+
+TAMANHO_MAXIMO_CHAVE = ChaveIdempotencia._meta.get_field('chave').max_length
+
+
+class ChaveReutilizada(Exception):
+    """A chave já foi usada em uma requisição com outro conteúdo"""
+
+
+def reservar_chaves(usuario, chaves):
+    """
+    Reserva as chaves do usuário; deve ser chamada dentro de uma transação.
+
+    Retorna ``(novas, respondidas)``: o conjunto das chaves que esta
+    transação deve processar e um dict ``{chave: resposta}`` das que já
+    foram processadas antes.
+    """
+    ChaveIdempotencia.objects.bulk_create(
+        [ChaveIdempotencia(usuario=usuario, chave=chave) for chave in chaves],
+        ignore_conflicts=True,
+    )
+    novas, respondidas = set(), {}
+    for chave, resposta in ChaveIdempotencia.objects.filter(
+        usuario=usuario, chave__in=chaves
+    ).values_list('chave', 'resposta'):
+        # Sem resposta: inserida agora, por esta transação
+        if resposta is None:
+            novas.add(chave)
+        else:
+            respondidas[chave] = resposta
+    return novas, respondidas
+
+
+def gravar_respostas(usuario, respostas):
+    """Guarda ``{chave: resposta}`` das chaves reservadas pela transação"""
+    ChaveIdempotencia.objects.bulk_create(
+        [
+            ChaveIdempotencia(usuario=usuario, chave=chave, resposta=resposta)
+            for chave, resposta in respostas.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['usuario', 'chave'],
+        update_fields=['resposta'],
+    )
+
+
+def processar_uma_vez(usuario, chave, impressao, operacao):
+    """
+    Executa ``operacao()`` uma única vez para a chave do usuário.
+
+    A operação roda na transação da reserva e retorna uma resposta
+    serializável em JSON, guardada junto com ``impressao`` (hash do conteúdo
+    da requisição). Retorna ``(resposta, repetida)``; a mesma chave com outra
+    impressão levanta ``ChaveReutilizada``.
+    """
+    with transaction.atomic():
+        novas, respondidas = reservar_chaves(usuario, [chave])
+        if chave not in novas:
+            guardada = respondidas[chave]
+            if guardada.get('impressao') != impressao:
+                raise ChaveReutilizada('Chave de idempotência já usada com outro conteúdo.')
+            return guardada['resposta'], True
+
+        resposta = operacao()
+        gravar_respostas(usuario, {chave: {'impressao': impressao, 'resposta': resposta}})
+    return resposta, False
+
+
+def limpar_chaves(dias=None):
+    """Remove chaves mais antigas que ``IDEMPOTENCIA_VALIDADE_DIAS``"""
+    dias = dias if dias is not None else getattr(settings, 'IDEMPOTENCIA_VALIDADE_DIAS', 7)
+    limite = timezone.now() - timedelta(days=dias)
+    removidas, _ = ChaveIdempotencia.objects.filter(criado_em__lt=limite).delete()
+    return removidas
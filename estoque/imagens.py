@@ -0,0 +1,125 @@
+"""
+Processamento das imagens dos produtos
+
+A foto enviada pelo celular (muitas vezes 4–8 MB) é substituída por uma
+versão de no máximo ``DIMENSAO_MAXIMA`` pixels, girada conforme a
+orientação EXIF e sem os metadados (localização, modelo do aparelho). Em
+seguida são geradas miniaturas WebP e JPEG nas ``LARGURAS_MINIATURA``
+menores que a imagem. Os arquivos recebem o hash do conteúdo no nome, então
+a mesma foto enviada duas vezes não é gravada de novo.
+
+O processamento é uma tarefa da fila (estoque/fila.py), executada pelo
+worker fora da requisição; até terminar, as páginas exibem a original.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .fila import enfileirar
+from .models import Produto, VersaoCatalogo
+
+
+logger = logging.getLogger('estoque.imagens')
+
+DIMENSAO_MAXIMA = 1600
+LARGURAS_MINIATURA = (160, 320, 640, 1280)
+QUALIDADE_JPEG = 85
+QUALIDADE_WEBP = 80
+FORMATOS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+
+def _codificar(imagem, formato):
+    buffer = io.BytesIO()
+    if formato == 'JPEG':
+        imagem.save(buffer, 'JPEG', quality=QUALIDADE_JPEG, optimize=True, progressive=True)
+    else:
+        imagem.save(buffer, formato, quality=QUALIDADE_WEBP, method=4)
+    return buffer.getvalue()
+
+
+def _abrir(arquivo):
+    """Imagem em RGB, já girada conforme o EXIF; transparência vira fundo branco"""
+    with Image.open(arquivo) as original:
+        # JPEG: decodifica já reduzido (1/2, 1/4, 1/8), bem mais rápido
+        original.draft('RGB', (DIMENSAO_MAXIMA, DIMENSAO_MAXIMA))
+        imagem = ImageOps.exif_transpose(original)
+        if imagem.mode in ('RGBA', 'LA', 'P'):
+            imagem = imagem.convert('RGBA')
+            fundo = Image.new('RGB', imagem.size, 'white')
+            fundo.paste(imagem, mask=imagem.getchannel('A'))
+            return fundo
+        return imagem.convert('RGB')
+
+
+def nome_variante(nome, largura, extensao):
+    """``produtos/<hash>.jpg`` -> ``produtos/<hash>-<largura>.<extensao>``"""
+    return f'{nome.rsplit(".", 1)[0]}-{largura}.{extensao}'
+
+
+def _gravar(armazenamento, nome, conteudo):
+    # Nome derivado do conteúdo: um arquivo que já existe é idêntico
+    if not armazenamento.exists(nome):
+        armazenamento.save(nome, ContentFile(conteudo))
+
+
+def processar_imagem(produto_id):
+    """
+    Redimensiona a imagem do produto e gera as miniaturas.
+
+    Retorna False se o produto não tem imagem, se ela já foi processada ou
+    se o arquivo não é uma imagem válida.
+    """
+    produto = Produto.objects.filter(pk=produto_id).only('imagem', 'imagem_variantes').first()
+    if produto is None or not produto.imagem or produto.imagem_variantes:
+        return False
+
+    armazenamento = produto.imagem.storage
+    original = produto.imagem.name
+    try:
+        with armazenamento.open(original) as arquivo:
+            imagem = _abrir(arquivo)
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Imagem inválida no produto %s: %s', produto_id, original)
+        return False
+
+    imagem.thumbnail((DIMENSAO_MAXIMA, DIMENSAO_MAXIMA), Image.Resampling.LANCZOS)
+    principal = _codificar(imagem, 'JPEG')
+    nome = f'produtos/{hashlib.sha256(principal).hexdigest()[:20]}.jpg'
+    _gravar(armazenamento, nome, principal)
+
+    larguras = [largura for largura in LARGURAS_MINIATURA if largura < imagem.width]
+    for largura in larguras:
+        altura = max(1, round(imagem.height * largura / imagem.width))
+        miniatura = imagem.resize((largura, altura), Image.Resampling.LANCZOS)
+        for extensao, formato in FORMATOS.items():
+            _gravar(armazenamento, nome_variante(nome, largura, extensao), _codificar(miniatura, formato))
+
+    variantes = {'largura': imagem.width, 'altura': imagem.height, 'larguras': larguras}
+    # Só troca se a imagem não foi substituída enquanto era processada
+    with transaction.atomic():
+        trocada = Produto.objects.filter(pk=produto_id, imagem=original).update(
+            imagem=nome, imagem_variantes=variantes, atualizado_em=timezone.now(),
+            versao=VersaoCatalogo.proxima(),
+        )
+    if trocada and original != nome:
+        armazenamento.delete(original)
+    return bool(trocada)
+
+
+def agendar_processamento(produto_id):
+    """
+    Enfileira o processamento da imagem (tarefa ``processar_imagem``).
+
+    Com ``IMAGENS_EM_SEGUNDO_PLANO = False`` processa na própria requisição,
+    depois do commit.
+    """
+    if getattr(settings, 'IMAGENS_EM_SEGUNDO_PLANO', True):
+        enfileirar('processar_imagem', produto_id=produto_id)
+    else:
+        transaction.on_commit(lambda: processar_imagem(produto_id))
@@ -0,0 +1,381 @@
+"""
+Importação de produtos em massa a partir de CSV ou XLSX
+
+O arquivo é lido linha a linha e processado em lotes: cada lote é validado
+em memória, categorias e fornecedores são resolvidos por nome em um mapa
+carregado uma única vez e os produtos são gravados com um único
+``bulk_create(update_conflicts=True)`` pelo código (upsert).
+
+Em produtos já existentes, as colunas ausentes do arquivo mantêm o valor
+atual e a quantidade em estoque nunca é alterada (ela só muda por
+movimentações); em produtos novos a quantidade do arquivo é o estoque
+inicial. Linhas inválidas são ignoradas e listadas no relatório de erros.
+"""
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+from decimal import Decimal, InvalidOperation
+from xml.etree.ElementTree import iterparse
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .busca import obter_backend
+from .estatisticas import invalidar_dashboard
+from .models import Categoria, Fornecedor, Produto, VersaoCatalogo, gerar_qr_code
+from .services import travar_produtos
+
+
+# Linhas gravadas por transação
+TAMANHO_LOTE = 2000
+
+# Cabeçalhos aceitos (sem acentos, minúsculos) -> campo do produto.
+# Inclui os cabeçalhos da exportação, para que ela possa ser reimportada.
+COLUNAS = {
+    'codigo': 'codigo',
+    'sku': 'codigo',
+    'nome': 'nome',
+    'descricao': 'descricao',
+    'categoria': 'categoria',
+    'fornecedor': 'fornecedor',
+    'unidade': 'unidade_medida',
+    'unidade medida': 'unidade_medida',
+    'unidade de medida': 'unidade_medida',
+    'quantidade': 'quantidade_atual',
+    'quantidade atual': 'quantidade_atual',
+    'quantidade minima': 'quantidade_minima',
+    'preco custo': 'preco_custo',
+    'preco de custo': 'preco_custo',
+    'preco venda': 'preco_venda',
+    'preco de venda': 'preco_venda',
+    'localizacao': 'localizacao',
+    'qr code': 'qr_code',
+    'ativo': 'ativo',
+}
+
+CAMPOS_DECIMAIS = ['quantidade_atual', 'quantidade_minima', 'preco_custo', 'preco_venda']
+
+# Campos lidos dos produtos existentes e regravados no upsert
+CAMPOS_PRODUTO = [
+    'nome', 'descricao', 'categoria_id', 'fornecedor_id', 'quantidade_atual', 'quantidade_minima',
+    'preco_custo', 'preco_venda', 'unidade_medida', 'localizacao', 'qr_code', 'ativo',
+]
+
+VERDADEIRO = {'1', 'sim', 's', 'true', 'verdadeiro', 'x', 'yes'}
+FALSO = {'0', 'nao', 'n', 'false', 'falso', 'no'}
+
+
+class ArquivoInvalido(Exception):
+    """Arquivo ilegível ou sem as colunas obrigatórias"""
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.lower().replace('_', ' ').split())
+
+
+# Leitura dos arquivos ----------------------------------------------------
+
+def ler_csv(arquivo):
+    """Linhas de um CSV (``;`` ou ``,``), em UTF-8 com ou sem BOM"""
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    amostra = texto.read(4096)
+    texto.seek(0)
+    try:
+        delimitador = csv.Sniffer().sniff(amostra, delimiters=';,\t').delimiter
+    except csv.Error:
+        delimitador = ';'
+    yield from csv.reader(texto, delimiter=delimitador)
+
+
+def _indice_coluna(referencia):
+    """'C12' -> 2"""
+    indice = 0
+    for letra in re.match(r'[A-Z]+', referencia).group():
+        indice = indice * 26 + ord(letra) - 64
+    return indice - 1
+
+
+def ler_xlsx(arquivo):
+    """Linhas da primeira planilha de um XLSX, lidas por streaming"""
+    ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    try:
+        pacote = zipfile.ZipFile(arquivo)
+    except zipfile.BadZipFile:
+        raise ArquivoInvalido('O arquivo não é uma planilha XLSX válida.')
+
+    textos = []
+    if 'xl/sharedStrings.xml' in pacote.namelist():
+        with pacote.open('xl/sharedStrings.xml') as compartilhadas:
+            for _, elemento in iterparse(compartilhadas):
+                if elemento.tag == f'{ns}si':
+                    textos.append(''.join(t.text or '' for t in elemento.iter(f'{ns}t')))
+                    elemento.clear()
+
+    planilhas = sorted(
+        (nome for nome in pacote.namelist() if re.fullmatch(r'xl/worksheets/sheet\d+\.xml', nome)),
+        key=lambda nome: int(re.search(r'\d+', nome).group()),
+    )
+    if not planilhas:
+        raise ArquivoInvalido('A planilha XLSX não contém dados.')
+
+    with pacote.open(planilhas[0]) as planilha:
+        for _, elemento in iterparse(planilha):
+            if elemento.tag != f'{ns}row':
+                continue
+            linha = []
+            for posicao, celula in enumerate(elemento.iter(f'{ns}c')):
+                indice = _indice_coluna(celula.get('r')) if celula.get('r') else posicao
+                tipo = celula.get('t')
+                valor = celula.find(f'{ns}v')
+                if tipo == 'inlineStr':
+                    texto = ''.join(t.text or '' for t in celula.iter(f'{ns}t'))
+                elif valor is None:
+                    texto = ''
+                elif tipo == 's':
+                    texto = textos[int(valor.text)]
+                else:
+                    texto = valor.text or ''
+                linha.extend([''] * (indice + 1 - len(linha)))
+                linha[indice] = texto
+            elemento.clear()
+            yield linha
+
+
+def ler_planilha(arquivo, nome_arquivo):
+    """Escolhe o leitor pela extensão do arquivo"""
+    if nome_arquivo.lower().endswith('.xlsx'):
+        return ler_xlsx(arquivo)
+    if nome_arquivo.lower().endswith('.csv'):
+        return ler_csv(arquivo)
+    raise ArquivoInvalido('Formato não suportado, envie um arquivo .csv ou .xlsx.')
+
+
+# Validação ---------------------------------------------------------------
+
+def _decimal(texto, campo):
+    texto = texto.strip().replace('R$', '').replace(' ', '')
+    if ',' in texto:
+        # Formato brasileiro: 1.234,56
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        valor = Decimal(texto)
+    except InvalidOperation:
+        raise ValidationError('Informe um número.')
+    # Planilhas gravam 12.3 como 12.300000000000001
+    arredondado = round(valor, campo.decimal_places)
+    if abs(valor - arredondado) < Decimal('1e-9'):
+        valor = arredondado
+    return campo.clean(valor, None)
+
+
+def _booleano(texto):
+    texto = _normalizar(texto)
+    if texto in VERDADEIRO:
+        return True
+    if texto in FALSO:
+        return False
+    raise ValidationError('Use sim ou não.')
+
+
+def validar_linha(dados):
+    """
+    Converte os textos de uma linha, retornando ``(valores, erros)``.
+
+    Células vazias ficam fora de ``valores``: mantêm o valor atual do
+    produto ou o padrão do modelo.
+    """
+    valores, erros = {}, {}
+    for nome, texto in dados.items():
+        texto = (texto or '').strip()
+        if not texto:
+            continue
+        try:
+            if nome == 'categoria':
+                valores[nome] = Categoria._meta.get_field('nome').clean(texto, None)
+            elif nome == 'fornecedor':
+                valores[nome] = Fornecedor._meta.get_field('nome').clean(texto, None)
+            elif nome == 'ativo':
+                valores[nome] = _booleano(texto)
+            elif nome in CAMPOS_DECIMAIS:
+                valores[nome] = _decimal(texto, Produto._meta.get_field(nome))
+            else:
+                valores[nome] = Produto._meta.get_field(nome).clean(texto, None)
+        except ValidationError as erro:
+            erros[nome] = erro.messages
+
+    if 'codigo' not in valores and 'codigo' not in erros:
+        erros['codigo'] = ['Este campo é obrigatório.']
+    return valores, erros
+
+
+# Gravação ----------------------------------------------------------------
+
+class _MapaPorNome:
+    """Categorias ou fornecedores por nome, criando os que faltarem"""
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self.ids = {}
+        for pk, nome in modelo.objects.order_by('-pk').values_list('pk', 'nome'):
+            self.ids[_normalizar(nome)] = pk
+
+    def resolver(self, nomes):
+        faltando = {}
+        for nome in nomes:
+            if nome and _normalizar(nome) not in self.ids:
+                faltando.setdefault(_normalizar(nome), nome)
+        if faltando:
+            self.modelo.objects.bulk_create(
+                [self.modelo(nome=nome) for nome in faltando.values()], ignore_conflicts=True
+            )
+            for pk, nome in self.modelo.objects.filter(nome__in=faltando.values()).values_list('pk', 'nome'):
+                self.ids[_normalizar(nome)] = pk
+
+    def __getitem__(self, nome):
+        return self.ids.get(_normalizar(nome)) if nome else None
+
+
+def _gravar_lote(linhas, categorias, fornecedores, resultado):
+    """Valida e grava um lote de ``(numero_linha, valores)``"""
+    # O último valor de um código repetido prevalece, como em gravações sucessivas
+    por_codigo = {}
+    for numero, valores in linhas:
+        por_codigo[valores['codigo']] = (numero, valores)
+
+    with transaction.atomic():
+        existentes = {
+            produto['codigo']: produto
+            for produto in travar_produtos(
+                Produto.objects.filter(codigo__in=por_codigo).order_by()
+            ).values('codigo', *CAMPOS_PRODUTO)
+        }
+
+        # QR codes informados que já pertencem a outro produto
+        informados = {valores['qr_code']: codigo for codigo, (_, valores) in por_codigo.items() if valores.get('qr_code')}
+        em_uso = dict(
+            Produto.objects.filter(qr_code__in=informados).values_list('qr_code', 'codigo')
+        ) if informados else {}
+
+        categorias.resolver(valores.get('categoria') for _, valores in por_codigo.values())
+        fornecedores.resolver(valores.get('fornecedor') for _, valores in por_codigo.values())
+
+        produtos = []
+        for codigo, (numero, valores) in por_codigo.items():
+            atual = existentes.get(codigo)
+            dados = dict(atual) if atual else {'codigo': codigo}
+            dados.update({
+                campo: valor for campo, valor in valores.items()
+                if campo not in ('categoria', 'fornecedor', 'quantidade_atual')
+            })
+            if atual is None and 'quantidade_atual' in valores:
+                dados['quantidade_atual'] = valores['quantidade_atual']
+
+            erros = {}
+            if not dados.get('nome'):
+                erros['nome'] = ['Este campo é obrigatório.']
+            if 'categoria' in valores:
+                dados['categoria_id'] = categorias[valores['categoria']]
+            if not dados.get('categoria_id'):
+                erros['categoria'] = ['Este campo é obrigatório.']
+            if 'fornecedor' in valores:
+                dados['fornecedor_id'] = fornecedores[valores['fornecedor']]
+
+            qr_code = valores.get('qr_code')
+            if qr_code and em_uso.get(qr_code, codigo) != codigo:
+                erros['qr_code'] = [f'Já utilizado pelo produto {em_uso[qr_code]}.']
+            elif qr_code and informados[qr_code] != codigo:
+                erros['qr_code'] = ['Repetido em outra linha do arquivo.']
+
+            if erros:
+                resultado['erros'].append({'linha': numero, 'codigo': codigo, 'erros': erros})
+                continue
+
+            if not dados.get('qr_code'):
+                dados['qr_code'] = gerar_qr_code(codigo)
+            if atual is None:
+                resultado['criados'] += 1
+            else:
+                resultado['atualizados'] += 1
+            produtos.append(Produto(**dados))
+
+        if not produtos:
+            return
+
+        versao = VersaoCatalogo.proxima()
+        for produto in produtos:
+            produto.versao = versao
+        Produto.objects.bulk_create(
+            produtos,
+            update_conflicts=True,
+            unique_fields=['codigo'],
+            update_fields=CAMPOS_PRODUTO + ['atualizado_em', 'versao'],
+        )
+
+        # bulk_create não dispara post_save: índice de busca e dashboard
+        # são atualizados aqui
+        obter_backend().indexar(
+            Produto.objects.filter(codigo__in=[produto.codigo for produto in produtos])
+            .only('id', 'codigo', 'nome', 'qr_code', 'descricao')
+        )
+        transaction.on_commit(invalidar_dashboard)
+
+
+def importar_produtos(linhas, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Importa as linhas de uma planilha (a primeira é o cabeçalho).
+
+    Retorna ``{'criados', 'atualizados', 'erros'}``, com ``erros`` listando
+    ``{'linha', 'codigo', 'erros'}`` das linhas ignoradas. ``progresso``,
+    se informado, é chamado com o número da última linha lida depois de
+    cada lote gravado.
+    """
+    linhas = iter(linhas)
+    try:
+        cabecalho = next(linhas)
+    except StopIteration:
+        raise ArquivoInvalido('O arquivo está vazio.')
+
+    colunas = {}
+    for indice, titulo in enumerate(cabecalho):
+        campo = COLUNAS.get(_normalizar(titulo))
+        if campo and campo not in colunas.values():
+            colunas[indice] = campo
+    if 'codigo' not in colunas.values():
+        raise ArquivoInvalido('O arquivo precisa da coluna "Código".')
+
+    resultado = {'criados': 0, 'atualizados': 0, 'erros': []}
+    categorias = _MapaPorNome(Categoria)
+    fornecedores = _MapaPorNome(Fornecedor)
+
+    lote = []
+    for numero, linha in enumerate(linhas, start=2):
+        if not any((valor or '').strip() for valor in linha):
+            continue
+        dados = {campo: linha[indice] if indice < len(linha) else '' for indice, campo in colunas.items()}
+        valores, erros = validar_linha(dados)
+        if erros:
+            resultado['erros'].append({'linha': numero, 'codigo': dados.get('codigo', ''), 'erros': erros})
+            continue
+        lote.append((numero, valores))
+        if len(lote) >= tamanho_lote:
+            _gravar_lote(lote, categorias, fornecedores, resultado)
+            lote = []
+            if progresso:
+                progresso(numero)
+
+    if lote:
+        _gravar_lote(lote, categorias, fornecedores, resultado)
+
+    resultado['erros'].sort(key=lambda erro: erro['linha'])
+    return resultado
+
+
+def linhas_relatorio(erros):
+    """Uma linha ``(linha, código, campo, mensagem)`` por erro encontrado"""
+    for erro in erros:
+        for campo, mensagens in erro['erros'].items():
+            for mensagem in mensagens:
+                yield erro['linha'], erro['codigo'], campo, mensagem
@@ -0,0 +1,285 @@
+"""
+Inventário físico: abertura, contagem e fechamento
+
+- ``abrir_inventario`` grava a quantidade em sistema de todos os produtos
+  ativos (ou dos filtrados) com um único ``INSERT ... SELECT``, sem trazer
+  os produtos para o Python.
+- ``registrar_contagens`` recebe as leituras dos coletores em lotes; cada
+  contagem atualiza ``quantidade_sistema`` para o saldo do momento, então
+  movimentações feitas durante o inventário não viram divergência.
+- ``fechar_inventario`` aplica as diferenças ao estoque atual em uma
+  transação: um ``bulk_create`` dos ajustes e um único ``UPDATE`` nos
+  produtos. Itens não contados não geram ajuste.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import InventarioFisico, ItemInventario, MovimentacaoEstoque, Produto, VersaoCatalogo
+from .services import LIMITE_LOTE, notificar_movimentacoes, travar_produtos
+
+
+# Movimentações de ajuste gravadas por INSERT no fechamento
+TAMANHO_LOTE = 2000
+
+
+class InventarioEncerrado(Exception):
+    """O inventário não está em andamento"""
+
+
+def produtos_do_inventario(categoria=None, fornecedor=None, localizacao=None):
+    """Produtos ativos que entram no inventário, pelos filtros informados"""
+    produtos = Produto.objects.filter(ativo=True)
+    if categoria:
+        produtos = produtos.filter(categoria=categoria)
+    if fornecedor:
+        produtos = produtos.filter(fornecedor=fornecedor)
+    if localizacao:
+        produtos = produtos.filter(localizacao__istartswith=localizacao)
+    return produtos.order_by()
+
+
+def abrir_inventario(nome, usuario, descricao=None, **filtros):
+    """
+    Cria o inventário já em andamento, com um item por produto selecionado.
+
+    ``filtros`` são os de ``produtos_do_inventario``. Retorna o inventário e
+    o número de itens gerados.
+    """
+    produtos = produtos_do_inventario(**filtros).values('id', 'quantidade_atual')
+    sql, params = produtos.query.sql_with_params()
+
+    campo = ItemInventario._meta.get_field
+    nome_coluna = connection.ops.quote_name
+    colunas = ', '.join(nome_coluna(campo(nome_campo).column) for nome_campo in (
+        'inventario', 'produto', 'quantidade_sistema', 'diferenca'
+    ))
+
+    with transaction.atomic():
+        inventario = InventarioFisico.objects.create(
+            nome=nome,
+            descricao=descricao,
+            status='EM_ANDAMENTO',
+            data_inicio=timezone.now(),
+            criado_por=usuario,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {nome_coluna(ItemInventario._meta.db_table)} ({colunas}) '
+                f'SELECT %s, produtos.id, produtos.quantidade_atual, 0 FROM ({sql}) produtos',
+                [inventario.pk, *params],
+            )
+            total = cursor.rowcount
+
+    return inventario, total
+
+
+def _quantidade(valor):
+    try:
+        quantidade = Decimal(str(valor).replace(',', '.'))
+    except (InvalidOperation, ValueError):
+        return None
+    if not quantidade.is_finite() or quantidade < 0:
+        return None
+    return quantidade.quantize(Decimal('0.01'))
+
+
+def registrar_contagens(inventario, contagens, usuario):
+    """
+    Grava uma lista de contagens no inventário em uma única transação.
+
+    Cada contagem é um dict com ``produto`` (código ou QR code),
+    ``quantidade`` e, opcionalmente, ``somar`` (soma à contagem anterior em
+    vez de substituí-la, para leituras unidade a unidade) e ``observacao``.
+    Retorna o resultado de cada linha, na ordem recebida.
+    """
+    if len(contagens) > LIMITE_LOTE:
+        raise ValueError(f'O lote aceita no máximo {LIMITE_LOTE} contagens.')
+
+    resultados = []
+    validas = []
+    for linha, contagem in enumerate(contagens, start=1):
+        if not isinstance(contagem, dict):
+            resultados.append({'linha': linha, 'status': 'erro', 'erros': ['Contagem inválida.']})
+            continue
+
+        resultado = {'linha': linha, 'produto': contagem.get('produto'), 'status': 'erro'}
+        resultados.append(resultado)
+
+        quantidade = _quantidade(contagem.get('quantidade'))
+        erros = []
+        if not contagem.get('produto'):
+            erros.append('Informe o código ou QR code do produto.')
+        if quantidade is None:
+            erros.append('Quantidade deve ser um número maior ou igual a zero.')
+
+        if erros:
+            resultado['erros'] = erros
+        else:
+            validas.append((resultado, str(contagem['produto']), quantidade, contagem))
+
+    if not validas:
+        return resultados
+
+    referencias = {referencia for _, referencia, _, _ in validas}
+    agora = timezone.now()
+
+    with transaction.atomic():
+        if not InventarioFisico.objects.filter(pk=inventario.pk, status='EM_ANDAMENTO').exists():
+            raise InventarioEncerrado('O inventário não está em andamento.')
+
+        # Produtos buscados antes pelos índices de código e QR code; filtrar
+        # os itens pelo produto relacionado obrigaria a varrer o inventário.
+        # Bloqueados até o commit, como numa movimentação: a quantidade do
+        # sistema copiada para o item não pode mudar antes de ser gravada
+        produtos = travar_produtos(Produto.objects.filter(
+            Q(codigo__in=referencias) | Q(qr_code__in=referencias)
+        )).only('id', 'codigo', 'qr_code', 'quantidade_atual').order_by('pk')
+        por_id = {produto.pk: produto for produto in produtos}
+
+        # No SQLite travar_produtos já tomou o lock de escrita do banco
+        itens = list(ItemInventario.objects.filter(
+            inventario=inventario, produto_id__in=por_id
+        ).select_for_update())
+
+        por_referencia = {}
+        for item in itens:
+            item.produto = por_id[item.produto_id]
+            if item.produto.qr_code:
+                por_referencia[item.produto.qr_code] = item
+        for item in itens:
+            # O código tem prioridade sobre um QR code igual de outro produto
+            por_referencia[item.produto.codigo] = item
+
+        alterados = {}
+        for resultado, referencia, quantidade, contagem in validas:
+            item = por_referencia.get(referencia)
+            if item is None:
+                resultado['erros'] = ['Produto não faz parte deste inventário.']
+                continue
+
+            if contagem.get('somar') and item.quantidade_contada is not None:
+                quantidade += item.quantidade_contada
+            item.quantidade_contada = quantidade
+            item.quantidade_sistema = item.produto.quantidade_atual
+            item.diferenca = quantidade - item.quantidade_sistema
+            item.contado_em = agora
+            item.contado_por = usuario
+            if contagem.get('observacao'):
+                item.observacao = contagem['observacao']
+            alterados[item.pk] = item
+
+            resultado['status'] = 'ok'
+            resultado['quantidade_contada'] = quantidade
+            resultado['quantidade_sistema'] = item.quantidade_sistema
+            resultado['diferenca'] = item.diferenca
+
+        # Upsert em vez de bulk_update: o CASE WHEN por linha do bulk_update
+        # custa mais para montar em Python do que para o banco executar
+        ItemInventario.objects.bulk_create(
+            alterados.values(),
+            update_conflicts=True,
+            unique_fields=['inventario', 'produto'],
+            update_fields=[
+                'quantidade_sistema', 'quantidade_contada', 'diferenca',
+                'contado_em', 'contado_por', 'observacao',
+            ],
+        )
+
+    return resultados
+
+
+def fechar_inventario(inventario, usuario, progresso=None):
+    """
+    Conclui o inventário aplicando as diferenças contadas ao estoque.
+
+    Cada produto divergente recebe um AJUSTE de ``quantidade_atual`` para
+    ``quantidade_atual + diferenca`` (nunca abaixo de zero). Retorna o
+    número de ajustes gravados. ``progresso``, se informado, é chamado com
+    os itens lidos e o total a cada ``TAMANHO_LOTE`` itens.
+    """
+    agora = timezone.now()
+
+    with transaction.atomic():
+        # O UPDATE condicional bloqueia o inventário e impede fechar duas vezes
+        if not InventarioFisico.objects.filter(pk=inventario.pk, status='EM_ANDAMENTO').update(
+            status='CONCLUIDO', data_fim=agora, realizado_por=usuario, atualizado_em=agora,
+        ):
+            raise InventarioEncerrado('O inventário não está em andamento.')
+
+        divergentes = ItemInventario.objects.filter(
+            inventario=inventario, quantidade_contada__isnull=False
+        ).exclude(diferenca=0)
+        produtos = Produto.objects.filter(pk__in=divergentes.values('produto_id'), ativo=True)
+        atuais = dict(travar_produtos(produtos).values_list('id', 'quantidade_atual').order_by())
+
+        movimentacoes = []
+        for lidos, (produto_id, diferenca) in enumerate(
+            divergentes.values_list('produto_id', 'diferenca').iterator(chunk_size=TAMANHO_LOTE), start=1
+        ):
+            if progresso and lidos % TAMANHO_LOTE == 0:
+                progresso(lidos, len(atuais))
+            if produto_id not in atuais:
+                continue
+            quantidade_anterior = atuais[produto_id]
+            nova_quantidade = max(quantidade_anterior + diferenca, Decimal(0))
+            if nova_quantidade == quantidade_anterior:
+                continue
+            movimentacoes.append(MovimentacaoEstoque(
+                produto_id=produto_id,
+                tipo='AJUSTE',
+                quantidade=abs(nova_quantidade - quantidade_anterior),
+                quantidade_anterior=quantidade_anterior,
+                quantidade_atual=nova_quantidade,
+                motivo=f'Inventário: {inventario.nome}'[:200],
+                documento=f'INV-{inventario.pk}',
+                usuario=usuario,
+                data_movimentacao=agora,
+            ))
+
+        # Depois da leitura dos itens: segura o contador só durante as gravações
+        versao = VersaoCatalogo.proxima()
+        for movimentacao in movimentacoes:
+            movimentacao.versao = versao
+        MovimentacaoEstoque.objects.bulk_create(movimentacoes, batch_size=TAMANHO_LOTE)
+        diferenca = ItemInventario.objects.filter(
+            inventario=inventario, produto=OuterRef('pk')
+        ).values('diferenca')
+        produtos.update(
+            quantidade_atual=Greatest(F('quantidade_atual') + Subquery(diferenca), Value(Decimal(0))),
+            atualizado_em=agora,
+            versao=versao,
+        )
+        notificar_movimentacoes(movimentacoes)
+
+    inventario.status = 'CONCLUIDO'
+    inventario.data_fim = agora
+    inventario.realizado_por = usuario
+    return len(movimentacoes)
+
+
+def cancelar_inventario(inventario):
+    """Cancela um inventário ainda não concluído, sem alterar o estoque"""
+    if not InventarioFisico.objects.filter(
+        pk=inventario.pk, status__in=['PLANEJADO', 'EM_ANDAMENTO']
+    ).update(status='CANCELADO', atualizado_em=timezone.now()):
+        raise InventarioEncerrado('O inventário já foi concluído ou cancelado.')
+    inventario.status = 'CANCELADO'
+
+
+def resumo_inventario(inventario):
+    """Totais de itens, contados e divergentes e o valor das diferenças a custo"""
+    contados = Q(quantidade_contada__isnull=False)
+    resumo = inventario.itens.aggregate(
+        total=Count('id'),
+        contados=Count('id', filter=contados),
+        divergentes=Count('id', filter=contados & ~Q(diferenca=0)),
+        valor_diferencas=Sum(F('diferenca') * F('produto__preco_custo'), filter=contados),
+    )
+    resumo['pendentes'] = resumo['total'] - resumo['contados']
+    resumo['valor_diferencas'] = resumo['valor_diferencas'] or 0
+    resumo['progresso'] = round(resumo['contados'] * 100 / resumo['total']) if resumo['total'] else 0
+    return resumo
@@ -0,0 +1,92 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from estoque.benchmark import percentil
+from estoque.busca import obter_backend
+from estoque.dados_sinteticos import gerar_produtos
+from estoque.models import Produto
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência (p50/p95) da busca de produtos da lista e do HTMX'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--popular', type=int, default=0, metavar='N',
+            help='Insere N produtos sintéticos e reindexa antes de medir (use um banco descartável)'
+        )
+        parser.add_argument('--consultas', type=int, default=200, help='Número de termos buscados')
+        parser.add_argument('--semente', type=int, default=42, help='Semente dos termos sorteados')
+        parser.add_argument(
+            '--comparar', action='store_true',
+            help='Mede também a busca por icontains (estoque.busca.BuscaSimples)'
+        )
+
+    def handle(self, *args, **options):
+        if options['popular']:
+            self.stdout.write(f'📦 Gerando {options["popular"]} produtos...')
+            gerar_produtos(options['popular'])
+            obter_backend().reindexar()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        termos = self.sortear_termos(options['consultas'], options['semente'])
+        if not termos:
+            raise CommandError('Nenhum produto cadastrado. Use --popular para gerar dados.')
+
+        self.stdout.write(f'🔎 {Produto.objects.count()} produtos, {len(termos)} termos, banco {connection.vendor}')
+        backends = [obter_backend()]
+        if options['comparar']:
+            backends.append(import_string('estoque.busca.BuscaSimples')())
+
+        for backend in backends:
+            self.medir(backend, termos)
+
+    def sortear_termos(self, quantidade, semente):
+        """Prefixos de códigos, palavras do nome e QR codes completos de produtos reais"""
+        aleatorio = random.Random(semente)
+        ultimo = Produto.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if ultimo is None:
+            return []
+        amostra = Produto.objects.filter(
+            pk__in=[aleatorio.randint(1, ultimo) for _ in range(quantidade * 2)]
+        ).values_list('codigo', 'nome', 'qr_code')[:quantidade]
+
+        termos = []
+        for indice, (codigo, nome, qr_code) in enumerate(amostra):
+            escolha = indice % 3
+            if escolha == 0:
+                termos.append(codigo[:max(2, len(codigo) - 2)])
+            elif escolha == 1:
+                palavras = nome.split()
+                termos.append(' '.join(palavras[:2])[:-1] if len(palavras) > 1 else nome[:3])
+            else:
+                termos.append(qr_code or codigo)
+        return termos
+
+    def medir(self, backend, termos):
+        ativos = Produto.objects.filter(ativo=True).select_related('categoria', 'fornecedor')
+        tempos = {'buscar_produtos_htmx': [], 'produto_list': []}
+
+        for termo in termos:
+            inicio = time.perf_counter()
+            list(backend.ranquear(Produto.objects.filter(ativo=True), termo)[:10])
+            tempos['buscar_produtos_htmx'].append(time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            resultado = backend.filtrar(ativos, termo).order_by('nome')
+            resultado.count()
+            list(resultado[:20])
+            tempos['produto_list'].append(time.perf_counter() - inicio)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(type(backend).__name__))
+        for view, valores in tempos.items():
+            self.stdout.write(
+                f'  {view:<22} p50 {percentil(valores, 50) * 1000:8.2f} ms   '
+                f'p95 {percentil(valores, 95) * 1000:8.2f} ms   '
+                f'máx {max(valores) * 1000:8.2f} ms'
+            )
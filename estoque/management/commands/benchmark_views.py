@@ -0,0 +1,104 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from estoque.benchmark import Benchmark, comparar
+from estoque.models import MovimentacaoEstoque, Produto
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede consultas, latência p50/p95 e memória das views principais '
+        '(gere os dados antes com gerar_dados_sinteticos)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=30, help='Requisições medidas por cenário')
+        parser.add_argument('--aquecimento', type=int, default=3, help='Requisições descartadas por cenário')
+        parser.add_argument('--semente', type=int, default=42, help='Semente dos parâmetros sorteados')
+        parser.add_argument(
+            '--cenario', action='append', choices=Benchmark.CENARIOS,
+            help='Mede apenas este cenário (pode ser repetido)'
+        )
+        parser.add_argument('--saida', metavar='ARQUIVO.json', help='Grava os resultados em JSON')
+        parser.add_argument(
+            '--comparar', metavar='ARQUIVO.json',
+            help='Compara com um resultado anterior e falha se algum cenário piorar'
+        )
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.25,
+            help='Piora relativa aceita no p50 e na memória na comparação (padrão 0.25)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = Benchmark(options['semente'])
+        except ValueError as erro:
+            raise CommandError(f'{erro} Rode antes: manage.py gerar_dados_sinteticos')
+
+        ambiente = {
+            'commit': self.commit_atual(),
+            'data': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'produtos': Produto.objects.count(),
+            'movimentacoes': MovimentacaoEstoque.objects.count(),
+            'repeticoes': options['repeticoes'],
+            'semente': options['semente'],
+        }
+        self.stdout.write(
+            f'⏱️  {ambiente["produtos"]} produtos, {ambiente["movimentacoes"]} movimentações, '
+            f'banco {ambiente["banco"]}, commit {ambiente["commit"] or "?"}'
+        )
+
+        resultados = benchmark.executar(options['cenario'], options['repeticoes'], options['aquecimento'])
+
+        self.stdout.write(f'  {"cenário":<28}{"consultas":>10}{"p50 ms":>10}{"p95 ms":>10}{"máx ms":>10}{"memória KB":>12}')
+        for cenario, metricas in resultados.items():
+            self.stdout.write(
+                f'  {cenario:<28}{metricas["consultas"]:>10}{metricas["p50_ms"]:>10.2f}'
+                f'{metricas["p95_ms"]:>10.2f}{metricas["max_ms"]:>10.2f}{metricas["memoria_kb"]:>12}'
+            )
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump({'ambiente': ambiente, 'resultados': resultados}, arquivo, indent=2)
+            self.stdout.write(f'📄 Resultados gravados em {options["saida"]}')
+
+        if options['comparar']:
+            self.comparar(resultados, options['comparar'], options['tolerancia'])
+
+    def comparar(self, resultados, caminho, tolerancia):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler {caminho}: {erro}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Comparação com o commit {anterior["ambiente"].get("commit") or "?"}'
+        ))
+        pioras = 0
+        for cenario, metrica, antes, depois, variacao, piorou in comparar(
+            resultados, anterior['resultados'], tolerancia
+        ):
+            linha = f'  {cenario:<28}{metrica:<12}{antes:>10} → {depois:<10}{variacao:+.0%}'
+            if piorou:
+                pioras += 1
+                self.stdout.write(self.style.ERROR(linha))
+            else:
+                self.stdout.write(linha)
+
+        if pioras:
+            raise CommandError(f'{pioras} métricas pioraram além da tolerância.')
+        self.stdout.write(self.style.SUCCESS('✅ Nenhuma piora além da tolerância'))
+
+    def commit_atual(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
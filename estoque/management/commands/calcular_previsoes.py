@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from estoque.previsao import calcular_previsoes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a previsão de demanda e o ponto de pedido sugerido dos produtos (rodar todas as noites)'
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        produtos = calcular_previsoes()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Previsões de {produtos} produtos calculadas em {time.perf_counter() - inicio:.1f}s'
+        ))
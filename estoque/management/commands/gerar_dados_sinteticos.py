@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from estoque.busca import obter_backend
+from estoque.dados_sinteticos import gerar_catalogo
+from estoque.estatisticas import invalidar_dashboard
+from estoque.giro import reconstruir_resumo
+from estoque.valorizacao import gerar_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Gera um catálogo sintético reproduzível (use um banco descartável) para testes de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categorias', type=int, default=10)
+        parser.add_argument('--fornecedores', type=int, default=20)
+        parser.add_argument('--produtos', type=int, default=1000)
+        parser.add_argument('--movimentacoes', type=int, default=10000)
+        parser.add_argument('--dias', type=int, default=90, help='Período coberto pelas movimentações')
+        parser.add_argument('--semente', type=int, default=42, help='Mesma semente, mesmos dados')
+        parser.add_argument('--prefixo', help='Prefixo dos códigos (padrão: aleatório)')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        self.stdout.write(
+            f'📦 Gerando {options["produtos"]} produtos e {options["movimentacoes"]} movimentações...'
+        )
+        prefixo = gerar_catalogo(
+            categorias=options['categorias'],
+            fornecedores=options['fornecedores'],
+            produtos=options['produtos'],
+            movimentacoes=options['movimentacoes'],
+            dias=options['dias'],
+            semente=options['semente'],
+            prefixo=options['prefixo'],
+        )
+
+        # Inserções em lote não disparam os signals dos produtos
+        obter_backend().reindexar()
+        gerar_snapshot()
+        reconstruir_resumo()
+        invalidar_dashboard()
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Catálogo {prefixo} gerado em {time.perf_counter() - inicio:.1f}s'
+        ))
@@ -0,0 +1,46 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from estoque.importacao import (
+    ArquivoInvalido, TAMANHO_LOTE, importar_produtos, ler_planilha, linhas_relatorio
+)
+
+
+class Command(BaseCommand):
+    help = 'Importa produtos de um arquivo CSV ou XLSX, criando ou atualizando pelo código'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .xlsx')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Linhas gravadas por transação')
+        parser.add_argument('--erros', metavar='ARQUIVO.csv', help='Grava o relatório de erros neste arquivo')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar_produtos(
+                    ler_planilha(arquivo, options['arquivo']), tamanho_lote=options['lote']
+                )
+        except (OSError, ArquivoInvalido) as erro:
+            raise CommandError(str(erro))
+        duracao = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {resultado["criados"]} produtos criados e {resultado["atualizados"]} atualizados '
+            f'em {duracao:.1f}s'
+        ))
+        if not resultado['erros']:
+            return
+
+        self.stdout.write(self.style.WARNING(f'⚠️ {len(resultado["erros"])} linhas ignoradas'))
+        if options['erros']:
+            with open(options['erros'], 'w', newline='', encoding='utf-8-sig') as relatorio:
+                escritor = csv.writer(relatorio, delimiter=';')
+                escritor.writerow(['Linha', 'Código', 'Campo', 'Erro'])
+                escritor.writerows(linhas_relatorio(resultado['erros']))
+            self.stdout.write(f'📄 Relatório de erros em {options["erros"]}')
+        else:
+            for linha, codigo, campo, mensagem in list(linhas_relatorio(resultado['erros']))[:20]:
+                self.stdout.write(f'   linha {linha} ({codigo or "sem código"}) {campo}: {mensagem}')
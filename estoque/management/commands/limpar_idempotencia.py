@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from estoque.idempotencia import limpar_chaves
+
+
+class Command(BaseCommand):
+    help = 'Remove as chaves de idempotência antigas (rodar diariamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int,
+            help='Idade mínima das chaves removidas (padrão: IDEMPOTENCIA_VALIDADE_DIAS)'
+        )
+
+    def handle(self, *args, **options):
+        removidas = limpar_chaves(options['dias'])
+        self.stdout.write(self.style.SUCCESS(f'✅ {removidas} chaves de idempotência removidas'))
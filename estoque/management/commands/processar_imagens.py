@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from estoque.imagens import processar_imagem
+from estoque.models import Produto
+
+
+class Command(BaseCommand):
+    help = 'Redimensiona e gera as miniaturas das imagens de produtos ainda não processadas'
+
+    def handle(self, *args, **options):
+        pendentes = Produto.objects.exclude(imagem='').exclude(imagem__isnull=True).filter(
+            imagem_variantes={}
+        ).values_list('pk', flat=True)
+
+        processadas = ignoradas = 0
+        for produto_id in pendentes.iterator():
+            if processar_imagem(produto_id):
+                processadas += 1
+            else:
+                ignoradas += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {processadas} imagens processadas'))
+        if ignoradas:
+            self.stdout.write(self.style.WARNING(f'⚠️ {ignoradas} imagens ignoradas (inválidas ou alteradas)'))
@@ -0,0 +1,92 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from estoque.fila import executar_pendentes
+
+
+def _executar_thread(parar, intervalo, uma_vez, executadas):
+    try:
+        executadas.append(executar_pendentes(parar, intervalo, uma_vez))
+    finally:
+        # Cada thread abre as próprias conexões com o banco
+        connections.close_all()
+
+
+def _executar_processo(threads, intervalo, uma_vez):
+    """Um processo do worker com ``threads`` laços de execução"""
+    parar = threading.Event()
+    # SIGTERM/SIGINT: termina a tarefa em andamento e para
+    anteriores = {
+        sinal: signal.signal(sinal, lambda *args: parar.set())
+        for sinal in (signal.SIGTERM, signal.SIGINT)
+    }
+    try:
+        if threads == 1:
+            return executar_pendentes(parar, intervalo, uma_vez)
+
+        executadas = []
+        workers = [
+            threading.Thread(
+                target=_executar_thread, args=(parar, intervalo, uma_vez, executadas),
+                name=f'worker-{indice}',
+            )
+            for indice in range(1, threads + 1)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(executadas)
+    finally:
+        for sinal, tratador in anteriores.items():
+            signal.signal(sinal, tratador)
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas da fila (imagens, fechamento de inventário...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=1, help='Processos do worker (padrão 1)')
+        parser.add_argument('--threads', type=int, default=1, help='Threads por processo (padrão 1)')
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0,
+            help='Segundos entre as consultas à fila quando ela está vazia'
+        )
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Executa as tarefas prontas e termina (para cron e testes)'
+        )
+
+    def handle(self, *args, **options):
+        processos = max(1, options['processos'])
+        threads = max(1, options['threads'])
+        argumentos = (threads, options['intervalo'], options['uma_vez'])
+
+        self.stdout.write(f'⚙️ Worker com {processos} processo(s) x {threads} thread(s)')
+        if processos == 1:
+            executadas = _executar_processo(*argumentos)
+            self.stdout.write(self.style.SUCCESS(f'✅ {executadas} tarefas executadas'))
+            return
+
+        # As conexões não podem ser herdadas pelos processos filhos
+        connections.close_all()
+        filhos = [
+            multiprocessing.Process(target=_executar_processo, args=argumentos, name=f'worker-{indice}')
+            for indice in range(1, processos + 1)
+        ]
+        for filho in filhos:
+            filho.start()
+
+        def encerrar(*args):
+            for filho in filhos:
+                filho.terminate()
+        for sinal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sinal, encerrar)
+
+        for filho in filhos:
+            filho.join()
+        self.stdout.write(self.style.SUCCESS('✅ Worker encerrado'))
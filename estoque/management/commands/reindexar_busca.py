@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from estoque.busca import obter_backend
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca de produtos (necessário após inserções em lote)'
+
+    def handle(self, *args, **options):
+        backend = obter_backend()
+        backend.reindexar()
+        self.stdout.write(self.style.SUCCESS(f'✅ Índice de busca reconstruído ({type(backend).__name__})'))
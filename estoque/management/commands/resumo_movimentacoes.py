@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from estoque.giro import reconstruir_resumo
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o resumo diário das movimentações (relatório de giro) a partir do histórico'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', metavar='AAAA-MM-DD', help='Primeiro dia (padrão: todo o histórico)')
+        parser.add_argument('--fim', metavar='AAAA-MM-DD', help='Último dia (padrão: hoje)')
+
+    def handle(self, *args, **options):
+        try:
+            inicio = date.fromisoformat(options['inicio']) if options['inicio'] else None
+            fim = date.fromisoformat(options['fim']) if options['fim'] else None
+        except ValueError:
+            raise CommandError('Data inválida, use o formato AAAA-MM-DD.')
+
+        linhas = reconstruir_resumo(inicio, fim)
+        self.stdout.write(self.style.SUCCESS(f'✅ Resumo diário recalculado: {linhas} linhas'))
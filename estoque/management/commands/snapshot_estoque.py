@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from estoque.valorizacao import gerar_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o snapshot diário do valor do estoque (total, por categoria e por fornecedor)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--data', metavar='AAAA-MM-DD',
+            help='Dia do snapshot (padrão: hoje). Usa as quantidades atuais dos produtos.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            data = date.fromisoformat(options['data']) if options['data'] else None
+        except ValueError:
+            raise CommandError('Data inválida, use o formato AAAA-MM-DD.')
+
+        linhas = gerar_snapshot(data)
+        total = next(linha for linha in linhas if linha.dimensao == 'TOTAL')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Snapshot de {total.data}: {len(linhas)} linhas, '
+            f'{total.total_produtos} produtos, custo R$ {total.valor_custo:.2f}, '
+            f'venda R$ {total.valor_venda:.2f}'
+        ))
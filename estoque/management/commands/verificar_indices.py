@@ -0,0 +1,106 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from estoque.dados_sinteticos import gerar_produtos, gerar_movimentacoes
+from estoque.filtros import filtrar_movimentacoes, filtrar_produtos
+from estoque.models import Produto, MovimentacaoEstoque
+from estoque.paginacao import depois_de
+
+
+# Tabelas que crescem com o uso e não podem ser lidas por inteiro
+TABELAS_GRANDES = {Produto._meta.db_table, MovimentacaoEstoque._meta.db_table}
+
+SCAN_SEQUENCIAL = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! USING)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Executa EXPLAIN nas consultas das views principais e falha se alguma fizer leitura sequencial'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--popular', type=int, default=0, metavar='N',
+            help='Insere N produtos e N movimentações sintéticos antes da verificação (use um banco descartável)'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=5000,
+            help='Tamanho dos lotes de inserção (padrão: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        padrao = SCAN_SEQUENCIAL.get(connection.vendor)
+        if padrao is None:
+            raise CommandError(f'Banco "{connection.vendor}" não suportado.')
+
+        if options['popular']:
+            self.popular(options['popular'], options['lote'])
+
+        produto = Produto.objects.filter(ativo=True).order_by().first()
+        if produto is None:
+            raise CommandError('Nenhum produto cadastrado. Use --popular para gerar dados.')
+
+        self.stdout.write(f'🔎 Verificando consultas em {connection.vendor} '
+                          f'({Produto.objects.count()} produtos, '
+                          f'{MovimentacaoEstoque.objects.count()} movimentações)')
+
+        falhas = []
+        for nome, queryset in self.consultas(produto):
+            plano = queryset.explain()
+            tabelas = set(padrao.findall(plano)) & TABELAS_GRANDES
+            if tabelas:
+                falhas.append(nome)
+                self.stdout.write(self.style.ERROR(f'❌ {nome}: leitura sequencial em {", ".join(sorted(tabelas))}'))
+                self.stdout.write(plano)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'✅ {nome}'))
+
+        if falhas:
+            raise CommandError(f'{len(falhas)} consulta(s) sem índice adequado: {", ".join(falhas)}')
+
+    def consultas(self, produto):
+        """Consultas das views, na forma em que são executadas"""
+        baixo_estoque = Produto.objects.filter(
+            ativo=True,
+            abaixo_minimo=True
+        )
+        produtos, _ = filtrar_produtos({})
+        movimentacoes, _ = filtrar_movimentacoes({})
+        por_produto, _ = filtrar_movimentacoes({'produto': produto.pk})
+        por_tipo, _ = filtrar_movimentacoes({'tipo': 'SAIDA'})
+
+        return [
+            ('buscar_qr', Produto.objects.filter(qr_code=produto.qr_code, ativo=True)),
+            ('produto_list', produtos[:21]),
+            ('produto_list (próxima página)', self.proxima_pagina(produtos, 20)),
+            ('produto_detail (histórico)', produto.movimentacoes.select_related(
+                'usuario').order_by('-data_movimentacao')[:20]),
+            ('dashboard (produtos em alerta)', baixo_estoque[:5]),
+            ('dashboard (últimas movimentações)', MovimentacaoEstoque.objects.select_related(
+                'produto', 'usuario').order_by('-data_movimentacao')[:10]),
+            ('estoque_baixo', baixo_estoque.select_related('categoria')),
+            ('movimentacao_list', movimentacoes[:31]),
+            ('movimentacao_list (próxima página)', self.proxima_pagina(movimentacoes, 30)),
+            ('movimentacao_list (produto)', self.proxima_pagina(por_produto, 30)),
+            ('movimentacao_list (tipo)', self.proxima_pagina(por_tipo, 30)),
+        ]
+
+    def proxima_pagina(self, queryset, por_pagina):
+        """Página seguinte da paginação por cursor, a partir do primeiro registro"""
+        ordenacao = queryset.query.order_by
+        valores = queryset.values_list(*[ordem.lstrip('-') for ordem in ordenacao]).first()
+        if valores is None:
+            return queryset[:por_pagina + 1]
+        return queryset.filter(depois_de(ordenacao, list(valores)))[:por_pagina + 1]
+
+    def popular(self, total, lote):
+        """Gera produtos e movimentações sintéticos com inserções em lote"""
+        self.stdout.write(f'📦 Gerando {total} produtos e {total} movimentações...')
+        prefixo = gerar_produtos(total, lote)
+        gerar_movimentacoes(Produto.objects.filter(codigo__startswith=f'{prefixo}-'), lote)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
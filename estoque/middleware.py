@@ -0,0 +1,194 @@
+"""
+Instrumentação por requisição: consultas SQL, tempos e detecção de N+1
+
+Para cada requisição são medidos o número e o tempo total das consultas,
+o tempo de renderização dos templates, o tempo da view e o total. Consultas
+iguais a menos dos parâmetros são agrupadas por "impressão digital"; uma
+mesma consulta repetida muitas vezes costuma indicar um N+1.
+
+O resultado vai para o log ``estoque.instrumentacao`` (uma linha JSON por
+requisição) e para o cabeçalho ``Server-Timing``, que o DevTools do
+navegador exibe. Respostas em streaming só contam o que foi executado
+antes do envio começar. O tempo dos templates é medido pelo backend
+``TemplatesInstrumentados`` (``TEMPLATES`` em settings.py).
+
+Settings:
+
+- ``INSTRUMENTACAO_ATIVA``: liga o middleware (padrão: ``DEBUG``).
+- ``INSTRUMENTACAO_SERVER_TIMING``: envia o cabeçalho (padrão: ``DEBUG``),
+  que expõe os tempos a qualquer cliente.
+- ``INSTRUMENTACAO_LIMITE_REPETICOES``: repetições de uma consulta a partir
+  das quais ela é apontada como N+1 (padrão 5).
+- ``INSTRUMENTACAO_ORCAMENTO_CONSULTAS``: dicionário ``{nome_da_url: máximo}``,
+  com ``'*'`` valendo para as demais views.
+- ``INSTRUMENTACAO_FALHAR_ORCAMENTO``: levanta ``OrcamentoConsultasExcedido``
+  quando uma view passa do orçamento (usado nos testes).
+"""
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+logger = logging.getLogger('estoque.instrumentacao')
+
+_medicao_atual = contextvars.ContextVar('medicao_atual', default=None)
+
+# Comandos que se repetem em qualquer requisição com transações aninhadas
+CONTROLE_TRANSACAO = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+class OrcamentoConsultasExcedido(Exception):
+    """A view executou mais consultas do que o orçamento configurado"""
+
+
+def impressao_digital(sql):
+    """SQL sem os valores, para agrupar consultas que só mudam nos parâmetros"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'%s|\?', '?', sql)
+    sql = re.sub(r'\((?:\s*\?\s*,)+\s*\?\s*\)', '(...)', sql)
+    return ' '.join(sql.split())
+
+
+class Medicao:
+    """Números coletados durante uma requisição"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.inicio_view = None
+        self.tempo_view = 0.0
+        self.tempo_sql = 0.0
+        self.tempo_templates = 0.0
+        self.consultas = Counter()
+        self._renderizando = False
+
+    def registrar_consulta(self, executar, sql, params, many, contexto):
+        inicio = time.perf_counter()
+        try:
+            return executar(sql, params, many, contexto)
+        finally:
+            self.tempo_sql += time.perf_counter() - inicio
+            self.consultas[impressao_digital(sql)] += 1
+
+    @property
+    def total_consultas(self):
+        return sum(self.consultas.values())
+
+    def repetidas(self, limite):
+        return [
+            (sql, vezes) for sql, vezes in self.consultas.most_common()
+            if vezes >= limite and not sql.upper().startswith(CONTROLE_TRANSACAO)
+        ]
+
+
+class TemplateMedido(Template):
+    """Template do backend do Django que soma o tempo de ``render`` à medição atual"""
+
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        # Templates renderizados dentro de outro (ex.: render_to_string em
+        # uma tag) já entram no tempo do template externo
+        if medicao is None or medicao._renderizando:
+            return super().render(context, request)
+        medicao._renderizando = True
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicao.tempo_templates += time.perf_counter() - inicio
+            medicao._renderizando = False
+
+
+class TemplatesInstrumentados(DjangoTemplates):
+    """``DjangoTemplates`` com templates medidos; fora de uma requisição medida não faz nada"""
+
+    def from_string(self, template_code):
+        return TemplateMedido(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TemplateMedido(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class InstrumentacaoMiddleware:
+    """Mede consultas e tempos de cada requisição (ver docstring do módulo)"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACAO_ATIVA', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicao = Medicao()
+        request.medicao = medicao
+        token = _medicao_atual.set(medicao)
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(medicao.registrar_consulta))
+                response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+
+        if medicao.inicio_view is not None:
+            medicao.tempo_view = time.perf_counter() - medicao.inicio_view
+        self.relatar(request, response, medicao)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.medicao.inicio_view = time.perf_counter()
+
+    def relatar(self, request, response, medicao):
+        total = time.perf_counter() - medicao.inicio
+        limite = getattr(settings, 'INSTRUMENTACAO_LIMITE_REPETICOES', 5)
+        repetidas = medicao.repetidas(limite)
+        view = request.resolver_match.view_name if request.resolver_match else None
+
+        dados = {
+            'metodo': request.method,
+            'caminho': request.path,
+            'view': view,
+            'status': response.status_code,
+            'consultas': medicao.total_consultas,
+            'sql_ms': round(medicao.tempo_sql * 1000, 2),
+            'templates_ms': round(medicao.tempo_templates * 1000, 2),
+            'view_ms': round(medicao.tempo_view * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'repetidas': [{'sql': sql[:300], 'vezes': vezes} for sql, vezes in repetidas],
+        }
+
+        orcamento = self.orcamento(view)
+        excedeu = orcamento is not None and medicao.total_consultas > orcamento
+        nivel = logging.WARNING if repetidas or excedeu else logging.INFO
+        logger.log(nivel, json.dumps(dados, ensure_ascii=False))
+
+        if getattr(settings, 'INSTRUMENTACAO_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = ', '.join([
+                f'sql;dur={dados["sql_ms"]};desc="{dados["consultas"]} consultas"',
+                f'tpl;dur={dados["templates_ms"]};desc="Templates"',
+                f'view;dur={dados["view_ms"]};desc="View"',
+                f'total;dur={dados["total_ms"]};desc="Total"',
+            ] + ([f'n1;desc="{len(repetidas)} consultas repetidas"'] if repetidas else []))
+
+        if excedeu and getattr(settings, 'INSTRUMENTACAO_FALHAR_ORCAMENTO', False):
+            detalhes = '\n'.join(f'  {vezes}x {sql}' for sql, vezes in medicao.consultas.most_common(5))
+            raise OrcamentoConsultasExcedido(
+                f'{view} executou {medicao.total_consultas} consultas '
+                f'(orçamento: {orcamento}). Mais frequentes:\n{detalhes}'
+            )
+
+    def orcamento(self, view):
+        orcamentos = getattr(settings, 'INSTRUMENTACAO_ORCAMENTO_CONSULTAS', {})
+        return orcamentos.get(view, orcamentos.get('*'))
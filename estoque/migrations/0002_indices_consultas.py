@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='produto',
+            name='qr_code',
+            field=models.CharField(blank=True, help_text='Código QR para busca rápida', max_length=100, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['-data_movimentacao'], name='mov_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['produto', '-data_movimentacao'], name='mov_produto_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['tipo', '-data_movimentacao'], name='mov_tipo_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['nome'], name='produto_ativo_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True), ('quantidade_atual__lte', models.F('quantidade_minima'))), fields=['nome'], name='produto_estoque_baixo_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+def criar_indices_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        # Trigramas sobre UPPER(coluna::text), a mesma expressão gerada por
+        # icontains/istartswith, para o LIKE usar o índice
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS produto_nome_trgm_idx ON estoque_produto '
+            'USING gin (UPPER(nome::text) gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS produto_codigo_trgm_idx ON estoque_produto '
+            'USING gin (UPPER(codigo::text) gin_trgm_ops)'
+        )
+
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS estoque_produto_fts USING fts5('
+            "codigo, nome, qr_code, descricao, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            'INSERT INTO estoque_produto_fts (rowid, codigo, nome, qr_code, descricao) '
+            "SELECT id, codigo, nome, COALESCE(qr_code, ''), COALESCE(descricao, '') FROM estoque_produto"
+        )
+
+
+def remover_indices_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS produto_nome_trgm_idx')
+        schema_editor.execute('DROP INDEX IF EXISTS produto_codigo_trgm_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS estoque_produto_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices_busca, remover_indices_busca),
+    ]
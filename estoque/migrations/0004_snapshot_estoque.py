@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0003_indices_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('dimensao', models.CharField(choices=[('TOTAL', 'Total'), ('CATEGORIA', 'Categoria'), ('FORNECEDOR', 'Fornecedor')], max_length=10)),
+                ('referencia_id', models.PositiveBigIntegerField(default=0)),
+                ('nome', models.CharField(max_length=200)),
+                ('total_produtos', models.PositiveIntegerField(default=0)),
+                ('quantidade', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('valor_custo', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('valor_venda', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Snapshot do Estoque',
+                'verbose_name_plural': 'Snapshots do Estoque',
+                'ordering': ['-data', 'dimensao', 'nome'],
+                'indexes': [models.Index(fields=['dimensao', '-data'], name='snapshot_dimensao_data_idx')],
+                'constraints': [models.UniqueConstraint(fields=('data', 'dimensao', 'referencia_id'), name='snapshot_estoque_unico')],
+            },
+        ),
+    ]
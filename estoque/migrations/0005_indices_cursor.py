@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0004_snapshot_estoque'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='mov_data_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='mov_produto_data_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='movimentacaoestoque',
+            name='mov_tipo_data_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='produto',
+            name='produto_ativo_nome_idx',
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['-data_movimentacao', '-id'], name='mov_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['produto', '-data_movimentacao', '-id'], name='mov_produto_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['tipo', '-data_movimentacao', '-id'], name='mov_tipo_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['nome', 'id'], name='produto_ativo_nome_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0006_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['atualizado_em', 'id'], name='produto_atualizado_idx'),
+        ),
+    ]
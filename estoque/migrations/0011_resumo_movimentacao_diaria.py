@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0010_fila_tarefas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentacaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('tipo', models.CharField(choices=[('ENTRADA', 'Entrada'), ('SAIDA', 'Saída'), ('AJUSTE', 'Ajuste')], max_length=10)),
+                ('quantidade', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('variacao', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('movimentacoes', models.PositiveIntegerField(default=0)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentacoes_diarias', to='estoque.produto')),
+            ],
+            options={
+                'verbose_name': 'Movimentação Diária',
+                'verbose_name_plural': 'Movimentações Diárias',
+                'ordering': ['-dia'],
+                'indexes': [models.Index(fields=['dia', 'produto'], name='mov_diaria_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('produto', 'dia', 'tipo'), name='movimentacao_diaria_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0011_resumo_movimentacao_diaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisaoDemanda',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='previsao', serialize=False, to='estoque.produto')),
+                ('media_diaria', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('demanda_diaria', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('desvio_diario', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('dias_com_saida', models.PositiveIntegerField(default=0)),
+                ('estoque_seguranca', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('ponto_pedido', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('calculado_em', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Previsão de Demanda',
+                'verbose_name_plural': 'Previsões de Demanda',
+            },
+        ),
+    ]
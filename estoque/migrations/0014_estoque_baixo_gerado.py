@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0013_alertas_estoque_push'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='produto',
+            name='produto_estoque_baixo_idx',
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='abaixo_minimo',
+            field=models.GeneratedField(db_persist=True, expression=models.Q(('quantidade_atual__lte', models.F('quantidade_minima'))), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(('abaixo_minimo', True), ('ativo', True)), fields=['nome'], name='produto_estoque_baixo_idx'),
+        ),
+    ]
@@ -1,10 +1,20 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 import uuid
 
 
+def gerar_qr_code(codigo):
+    """Valor padrão do QR code de um produto"""
+    return f"PROD-{codigo}-{uuid.uuid4().hex[:8].upper()}"
+
+
 class Categoria(models.Model):
     nome = models.CharField(max_length=100, unique=True)
     descricao = models.TextField(blank=True, null=True)
@@ -89,6 +99,7 @@ class Produto(models.Model):
         max_length=100, 
         blank=True, 
         null=True,
+        unique=True,
         help_text="Código QR para busca rápida"
     )
     
@@ -98,11 +109,23 @@ class Produto(models.Model):
         blank=True, 
         null=True
     )
+    # Preenchido por estoque.imagens: {'largura', 'altura', 'larguras' das miniaturas}
+    imagem_variantes = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Calculado e gravado pelo próprio banco a cada alteração de quantidade,
+    # para as consultas de estoque baixo usarem um índice
+    abaixo_minimo = models.GeneratedField(
+        expression=models.Q(quantidade_atual__lte=models.F('quantidade_minima')),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
     
     # Status
     ativo = models.BooleanField(default=True)
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
+    # Versão do catálogo da última alteração (ver VersaoCatalogo)
+    versao = models.BigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.codigo} - {self.nome}"
@@ -110,12 +133,16 @@ class Produto(models.Model):
     def save(self, *args, **kwargs):
         # Gerar QR code se não existir
         if not self.qr_code:
-            self.qr_code = f"PROD-{self.codigo}-{uuid.uuid4().hex[:8].upper()}"
-        super().save(*args, **kwargs)
+            self.qr_code = gerar_qr_code(self.codigo)
+        with transaction.atomic():
+            self.versao = VersaoCatalogo.proxima()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'versao'}
+            super().save(*args, **kwargs)
 
     @property
     def estoque_baixo(self):
-        """Verifica se o produto está com estoque baixo"""
+        """Verifica se o produto está com estoque baixo (nas consultas, filtre por ``abaixo_minimo``)"""
         return self.quantidade_atual <= self.quantidade_minima
 
     @property
@@ -125,6 +152,24 @@ class Produto(models.Model):
 
     class Meta:
         ordering = ['nome']
+        indexes = [
+            # Listagens de produtos ativos ordenadas por nome (id desempata o cursor)
+            models.Index(
+                fields=['nome', 'id'],
+                condition=models.Q(ativo=True),
+                name='produto_ativo_nome_idx',
+            ),
+            # Dashboard e relatório de estoque baixo
+            models.Index(
+                fields=['nome'],
+                condition=models.Q(ativo=True, abaixo_minimo=True),
+                name='produto_estoque_baixo_idx',
+            ),
+            # Última alteração do catálogo (validadores HTTP)
+            models.Index(fields=['atualizado_em', 'id'], name='produto_atualizado_idx'),
+            # Sincronização incremental do aplicativo (estoque/sincronizacao.py)
+            models.Index(fields=['versao', 'id'], name='produto_versao_idx'),
+        ]
 
 
 class MovimentacaoEstoque(models.Model):
@@ -158,6 +203,8 @@ class MovimentacaoEstoque(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.PROTECT)
     data_movimentacao = models.DateTimeField(default=timezone.now)
     criado_em = models.DateTimeField(auto_now_add=True)
+    # Versão do catálogo da transação que gravou a movimentação (ver VersaoCatalogo)
+    versao = models.BigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.produto.nome} - {self.tipo} - {self.quantidade}"
@@ -166,6 +213,13 @@ class MovimentacaoEstoque(models.Model):
         verbose_name = "Movimentação de Estoque"
         verbose_name_plural = "Movimentações de Estoque"
         ordering = ['-data_movimentacao']
+        indexes = [
+            models.Index(fields=['-data_movimentacao', '-id'], name='mov_data_idx'),
+            models.Index(fields=['produto', '-data_movimentacao', '-id'], name='mov_produto_data_idx'),
+            models.Index(fields=['tipo', '-data_movimentacao', '-id'], name='mov_tipo_data_idx'),
+            # Sincronização incremental do aplicativo (estoque/sincronizacao.py)
+            models.Index(fields=['versao', 'id'], name='mov_versao_idx'),
+        ]
 
 
 class InventarioFisico(models.Model):
@@ -246,3 +300,340 @@ class ItemInventario(models.Model):
         verbose_name = "Item de Inventário"
         verbose_name_plural = "Itens de Inventário"
         unique_together = ['inventario', 'produto']
+
+
+class SnapshotEstoque(models.Model):
+    """Valor do estoque consolidado por dia: total, por categoria e por fornecedor"""
+
+    DIMENSAO_CHOICES = [
+        ('TOTAL', 'Total'),
+        ('CATEGORIA', 'Categoria'),
+        ('FORNECEDOR', 'Fornecedor'),
+    ]
+
+    data = models.DateField()
+    dimensao = models.CharField(max_length=10, choices=DIMENSAO_CHOICES)
+    # id da categoria/fornecedor; 0 para o total e para produtos sem fornecedor
+    referencia_id = models.PositiveBigIntegerField(default=0)
+    nome = models.CharField(max_length=200)
+
+    total_produtos = models.PositiveIntegerField(default=0)
+    quantidade = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    valor_custo = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    valor_venda = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.data} - {self.get_dimensao_display()} - {self.nome}"
+
+    class Meta:
+        verbose_name = "Snapshot do Estoque"
+        verbose_name_plural = "Snapshots do Estoque"
+        ordering = ['-data', 'dimensao', 'nome']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['data', 'dimensao', 'referencia_id'],
+                name='snapshot_estoque_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['dimensao', '-data'], name='snapshot_dimensao_data_idx'),
+        ]
+
+
+class MovimentacaoDiaria(models.Model):
+    """Movimentações somadas por produto, dia e tipo (relatórios de giro)"""
+
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='movimentacoes_diarias')
+    dia = models.DateField()
+    tipo = models.CharField(max_length=10, choices=MovimentacaoEstoque.TIPO_CHOICES)
+
+    # Soma de ``quantidade`` (sempre positiva) e da variação do estoque
+    # (``quantidade_atual - quantidade_anterior``, negativa nas saídas)
+    quantidade = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    variacao = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    movimentacoes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.dia} - {self.produto_id} - {self.tipo} - {self.quantidade}"
+
+    class Meta:
+        verbose_name = "Movimentação Diária"
+        verbose_name_plural = "Movimentações Diárias"
+        ordering = ['-dia']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['produto', 'dia', 'tipo'],
+                name='movimentacao_diaria_unica',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['dia', 'produto'], name='mov_diaria_dia_idx'),
+        ]
+
+
+class PrevisaoDemanda(models.Model):
+    """Consumo previsto e ponto de pedido sugerido, recalculados todas as noites"""
+
+    produto = models.OneToOneField(
+        Produto, on_delete=models.CASCADE, primary_key=True, related_name='previsao'
+    )
+
+    # Saídas por dia na janela: média simples, média exponencial e desvio padrão
+    media_diaria = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    demanda_diaria = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    desvio_diario = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    dias_com_saida = models.PositiveIntegerField(default=0)
+
+    estoque_seguranca = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    ponto_pedido = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    calculado_em = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.produto_id} - {self.demanda_diaria}/dia"
+
+    @property
+    def dias_cobertura(self):
+        """Dias até o estoque atual acabar no ritmo previsto"""
+        if self.demanda_diaria <= 0:
+            return None
+        return self.produto.quantidade_atual / self.demanda_diaria
+
+    class Meta:
+        verbose_name = "Previsão de Demanda"
+        verbose_name_plural = "Previsões de Demanda"
+
+
+class AlertaEstoque(models.Model):
+    """Produto que cruzou o estoque mínimo em uma movimentação"""
+
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='alertas')
+    movimentacao = models.ForeignKey(
+        MovimentacaoEstoque, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    quantidade = models.DecimalField(max_digits=10, decimal_places=2)
+    quantidade_minima = models.DecimalField(max_digits=10, decimal_places=2)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    # Preenchido quando o alerta entra em um resumo enviado por push
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.produto} - {self.quantidade} (mín. {self.quantidade_minima})"
+
+    class Meta:
+        verbose_name = "Alerta de Estoque"
+        verbose_name_plural = "Alertas de Estoque"
+        ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['produto', '-criado_em'], name='alerta_produto_idx'),
+            models.Index(
+                fields=['criado_em'],
+                condition=models.Q(enviado_em__isnull=True),
+                name='alerta_pendente_idx',
+            ),
+        ]
+
+
+class InscricaoPush(models.Model):
+    """Assinatura Web Push de um navegador (PushSubscription)"""
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inscricoes_push')
+    endpoint = models.URLField(max_length=500, unique=True)
+    p256dh = models.CharField(max_length=200)
+    auth = models.CharField(max_length=100)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.usuario} - {self.endpoint[:60]}"
+
+    class Meta:
+        verbose_name = "Inscrição Push"
+        verbose_name_plural = "Inscrições Push"
+
+
+class ChaveIdempotencia(models.Model):
+    """
+    Resposta já enviada para uma chave de idempotência do cliente.
+
+    Reenvios com a mesma chave (fila offline, novas tentativas após falha de
+    rede) recebem a resposta guardada em vez de repetir a operação.
+    """
+
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chaves_idempotencia')
+    chave = models.CharField(max_length=64)
+    # Nula enquanto a operação da chave ainda não terminou
+    resposta = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    criado_em = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.usuario} - {self.chave}"
+
+    class Meta:
+        verbose_name = "Chave de Idempotência"
+        verbose_name_plural = "Chaves de Idempotência"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'chave'], name='chave_idempotencia_unica'),
+        ]
+
+
+class Tarefa(models.Model):
+    """
+    Trabalho demorado executado fora da requisição (ver estoque/fila.py).
+
+    ``nome`` é o de uma função registrada com ``@tarefa`` e ``argumentos`` os
+    seus parâmetros; ``progresso`` e ``mensagem`` são consultados pela
+    interface enquanto a tarefa roda.
+    """
+
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('EXECUTANDO', 'Executando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('FALHOU', 'Falhou'),
+    ]
+
+    nome = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
+
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    maximo_tentativas = models.PositiveSmallIntegerField(default=3)
+    executar_apos = models.DateTimeField(default=timezone.now)
+
+    progresso = models.PositiveSmallIntegerField(default=0)
+    mensagem = models.CharField(max_length=200, blank=True)
+    resultado = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    erro = models.TextField(blank=True)
+
+    # Worker que reservou a tarefa e até quando a reserva vale sem notícias dele
+    worker = models.CharField(max_length=100, blank=True)
+    expira_em = models.DateTimeField(blank=True, null=True)
+
+    criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciada_em = models.DateTimeField(blank=True, null=True)
+    concluida_em = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.nome} #{self.pk} - {self.status}"
+
+    def registrar_progresso(self, percentual, mensagem=''):
+        """
+        Grava o progresso e renova a reserva do worker.
+
+        Dentro de uma transação (fechamento de inventário) um UPDATE comum só
+        apareceria no commit, para a interface e para ``recuperar_expiradas``:
+        grava por uma conexão própria, em autocommit. No SQLite ela esperaria
+        o lock de escrita da própria tarefa, e o progresso aparece no commit.
+        """
+        self.progresso = max(0, min(int(percentual), 100))
+        self.mensagem = mensagem[:200]
+        self.expira_em = timezone.now() + timedelta(seconds=getattr(settings, 'TAREFAS_TEMPO_LIMITE', 600))
+
+        conexao = transaction.get_connection()
+        if not conexao.in_atomic_block or conexao.vendor == 'sqlite':
+            Tarefa.objects.filter(pk=self.pk).update(
+                progresso=self.progresso, mensagem=self.mensagem, expira_em=self.expira_em
+            )
+            return
+        separada = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with separada.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {separada.ops.quote_name(self._meta.db_table)} '
+                    'SET progresso = %s, mensagem = %s, expira_em = %s WHERE id = %s',
+                    [self.progresso, self.mensagem, self.expira_em, self.pk],
+                )
+        finally:
+            separada.close()
+
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        ordering = ['-criado_em']
+        indexes = [
+            # Próxima tarefa pronta para o worker
+            models.Index(
+                fields=['executar_apos', 'id'],
+                condition=models.Q(status='PENDENTE'),
+                name='tarefa_pendente_idx',
+            ),
+            # Reservas expiradas de workers que pararam
+            models.Index(
+                fields=['expira_em'],
+                condition=models.Q(status='EXECUTANDO'),
+                name='tarefa_executando_idx',
+            ),
+        ]
+
+
+class VersaoCatalogo(models.Model):
+    """
+    Versões gravadas em ``Produto.versao`` e ``MovimentacaoEstoque.versao``.
+
+    Cada transação que altera produtos ou grava movimentações pede uma versão
+    com ``proxima()`` e a grava nas linhas que alterou. A sincronização
+    incremental usa ``(versao, id)`` como cursor e precisa que uma versão
+    visível garanta que as menores também estão (ver ``versao_visivel``).
+
+    - PostgreSQL: a versão é o id da transação (``pg_current_xact_id()``),
+      sem lock nenhum; gravações em SKUs diferentes não esperam umas pelas
+      outras. A ordem de commit fica por conta da leitura, que só entrega
+      versões menores que a transação aberta mais antiga.
+    - Demais bancos (SQLite): contador nesta tabela (linha única). O UPDATE
+      bloqueia a linha até o commit, o que serializa as gravações no
+      catálogo; no SQLite elas já são serializadas pelo lock de escrita do
+      banco, então o contador não custa nada a mais.
+    """
+
+    ultima = models.BigIntegerField(default=0)
+
+    @classmethod
+    def proxima(cls):
+        """Versão das linhas gravadas pela transação atual (chamar dentro de ``transaction.atomic()``)"""
+        connection = transaction.get_connection()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_current_xact_id()::text::bigint')
+                return cursor.fetchone()[0]
+
+        if not cls.objects.filter(pk=1).update(ultima=models.F('ultima') + 1):
+            # Tabela vazia (banco recém-criado ou esvaziado): continua das
+            # versões já gravadas
+            ultima = max(
+                Produto.objects.aggregate(ultima=models.Max('versao'))['ultima'] or 0,
+                MovimentacaoEstoque.objects.aggregate(ultima=models.Max('versao'))['ultima'] or 0,
+            )
+            cls.objects.get_or_create(pk=1, defaults={'ultima': ultima})
+            cls.objects.filter(pk=1).update(ultima=models.F('ultima') + 1)
+        return cls.objects.values_list('ultima', flat=True).get(pk=1)
+
+    @staticmethod
+    def versao_visivel():
+        """
+        Filtro das linhas que a sincronização pode entregar, ou ``None``.
+
+        No PostgreSQL, só as versões menores que a transação aberta mais
+        antiga (``pg_snapshot_xmin``): todas essas já terminaram, e qualquer
+        transação que ainda vai fazer commit tem versão maior, então o cursor
+        nunca passa por cima dela. Uma transação longa (fechamento de
+        inventário, importação) atrasa a sincronização das alterações
+        posteriores até o commit dela, sem bloquear quem grava. As linhas da
+        própria transação de quem lê também são visíveis.
+        """
+        if transaction.get_connection().vendor != 'postgresql':
+            return None
+        return models.Q(
+            versao__lt=RawSQL('pg_snapshot_xmin(pg_current_snapshot())::text::bigint', [])
+        ) | models.Q(
+            versao=RawSQL('pg_current_xact_id_if_assigned()::text::bigint', [])
+        )
+
+    def __str__(self):
+        return f"Versão {self.ultima}"
+
+    class Meta:
+        verbose_name = "Versão do Catálogo"
+        verbose_name_plural = "Versões do Catálogo"
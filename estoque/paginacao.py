@@ -0,0 +1,184 @@
+"""
+Paginação por cursor (keyset) para as listas de produtos e movimentações
+
+Em vez de ``OFFSET``, cada página continua a partir dos valores de ordenação
+do último registro exibido, então a página 10.000 custa o mesmo que a
+primeira. O cursor é opaco e assinado e leva a ordenação para a qual foi
+gerado; um cursor inválido ou de outra ordenação volta ao início (páginas
+HTML) ou levanta ``CursorInvalido`` (API, com ``estrito=True``).
+As colunas de ordenação não podem ser nulas e a última deve ser única
+(normalmente ``id``) para desempatar.
+"""
+import json
+
+from django.core import signing
+from django.core.exceptions import BadRequest
+from django.db import connection
+from django.db.models import Q
+
+
+SALT_CURSOR = 'estoque.paginacao'
+
+# Acima disso a contagem exata deixa de ser feita fora do PostgreSQL
+LIMITE_CONTAGEM = 10000
+
+
+class CursorInvalido(BadRequest):
+    """Cursor adulterado, antigo ou gerado para outra ordenação"""
+
+
+def _coluna(ordem):
+    return ordem.lstrip('-'), ordem.startswith('-')
+
+
+def serializar(valor):
+    """Valor de coluna em forma serializável no cursor"""
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    if isinstance(valor, int):
+        return valor
+    return str(valor)
+
+
+def _valor(objeto, coluna):
+    # Linhas de values() chegam como dicts
+    return objeto[coluna] if isinstance(objeto, dict) else getattr(objeto, coluna)
+
+
+def gerar_cursor(objeto, ordenacao, direcao):
+    valores = [serializar(_valor(objeto, _coluna(ordem)[0])) for ordem in ordenacao]
+    return signing.dumps(
+        {'o': list(ordenacao), 'v': valores, 'd': direcao}, salt=SALT_CURSOR, compress=True
+    )
+
+
+def ler_cursor(token, ordenacao):
+    """
+    Valores e direção do cursor, ou None se ausente, adulterado ou gerado
+    para outra ordenação (os valores de uma coluna não servem para outra).
+    """
+    if not token:
+        return None
+    try:
+        dados = signing.loads(token, salt=SALT_CURSOR)
+    except signing.BadSignature:
+        return None
+    if not isinstance(dados, dict) or dados.get('o') != list(ordenacao):
+        return None
+    if len(dados.get('v') or []) != len(ordenacao) or dados.get('d') not in ('proxima', 'anterior'):
+        return None
+    return dados['v'], dados['d']
+
+
+def depois_de(ordenacao, valores):
+    """
+    Registros posteriores à chave na ordenação informada (``Q``).
+
+    Gera ``a >= x AND (a > x OR (a = x AND b > y))``: o primeiro termo
+    deixa o banco usar o índice da primeira coluna como intervalo. Usado
+    também pela sincronização incremental (estoque/sincronizacao.py).
+    """
+    condicao = None
+    for indice in reversed(range(len(ordenacao))):
+        coluna, decrescente = _coluna(ordenacao[indice])
+        termo = Q(**{f'{coluna}__{"lt" if decrescente else "gt"}': valores[indice]})
+        if condicao is not None:
+            termo |= Q(**{coluna: valores[indice]}) & condicao
+        condicao = termo
+
+    coluna, decrescente = _coluna(ordenacao[0])
+    return Q(**{f'{coluna}__{"lte" if decrescente else "gte"}': valores[0]}) & condicao
+
+
+def _inverter(ordenacao):
+    return [ordem[1:] if ordem.startswith('-') else f'-{ordem}' for ordem in ordenacao]
+
+
+class PaginaCursor:
+    """Uma página de resultados com os cursores das páginas vizinhas"""
+
+    def __init__(self, objetos, ordenacao, params, tem_proxima, tem_anterior):
+        self.object_list = objetos
+        self.params = params
+        self.tem_proxima = tem_proxima
+        self.tem_anterior = tem_anterior
+        self.cursor_proxima = gerar_cursor(objetos[-1], ordenacao, 'proxima') if tem_proxima else None
+        self.cursor_anterior = gerar_cursor(objetos[0], ordenacao, 'anterior') if tem_anterior else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _url(self, cursor):
+        params = self.params.copy()
+        params['cursor'] = cursor
+        return f'?{params.urlencode()}'
+
+    @property
+    def url_proxima(self):
+        return self._url(self.cursor_proxima) if self.tem_proxima else None
+
+    @property
+    def url_anterior(self):
+        return self._url(self.cursor_anterior) if self.tem_anterior else None
+
+
+def paginar_por_cursor(queryset, ordenacao, params, por_pagina, estrito=False):
+    """
+    Página do queryset a partir do parâmetro ``cursor`` de ``params``.
+
+    ``ordenacao`` substitui a ordenação do queryset; busca-se um registro a
+    mais para saber se existe a página seguinte sem precisar contar. Um
+    cursor que não pode ser usado volta à primeira página, ou levanta
+    ``CursorInvalido`` com ``estrito``.
+    """
+    params = params.copy()
+    token = params.pop('cursor', [None])[-1]
+    cursor = ler_cursor(token, ordenacao)
+    if cursor is None and token and estrito:
+        raise CursorInvalido('Cursor inválido ou de outra ordenação; recomece sem "cursor".')
+
+    if cursor is None:
+        objetos = list(queryset.order_by(*ordenacao)[:por_pagina + 1])
+        tem_proxima = len(objetos) > por_pagina
+        return PaginaCursor(objetos[:por_pagina], ordenacao, params, tem_proxima, False)
+
+    valores, direcao = cursor
+    if direcao == 'proxima':
+        objetos = list(queryset.filter(depois_de(ordenacao, valores)).order_by(*ordenacao)[:por_pagina + 1])
+        tem_proxima = len(objetos) > por_pagina
+        return PaginaCursor(objetos[:por_pagina], ordenacao, params, tem_proxima, bool(objetos))
+
+    invertida = _inverter(ordenacao)
+    objetos = list(queryset.filter(depois_de(invertida, valores)).order_by(*invertida)[:por_pagina + 1])
+    tem_anterior = len(objetos) > por_pagina
+    objetos = objetos[:por_pagina][::-1]
+    if not objetos:
+        return paginar_por_cursor(queryset, ordenacao, params, por_pagina)
+    return PaginaCursor(objetos, ordenacao, params, bool(objetos), tem_anterior)
+
+
+def contar_aproximado(queryset):
+    """
+    Total de registros sem varrer a tabela inteira.
+
+    No PostgreSQL usa a estimativa do planejador; nos demais conta até
+    ``LIMITE_CONTAGEM``. Retorna ``(total, exato)``.
+    """
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plano = cursor.fetchone()[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        estimativa = int(plano[0]['Plan']['Plan Rows'])
+        # Estimativas pequenas são imprecisas e a contagem exata é barata
+        if estimativa > LIMITE_CONTAGEM:
+            return estimativa, False
+        return queryset.count(), True
+
+    total = queryset.order_by()[:LIMITE_CONTAGEM + 1].count()
+    return min(total, LIMITE_CONTAGEM), total <= LIMITE_CONTAGEM
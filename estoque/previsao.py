@@ -0,0 +1,126 @@
+"""
+Previsão de demanda e ponto de pedido sugerido (``PrevisaoDemanda``)
+
+``calcular_previsoes`` (comando ``calcular_previsoes``, rodado todas as
+noites) lê as saídas dos últimos ``PREVISAO_JANELA_DIAS`` do resumo diário
+(``MovimentacaoDiaria``), uma linha por produto e dia com saída, em uma
+única passada ordenada por produto. Dias sem saída contam como zero. Para
+cada produto:
+
+- média simples e desvio padrão das saídas diárias;
+- média exponencial (peso ``PREVISAO_ALFA`` para o dia mais recente),
+  usada como demanda diária prevista;
+- estoque de segurança = ``PREVISAO_FATOR_SERVICO`` x desvio x raiz do
+  prazo de reposição (``PREVISAO_PRAZO_REPOSICAO_DIAS``);
+- ponto de pedido = demanda x prazo + estoque de segurança.
+
+Produtos sem saídas na janela ficam sem previsão. Os dias de cobertura
+dependem do estoque atual e são calculados na leitura.
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MovimentacaoDiaria, PrevisaoDemanda
+
+
+# Previsões gravadas por INSERT
+TAMANHO_LOTE = 2000
+
+CENTESIMOS = Decimal('0.01')
+DECIMOS_DE_MILESIMO = Decimal('0.0001')
+
+
+def _parametros():
+    return (
+        getattr(settings, 'PREVISAO_JANELA_DIAS', 90),
+        getattr(settings, 'PREVISAO_ALFA', 0.1),
+        getattr(settings, 'PREVISAO_PRAZO_REPOSICAO_DIAS', 7),
+        getattr(settings, 'PREVISAO_FATOR_SERVICO', 1.65),
+    )
+
+
+def _previsao(produto_id, total, quadrados, ponderada, dias_com_saida, janela, normalizacao,
+              prazo, fator, agora):
+    media = total / janela
+    desvio = math.sqrt(max(quadrados / janela - media * media, 0))
+    demanda = ponderada / normalizacao
+    seguranca = fator * desvio * math.sqrt(prazo)
+    return PrevisaoDemanda(
+        produto_id=produto_id,
+        media_diaria=Decimal(media).quantize(DECIMOS_DE_MILESIMO),
+        demanda_diaria=Decimal(demanda).quantize(DECIMOS_DE_MILESIMO),
+        desvio_diario=Decimal(desvio).quantize(DECIMOS_DE_MILESIMO),
+        dias_com_saida=dias_com_saida,
+        estoque_seguranca=Decimal(seguranca).quantize(CENTESIMOS),
+        ponto_pedido=Decimal(demanda * prazo + seguranca).quantize(CENTESIMOS),
+        calculado_em=agora,
+    )
+
+
+def _gravar(previsoes):
+    PrevisaoDemanda.objects.bulk_create(
+        previsoes,
+        update_conflicts=True,
+        unique_fields=['produto'],
+        update_fields=[
+            'media_diaria', 'demanda_diaria', 'desvio_diario', 'dias_com_saida',
+            'estoque_seguranca', 'ponto_pedido', 'calculado_em',
+        ],
+    )
+
+
+def calcular_previsoes(hoje=None):
+    """
+    Recalcula a previsão de todos os produtos com saída na janela que
+    termina ontem (o dia corrente ainda está incompleto).
+
+    Retorna o número de produtos com previsão.
+    """
+    janela, alfa, prazo, fator = _parametros()
+    hoje = hoje or timezone.localdate()
+    fim = hoje - timedelta(days=1)
+    inicio = hoje - timedelta(days=janela)
+    agora = timezone.now()
+
+    # Peso de cada idade (0 = ontem) e soma dos pesos, para a média
+    # exponencial não ficar puxada para zero no início da série
+    pesos = [alfa * (1 - alfa) ** idade for idade in range(janela)]
+    normalizacao = sum(pesos)
+
+    saidas = MovimentacaoDiaria.objects.filter(
+        tipo='SAIDA', dia__gte=inicio, dia__lte=fim, produto__ativo=True,
+    ).order_by('produto_id').values_list('produto_id', 'dia', 'quantidade')
+
+    calculadas = 0
+    lote = []
+    atual = None
+    with transaction.atomic():
+        for produto_id, dia, quantidade in saidas.iterator(chunk_size=TAMANHO_LOTE):
+            if produto_id != atual:
+                if atual is not None:
+                    lote.append(_previsao(atual, *somas, janela, normalizacao, prazo, fator, agora))
+                atual = produto_id
+                somas = [0.0, 0.0, 0.0, 0]
+            quantidade = float(quantidade)
+            somas[0] += quantidade
+            somas[1] += quantidade * quantidade
+            somas[2] += quantidade * pesos[(fim - dia).days]
+            somas[3] += 1
+            if len(lote) >= TAMANHO_LOTE:
+                _gravar(lote)
+                calculadas += len(lote)
+                lote = []
+        if atual is not None:
+            lote.append(_previsao(atual, *somas, janela, normalizacao, prazo, fator, agora))
+        _gravar(lote)
+        calculadas += len(lote)
+
+        # Sem saídas na janela (ou inativos): a previsão anterior não vale mais
+        PrevisaoDemanda.objects.filter(calculado_em__lt=agora).delete()
+
+    return calculadas
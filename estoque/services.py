@@ -0,0 +1,298 @@
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Produto, MovimentacaoEstoque, VersaoCatalogo
+from .forms import MovimentacaoForm
+from .giro import acumular_movimentacoes
+from .idempotencia import TAMANHO_MAXIMO_CHAVE, gravar_respostas, reservar_chaves
+from .signals import movimentacoes_registradas
+
+
+# Máximo de linhas aceitas em uma única chamada de movimentação em lote
+LIMITE_LOTE = 1000
+
+
+class EstoqueInsuficiente(Exception):
+    """Saída maior que a quantidade disponível em estoque"""
+
+
+def notificar_movimentacoes(movimentacoes):
+    """
+    Soma as movimentações ao resumo diário, ainda na transação, e dispara
+    ``movimentacoes_registradas`` depois do commit.
+
+    Quem grava ``MovimentacaoEstoque`` fora deste módulo (ex.: fechamento de
+    inventário) chama esta função na mesma transação, com os produtos
+    bloqueados por ``travar_produtos``.
+    """
+    if movimentacoes:
+        acumular_movimentacoes(movimentacoes)
+        # send_robust: a falha de um receptor é registrada em log sem
+        # afetar os demais nem a resposta de uma movimentação já gravada
+        transaction.on_commit(lambda: movimentacoes_registradas.send_robust(
+            sender=MovimentacaoEstoque, movimentacoes=movimentacoes
+        ))
+
+
+def travar_produtos(produtos):
+    """
+    Bloqueia as linhas dos produtos do queryset até o fim da transação.
+
+    Deve ser chamado dentro de ``transaction.atomic()``; usado também pela
+    importação de produtos e pelo fechamento de inventário.
+    """
+    if not connection.features.has_select_for_update:
+        # SQLite ignora FOR UPDATE: um UPDATE logo no início da transação
+        # obtém o lock de escrita do banco antes da leitura. Sem mudar nada:
+        # atualizado_em entra na ETag e na API, e a linha pode ser rejeitada
+        produtos.update(quantidade_atual=F('quantidade_atual'))
+    return produtos.select_for_update()
+
+
+def _travar_produto(produto_id):
+    """Bloqueia a linha do produto até o fim da transação e retorna a quantidade atual"""
+    produtos = travar_produtos(Produto.objects.filter(pk=produto_id, ativo=True))
+    try:
+        return produtos.values_list('quantidade_atual', flat=True).get()
+    except Produto.DoesNotExist:
+        raise Produto.DoesNotExist('Produto não encontrado ou inativo.')
+
+
+def registrar_movimentacao(produto, tipo, quantidade, usuario, motivo,
+                           observacao=None, documento=None):
+    """
+    Registra uma movimentação e atualiza o estoque do produto na mesma transação.
+
+    Para ENTRADA e SAIDA ``quantidade`` é o valor movimentado; para AJUSTE é a
+    nova quantidade em estoque. Apenas ``quantidade_atual`` e ``atualizado_em``
+    são gravados no produto (além de ``versao``), e a instância recebida é
+    atualizada em memória.
+    """
+    quantidade = Decimal(str(quantidade))
+
+    with transaction.atomic():
+        quantidade_anterior = _travar_produto(produto.pk)
+
+        if tipo == 'ENTRADA':
+            nova_quantidade = quantidade_anterior + quantidade
+        elif tipo == 'SAIDA':
+            if quantidade > quantidade_anterior:
+                raise EstoqueInsuficiente(
+                    f'Quantidade insuficiente em estoque! Disponível: {quantidade_anterior}'
+                )
+            nova_quantidade = quantidade_anterior - quantidade
+        elif tipo == 'AJUSTE':
+            if quantidade < 0:
+                raise ValueError('A quantidade não pode ser negativa!')
+            nova_quantidade = quantidade
+            quantidade = abs(nova_quantidade - quantidade_anterior)
+        else:
+            raise ValueError(f'Tipo de movimentação inválido: {tipo}')
+
+        agora = timezone.now()
+        versao = VersaoCatalogo.proxima()
+        Produto.objects.filter(pk=produto.pk).update(
+            quantidade_atual=nova_quantidade,
+            atualizado_em=agora,
+            versao=versao,
+        )
+
+        movimentacao = MovimentacaoEstoque.objects.create(
+            produto=produto,
+            tipo=tipo,
+            quantidade=quantidade,
+            quantidade_anterior=quantidade_anterior,
+            quantidade_atual=nova_quantidade,
+            motivo=motivo,
+            observacao=observacao,
+            documento=documento,
+            usuario=usuario,
+            versao=versao,
+        )
+        notificar_movimentacoes([movimentacao])
+
+    produto.quantidade_atual = nova_quantidade
+    produto.atualizado_em = agora
+    produto.versao = versao
+    return movimentacao
+
+
+def registrar_movimentacoes_em_lote(itens, usuario):
+    """
+    Aplica uma lista de entradas/saídas em uma única transação.
+
+    Cada item é um dict com ``produto`` (código ou QR code), ``tipo``
+    (ENTRADA ou SAIDA), ``quantidade``, ``motivo`` e, opcionalmente,
+    ``documento`` e ``observacao``. Os produtos são buscados e bloqueados em
+    uma só consulta, o saldo é validado em memória na ordem das linhas e tudo
+    é gravado com ``bulk_create``/``bulk_update``. Linhas inválidas são
+    rejeitadas sem impedir as demais.
+
+    Retorna uma lista com o resultado de cada linha, na ordem recebida.
+    """
+    if len(itens) > LIMITE_LOTE:
+        raise ValueError(f'O lote aceita no máximo {LIMITE_LOTE} itens.')
+
+    resultados = []
+    validos = []
+    for linha, item in enumerate(itens, start=1):
+        if not isinstance(item, dict):
+            resultados.append({'linha': linha, 'status': 'erro', 'erros': ['Item inválido.']})
+            continue
+
+        resultado = {
+            'linha': linha,
+            'produto': item.get('produto'),
+            'tipo': item.get('tipo'),
+            'status': 'erro',
+        }
+        resultados.append(resultado)
+
+        form = MovimentacaoForm(item)
+        erros = []
+        if not item.get('produto'):
+            erros.append('Informe o código ou QR code do produto.')
+        if item.get('tipo') not in ('ENTRADA', 'SAIDA'):
+            erros.append('Tipo deve ser ENTRADA ou SAIDA.')
+        if not form.is_valid():
+            erros.extend(
+                f'{campo}: {mensagem}'
+                for campo, mensagens in form.errors.items()
+                for mensagem in mensagens
+            )
+
+        if erros:
+            resultado['erros'] = erros
+        else:
+            validos.append((resultado, str(item['produto']), form.cleaned_data))
+
+    if not validos:
+        return resultados
+
+    referencias = {referencia for _, referencia, _ in validos}
+    agora = timezone.now()
+
+    with transaction.atomic():
+        produtos = list(travar_produtos(
+            Produto.objects.filter(
+                Q(codigo__in=referencias) | Q(qr_code__in=referencias),
+                ativo=True,
+            )
+        ).only('id', 'codigo', 'qr_code', 'quantidade_atual').order_by())
+
+        por_referencia = {}
+        for produto in produtos:
+            if produto.qr_code:
+                por_referencia[produto.qr_code] = produto
+        for produto in produtos:
+            # O código tem prioridade sobre um QR code igual de outro produto
+            por_referencia[produto.codigo] = produto
+
+        movimentacoes = []
+        aplicados = []
+        alterados = {}
+        for resultado, referencia, dados in validos:
+            produto = por_referencia.get(referencia)
+            if produto is None:
+                resultado['erros'] = ['Produto não encontrado ou inativo.']
+                continue
+
+            quantidade = dados['quantidade']
+            quantidade_anterior = produto.quantidade_atual
+            if resultado['tipo'] == 'SAIDA':
+                if quantidade > quantidade_anterior:
+                    resultado['erros'] = [
+                        f'Quantidade insuficiente em estoque! Disponível: {quantidade_anterior}'
+                    ]
+                    continue
+                nova_quantidade = quantidade_anterior - quantidade
+            else:
+                nova_quantidade = quantidade_anterior + quantidade
+
+            produto.quantidade_atual = nova_quantidade
+            produto.atualizado_em = agora
+            alterados[produto.pk] = produto
+
+            movimentacoes.append(MovimentacaoEstoque(
+                produto=produto,
+                tipo=resultado['tipo'],
+                quantidade=quantidade,
+                quantidade_anterior=quantidade_anterior,
+                quantidade_atual=nova_quantidade,
+                motivo=dados['motivo'],
+                observacao=dados.get('observacao'),
+                documento=dados.get('documento'),
+                usuario=usuario,
+                data_movimentacao=agora,
+            ))
+            aplicados.append(resultado)
+
+        versao = VersaoCatalogo.proxima()
+        for movimentacao in movimentacoes:
+            movimentacao.versao = versao
+        for produto in alterados.values():
+            produto.versao = versao
+        MovimentacaoEstoque.objects.bulk_create(movimentacoes)
+        Produto.objects.bulk_update(alterados.values(), ['quantidade_atual', 'atualizado_em', 'versao'])
+        notificar_movimentacoes(movimentacoes)
+
+    for resultado, movimentacao in zip(aplicados, movimentacoes):
+        resultado['status'] = 'ok'
+        resultado['movimentacao_id'] = movimentacao.pk
+        resultado['produto_id'] = movimentacao.produto_id
+        resultado['quantidade_atual'] = movimentacao.quantidade_atual
+
+    return resultados
+
+
+def sincronizar_movimentacoes(itens, usuario):
+    """
+    Aplica as movimentações enviadas pela fila offline do aplicativo.
+
+    Os itens são os de ``registrar_movimentacoes_em_lote`` com um ``id``
+    gerado no dispositivo, usado como chave de idempotência: um item já
+    recebido (reenvio depois de uma falha de rede, por exemplo) não é
+    aplicado de novo e devolve o resultado da primeira vez com
+    ``repetido: true``. Retorna o resultado de cada item, na ordem recebida.
+    """
+    if len(itens) > LIMITE_LOTE:
+        raise ValueError(f'O lote aceita no máximo {LIMITE_LOTE} itens.')
+
+    resultados = [None] * len(itens)
+    chaves = {}
+    for indice, item in enumerate(itens):
+        chave = item.get('id') if isinstance(item, dict) else None
+        if not isinstance(chave, str) or not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+            resultados[indice] = {
+                'id': chave,
+                'status': 'erro',
+                'erros': ['Informe o id (chave de idempotência) da movimentação.'],
+            }
+        elif chave not in chaves:
+            chaves[chave] = indice
+
+    with transaction.atomic():
+        novas, respostas = reservar_chaves(usuario, list(chaves))
+        pendentes = [chave for chave in chaves if chave in novas]
+        aplicadas = {}
+        for chave, resultado in zip(
+            pendentes,
+            registrar_movimentacoes_em_lote([itens[chaves[chave]] for chave in pendentes], usuario),
+        ):
+            del resultado['linha']
+            aplicadas[chave] = {'id': chave, **resultado}
+        gravar_respostas(usuario, aplicadas)
+
+    for indice, item in enumerate(itens):
+        if resultados[indice] is not None:
+            continue
+        chave = item['id']
+        if chave in aplicadas and chaves[chave] == indice:
+            resultados[indice] = aplicadas[chave]
+        else:
+            resultados[indice] = {**(aplicadas.get(chave) or respostas[chave]), 'repetido': True}
+
+    return resultados
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver, Signal
+
+from .alertas import registrar_alertas
+from .busca import obter_backend
+from .estatisticas import invalidar_dashboard
+from .eventos import central
+from .imagens import agendar_processamento
+from .models import Produto, MovimentacaoEstoque
+from .valorizacao import aplicar_movimentacoes
+
+
+# Enviado após o commit das movimentações registradas por estoque.services,
+# inclusive as gravadas em lote (que não disparam post_save).
+# Argumento: movimentacoes (lista de MovimentacaoEstoque).
+movimentacoes_registradas = Signal()
+
+
+@receiver(post_save, sender=Produto)
+def indexar_produto(sender, instance, **kwargs):
+    """Mantém o índice de busca em dia a cada gravação do produto"""
+    obter_backend().indexar([instance])
+
+
+@receiver(post_delete, sender=Produto)
+def remover_produto_do_indice(sender, instance, **kwargs):
+    obter_backend().remover([instance.pk])
+
+
+@receiver(pre_save, sender=Produto)
+def marcar_imagem_nova(sender, instance, **kwargs):
+    """Imagem recém-enviada (ainda não gravada no storage) perde as variantes antigas"""
+    instance._imagem_nova = bool(instance.imagem) and not instance.imagem._committed
+    if instance._imagem_nova or not instance.imagem:
+        instance.imagem_variantes = {}
+
+
+@receiver(post_save, sender=Produto)
+def processar_imagem_nova(sender, instance, **kwargs):
+    if getattr(instance, '_imagem_nova', False):
+        agendar_processamento(instance.pk)
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(post_save, sender=MovimentacaoEstoque)
+@receiver(post_delete, sender=MovimentacaoEstoque)
+@receiver(movimentacoes_registradas)
+def invalidar_estatisticas(sender, **kwargs):
+    """Descarta as estatísticas do dashboard quando a transação confirmar"""
+    transaction.on_commit(invalidar_dashboard)
+
+
+@receiver(movimentacoes_registradas)
+def atualizar_snapshot_estoque(sender, movimentacoes, **kwargs):
+    """Aplica as movimentações ao snapshot de valor do estoque do dia"""
+    aplicar_movimentacoes(movimentacoes)
+
+
+@receiver(movimentacoes_registradas)
+def detectar_estoque_baixo(sender, movimentacoes, **kwargs):
+    """Alerta os produtos que cruzaram o estoque mínimo nessas movimentações"""
+    registrar_alertas(movimentacoes)
+
+
+@receiver(movimentacoes_registradas)
+def transmitir_movimentacoes(sender, movimentacoes, **kwargs):
+    """Envia as movimentações aos dashboards e páginas de produto abertos neste processo"""
+    # Depois de invalidar_estatisticas: os cartões saem com os números novos
+    central.publicar(movimentacoes)
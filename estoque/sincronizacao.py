@@ -0,0 +1,153 @@
+"""
+Sincronização incremental do catálogo para o aplicativo ("alterações desde")
+
+O aplicativo guarda uma réplica local dos produtos e pede só o que mudou
+desde o último cursor recebido:
+
+- produtos com ``versao`` posterior ao cursor, na ordem ``(versao, id)``
+  do índice ``produto_versao_idx``; produtos desativados vão em
+  ``removidos`` (só o id) para saírem da réplica;
+- movimentações gravadas depois do cursor, na ordem ``(versao, id)``.
+
+A primeira sincronização (sem cursor) percorre o catálogo inteiro e não
+traz movimentações anteriores a ela. Produtos inativos vão em ``removidos``
+também na carga inicial: um produto entregue numa página e desativado antes
+da seguinte precisa sair da réplica, e ids que ela não tem são ignorados
+pelo aplicativo. O cursor é opaco e assinado.
+
+``versao`` vem de ``VersaoCatalogo``, emitida dentro da transação que
+grava a linha, e só são entregues as versões de transações já terminadas
+(``VersaoCatalogo.versao_visivel``): o cursor nunca passa por cima das
+linhas de uma transação longa (fechamento de inventário, importação) que
+ainda vai fazer commit. Enquanto ela estiver aberta, as alterações
+posteriores a ela esperam o commit para serem sincronizadas.
+Alterações em categorias e fornecedores (nomes) não são propagadas aos
+produtos.
+"""
+from django.core import signing
+
+from .models import MovimentacaoEstoque, Produto, VersaoCatalogo
+from .paginacao import depois_de, serializar
+
+
+SALT_CURSOR = 'estoque.sincronizacao'
+
+# Muda quando o formato das chaves muda: cursores antigos pedem nova carga
+FORMATO_CURSOR = 3
+
+ORDENACAO_PRODUTOS = ['versao', 'id']
+ORDENACAO_MOVIMENTACOES = ['versao', 'id']
+
+CAMPOS_PRODUTO = [
+    'id', 'codigo', 'nome', 'descricao', 'categoria_id', 'categoria__nome',
+    'fornecedor_id', 'fornecedor__nome', 'quantidade_atual', 'quantidade_minima',
+    'preco_custo', 'preco_venda', 'unidade_medida', 'localizacao', 'qr_code',
+    'imagem', 'atualizado_em', 'versao',
+]
+CAMPOS_MOVIMENTACAO = [
+    'id', 'produto_id', 'tipo', 'quantidade', 'quantidade_anterior',
+    'quantidade_atual', 'motivo', 'documento', 'usuario__username',
+    'data_movimentacao', 'criado_em', 'versao',
+]
+
+ALTERACOES_POR_PAGINA = 500
+MAXIMO_ALTERACOES_POR_PAGINA = 1000
+
+
+class CursorInvalido(Exception):
+    """Cursor adulterado ou de outro formato: refazer a sincronização completa"""
+
+
+def gerar_cursor(produtos, movimentacoes):
+    return signing.dumps(
+        {'f': FORMATO_CURSOR, 'p': produtos, 'm': movimentacoes},
+        salt=SALT_CURSOR, compress=True,
+    )
+
+
+def _chave_valida(valores):
+    return isinstance(valores, list) and len(valores) == 2
+
+
+def ler_cursor(token):
+    """Chaves de produtos e de movimentações"""
+    try:
+        dados = signing.loads(token, salt=SALT_CURSOR)
+    except signing.BadSignature:
+        raise CursorInvalido('Cursor inválido.')
+    if not isinstance(dados, dict) or dados.get('f') != FORMATO_CURSOR:
+        raise CursorInvalido('Cursor inválido.')
+    # Chave de produtos nula: nenhum produto recebido ainda
+    if not _chave_valida(dados.get('m')) or (
+        dados.get('p') is not None and not _chave_valida(dados['p'])
+    ):
+        raise CursorInvalido('Cursor inválido.')
+    return dados['p'], dados['m']
+
+
+def _visiveis(queryset):
+    """Só as linhas de transações já terminadas"""
+    visivel = VersaoCatalogo.versao_visivel()
+    return queryset.filter(visivel) if visivel is not None else queryset
+
+
+def _pagina(queryset, ordenacao, chave, por_pagina):
+    """Linhas posteriores a ``chave`` (ou desde o início) e se há mais"""
+    queryset = _visiveis(queryset)
+    if chave is not None:
+        queryset = queryset.filter(depois_de(ordenacao, chave))
+    linhas = list(queryset.order_by(*ordenacao)[:por_pagina + 1])
+    return linhas[:por_pagina], len(linhas) > por_pagina
+
+
+def _chave(linha, ordenacao, padrao):
+    return [serializar(linha[coluna]) for coluna in ordenacao] if linha else padrao
+
+
+def alteracoes_desde(token=None, por_pagina=ALTERACOES_POR_PAGINA):
+    """
+    Uma página de alterações a partir do cursor ``token``.
+
+    Retorna um dict com ``produtos``, ``removidos`` (ids desativados),
+    ``movimentacoes``, o ``cursor`` da próxima chamada e ``tem_mais``
+    (chamar de novo em seguida em vez de esperar o próximo ciclo).
+    Levanta ``CursorInvalido`` para um cursor que não pode ser lido.
+    """
+    por_pagina = max(1, min(por_pagina, MAXIMO_ALTERACOES_POR_PAGINA))
+
+    if token:
+        chave_produtos, chave_movimentacoes = ler_cursor(token)
+    else:
+        # Movimentações anteriores à primeira sincronização não são enviadas:
+        # as próximas terão versão maior que a da última já gravada
+        ultima = _visiveis(MovimentacaoEstoque.objects).order_by('-versao', '-id').values_list('versao', 'id').first()
+        chave_produtos, chave_movimentacoes = None, list(ultima or (0, 0))
+
+    produtos, mais_produtos = _pagina(
+        Produto.objects.values(*CAMPOS_PRODUTO, 'ativo'), ORDENACAO_PRODUTOS, chave_produtos, por_pagina
+    )
+    movimentacoes, mais_movimentacoes = _pagina(
+        MovimentacaoEstoque.objects.values(*CAMPOS_MOVIMENTACAO),
+        ORDENACAO_MOVIMENTACOES, chave_movimentacoes, por_pagina,
+    )
+
+    armazenamento = Produto._meta.get_field('imagem').storage
+    ativos, removidos = [], []
+    for produto in produtos:
+        if not produto.pop('ativo'):
+            removidos.append(produto['id'])
+            continue
+        produto['imagem'] = armazenamento.url(produto['imagem']) if produto['imagem'] else None
+        ativos.append(produto)
+
+    cursor = gerar_cursor(
+        _chave(produtos[-1] if produtos else None, ORDENACAO_PRODUTOS, chave_produtos),
+        _chave(movimentacoes[-1] if movimentacoes else None, ORDENACAO_MOVIMENTACOES, chave_movimentacoes),
+    )
+    return {
+        'produtos': ativos,
+        'removidos': removidos,
+        'movimentacoes': movimentacoes,
+        'cursor': cursor,
+        'tem_mais': mais_produtos or mais_movimentacoes,
+    }
@@ -0,0 +1,77 @@
+"""
+Tarefas executadas pelo worker (``manage.py processar_tarefas``)
+
+Importado em ``EstoqueConfig.ready`` para registrar as funções na fila.
+"""
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+
+from .alertas import enviar_resumo
+from .fila import tarefa
+from .imagens import processar_imagem
+from .importacao import ArquivoInvalido, importar_produtos, ler_planilha, linhas_relatorio
+from .inventario import InventarioEncerrado, fechar_inventario
+from .models import InventarioFisico
+
+
+# Linhas ignoradas detalhadas no relatório de uma importação
+ERROS_NO_RELATORIO = 200
+
+
+@tarefa(nome='processar_imagem')
+def processar_imagem_produto(tarefa, produto_id):
+    return {'processada': processar_imagem(produto_id)}
+
+
+@tarefa(
+    nome='fechar_inventario',
+    definitivas=(InventarioEncerrado, InventarioFisico.DoesNotExist, User.DoesNotExist),
+)
+def concluir_inventario(tarefa, inventario_id, usuario_id):
+    inventario = InventarioFisico.objects.get(pk=inventario_id)
+    usuario = User.objects.get(pk=usuario_id)
+    tarefa.registrar_progresso(10, 'Aplicando as contagens ao estoque')
+
+    def avancar(lidos, total):
+        tarefa.registrar_progresso(10 + 80 * min(lidos, total) // max(total, 1), f'{lidos} de {total} itens aplicados')
+
+    return {'ajustes': fechar_inventario(inventario, usuario, progresso=avancar)}
+
+
+@tarefa(nome='enviar_alertas')
+def enviar_alertas_estoque(tarefa):
+    return {'entregues': enviar_resumo()}
+
+
+@tarefa(nome='importar_produtos')
+def importar_planilha(tarefa, caminho, nome_arquivo):
+    """Importa a planilha enviada pela tela de importação (guardada em ``caminho``)"""
+    tarefa.registrar_progresso(10, 'Importando as linhas da planilha')
+    apagar = True
+    try:
+        tamanho = default_storage.size(caminho)
+        with default_storage.open(caminho) as arquivo:
+            def avancar(linha):
+                # Posição no arquivo: as linhas só são contadas durante a leitura
+                lido = min(arquivo.file.tell(), tamanho) if tamanho else 0
+                tarefa.registrar_progresso(
+                    max(tarefa.progresso, 10 + 85 * lido // max(tamanho, 1)), f'{linha} linhas lidas'
+                )
+
+            resultado = importar_produtos(ler_planilha(arquivo.file, nome_arquivo), progresso=avancar)
+    except ArquivoInvalido as exc:
+        # Erro do usuário: mostrado na tela, sem novas tentativas
+        return {'erro': str(exc)}
+    except Exception:
+        # Com nova tentativa agendada a planilha ainda vai ser lida
+        apagar = tarefa.tentativas >= tarefa.maximo_tentativas
+        raise
+    finally:
+        if apagar:
+            default_storage.delete(caminho)
+    return {
+        'criados': resultado['criados'],
+        'atualizados': resultado['atualizados'],
+        'ignoradas': len(resultado['erros']),
+        'relatorio': list(linhas_relatorio(resultado['erros'][:ERROS_NO_RELATORIO])),
+    }
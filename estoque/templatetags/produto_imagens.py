@@ -0,0 +1,51 @@
+"""
+``{% imagem_produto produto sizes="..." %}``: ``<picture>`` com as miniaturas
+WebP/JPEG em ``srcset`` e ``loading="lazy"``
+
+Enquanto a imagem não foi processada (estoque/imagens.py) gera um ``<img>``
+simples com a original, também com carregamento adiado.
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..imagens import nome_variante
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def imagem_produto(produto, sizes='100vw', classe='', estilo='', carregamento='lazy'):
+    """``carregamento='eager'`` para a imagem principal visível ao abrir a página"""
+    imagem = produto.imagem
+    if not imagem:
+        return ''
+
+    atributos = format_html(
+        'alt="{}" class="{}" style="{}" loading="{}" decoding="async"',
+        produto.nome, classe, estilo, carregamento,
+    )
+    variantes = produto.imagem_variantes or {}
+    larguras = variantes.get('larguras')
+    if not larguras:
+        return format_html('<img src="{}" {}>', imagem.url, atributos)
+
+    armazenamento = imagem.storage
+
+    def srcset(extensao):
+        return format_html_join(
+            ', ', '{} {}w',
+            ((armazenamento.url(nome_variante(imagem.name, largura, extensao)), largura) for largura in larguras),
+        )
+
+    # A original entra como a maior opção do srcset JPEG
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}, {} {}w" sizes="{}" width="{}" height="{}" {}>'
+        '</picture>',
+        srcset('webp'), sizes,
+        armazenamento.url(nome_variante(imagem.name, larguras[-1], 'jpg')),
+        srcset('jpg'), imagem.url, variantes['largura'], sizes,
+        variantes['largura'], variantes['altura'], atributos,
+    )
@@ -1,3 +1,1578 @@
-from django.test import TestCase
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import exportacao, giro
+from .alertas import PushLocal
+from .benchmark import Benchmark, comparar
+from .busca import BuscaSQLite, buscar_produtos, ranquear_produtos
+from .dados_sinteticos import gerar_catalogo
+from .estatisticas import CHAVE_DASHBOARD, contadores_cache
+from .eventos import LIMITE_CONSULTA, RECENTES_NA_ATUALIZACAO, Central
+from .fila import TAREFAS, enfileirar, executar, recuperar_expiradas, reservar, tarefa
+from .giro import reconstruir_resumo, relatorio_giro
+from .previsao import calcular_previsoes
+from .imagens import nome_variante
+from .idempotencia import limpar_chaves
+from .importacao import importar_produtos, ler_planilha
+from .inventario import (
+    InventarioEncerrado, abrir_inventario, fechar_inventario, registrar_contagens, resumo_inventario,
+)
+from .middleware import InstrumentacaoMiddleware, OrcamentoConsultasExcedido
+from .models import (
+    Categoria, Fornecedor, Produto, MovimentacaoEstoque, SnapshotEstoque, ChaveIdempotencia, Tarefa,
+    MovimentacaoDiaria, PrevisaoDemanda, AlertaEstoque, InscricaoPush,
+)
+from .valorizacao import gerar_snapshot
+from .services import (
+    registrar_movimentacao, registrar_movimentacoes_em_lote, EstoqueInsuficiente
+)
+from .sincronizacao import SALT_CURSOR, alteracoes_desde
+
+
+def criar_produto(codigo='P001', **kwargs):
+    categoria, _ = Categoria.objects.get_or_create(nome='Geral')
+    dados = {
+        'nome': f'Produto {codigo}',
+        'categoria': categoria,
+        'quantidade_atual': 10,
+        'quantidade_minima': 2,
+        'preco_custo': 5,
+        'preco_venda': 8,
+    }
+    dados.update(kwargs)
+    return Produto.objects.create(codigo=codigo, **dados)
+
+
+class MovimentacaoServiceTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto()
+
+    def test_entrada_atualiza_estoque_e_historico(self):
+        mov = registrar_movimentacao(self.produto, 'ENTRADA', 5, self.usuario, 'Compra')
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_atual, Decimal('15'))
+        self.assertEqual(mov.quantidade_anterior, Decimal('10'))
+        self.assertEqual(mov.quantidade_atual, Decimal('15'))
+
+    def test_saida_maior_que_estoque_nao_altera_nada(self):
+        with self.assertRaises(EstoqueInsuficiente):
+            registrar_movimentacao(self.produto, 'SAIDA', 11, self.usuario, 'Venda')
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_atual, Decimal('10'))
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_ajuste_define_quantidade_absoluta(self):
+        mov = registrar_movimentacao(self.produto, 'AJUSTE', 4, self.usuario, 'Inventário')
+
+        self.assertEqual(mov.quantidade, Decimal('6'))
+        self.assertEqual(Produto.objects.get(pk=self.produto.pk).quantidade_atual, Decimal('4'))
+
+    def test_abaixo_minimo_acompanha_movimentacoes_e_edicao(self):
+        self.assertFalse(self.produto.abaixo_minimo)
+
+        registrar_movimentacao(self.produto, 'SAIDA', 8, self.usuario, 'Venda')
+        self.assertTrue(Produto.objects.filter(pk=self.produto.pk, abaixo_minimo=True).exists())
+
+        self.produto.refresh_from_db()
+        self.produto.quantidade_minima = 1
+        self.produto.save()
+        # Calculado pelo banco: só aparece na instância depois de recarregar
+        self.produto.refresh_from_db(fields=['abaixo_minimo'])
+        self.assertFalse(self.produto.abaixo_minimo)
+
+    def test_views_usam_servico(self):
+        self.client.force_login(self.usuario)
+        self.client.post(
+            reverse('estoque:entrada_estoque', args=[self.produto.pk]),
+            {'quantidade': '3', 'motivo': 'Compra'},
+        )
+        self.client.post(
+            reverse('estoque:saida_estoque', args=[self.produto.pk]),
+            {'quantidade': '1', 'motivo': 'Venda'},
+        )
+        self.client.post(
+            reverse('estoque:ajuste_estoque', args=[self.produto.pk]),
+            {'nova_quantidade': '20', 'motivo': 'Contagem'},
+        )
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_atual, Decimal('20'))
+        self.assertEqual(
+            list(MovimentacaoEstoque.objects.order_by('id').values_list('tipo', flat=True)),
+            ['ENTRADA', 'SAIDA', 'AJUSTE'],
+        )
+
+
+class MovimentacaoLoteTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto('P001', quantidade_atual=10)
+        self.outro = criar_produto('P002', quantidade_atual=0, qr_code='QR-P002')
+
+    def test_lote_aplica_linhas_validas_em_ordem(self):
+        itens = [
+            {'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '5', 'motivo': 'Compra'},
+            {'produto': 'QR-P002', 'tipo': 'ENTRADA', 'quantidade': 2, 'motivo': 'Compra'},
+            {'produto': 'P001', 'tipo': 'SAIDA', 'quantidade': '15', 'motivo': 'Venda'},
+            {'produto': 'P001', 'tipo': 'SAIDA', 'quantidade': '1', 'motivo': 'Venda'},
+            {'produto': 'NAO-EXISTE', 'tipo': 'ENTRADA', 'quantidade': '1', 'motivo': 'Compra'},
+            {'produto': 'P002', 'tipo': 'AJUSTE', 'quantidade': '1', 'motivo': 'Compra'},
+        ]
+
+        # Busca, versão do catálogo, INSERT e UPDATE em lote e o resumo
+        # diário, independente do número de linhas (mais savepoint e o lock
+        # de escrita no SQLite)
+        with CaptureQueriesContext(connection) as consultas:
+            resultados = registrar_movimentacoes_em_lote(itens, self.usuario)
+        self.assertLessEqual(len(consultas), 9)
+
+        self.assertEqual(
+            [resultado['status'] for resultado in resultados],
+            ['ok', 'ok', 'ok', 'erro', 'erro', 'erro'],
+        )
+        self.assertEqual(resultados[2]['quantidade_atual'], Decimal('0'))
+        self.produto.refresh_from_db()
+        self.outro.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_atual, Decimal('0'))
+        self.assertEqual(self.outro.quantidade_atual, Decimal('2'))
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 3)
+
+    def test_linha_rejeitada_nao_altera_o_produto(self):
+        antes = Produto.objects.values('atualizado_em', 'versao').get(pk=self.outro.pk)
+        resultados = registrar_movimentacoes_em_lote(
+            [{'produto': 'P002', 'tipo': 'SAIDA', 'quantidade': '1', 'motivo': 'Venda'}], self.usuario
+        )
+        self.assertEqual(resultados[0]['status'], 'erro')
+        self.assertEqual(Produto.objects.values('atualizado_em', 'versao').get(pk=self.outro.pk), antes)
+
+    def test_endpoint_json(self):
+        url = reverse('estoque:movimentacao_lote')
+        payload = {'itens': [
+            {'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '1', 'motivo': 'Compra', 'documento': 'NF 1'},
+        ]}
+
+        resposta = self.client.post(url, json.dumps(payload), content_type='application/json')
+        self.assertEqual(resposta.status_code, 401)
+
+        self.client.force_login(self.usuario)
+        resposta = self.client.post(url, json.dumps(payload), content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['aplicadas'], 1)
+
+        resposta = self.client.post(url, 'não é json', content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+
+
+class SincronizacaoOfflineTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('coletor')
+        self.produto = criar_produto('P001')
+        self.client.force_login(self.usuario)
+        self.url = reverse('estoque:movimentacao_sincronizar')
+
+    def enviar(self, itens):
+        return self.client.post(self.url, json.dumps({'itens': itens}), content_type='application/json')
+
+    def test_reenvio_nao_duplica_movimentacoes(self):
+        itens = [
+            {'id': 'a1', 'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '5', 'motivo': 'Compra'},
+            {'id': 'a2', 'produto': 'P001', 'tipo': 'SAIDA', 'quantidade': '50', 'motivo': 'Venda'},
+            {'id': 'a1', 'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '5', 'motivo': 'Compra'},
+            {'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '1', 'motivo': 'Sem id'},
+        ]
+
+        primeira = self.enviar(itens).json()
+        self.assertEqual(
+            [(r['id'], r['status'], r.get('repetido', False)) for r in primeira['resultados']],
+            [('a1', 'ok', False), ('a2', 'erro', False), ('a1', 'ok', True), (None, 'erro', False)],
+        )
+
+        # A fila reenviada depois de uma queda de conexão devolve as mesmas respostas
+        segunda = self.enviar(itens[:2]).json()
+        self.assertTrue(all(r['repetido'] for r in segunda['resultados']))
+        self.assertEqual(segunda['resultados'][0]['movimentacao_id'], primeira['resultados'][0]['movimentacao_id'])
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 1)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_atual, 15)
+
+    def test_chaves_sao_por_usuario_e_expiram(self):
+        item = {'id': 'b1', 'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '1', 'motivo': 'Compra'}
+        self.enviar([item])
+        self.client.force_login(User.objects.create_user('outro'))
+        self.assertNotIn('repetido', self.enviar([item]).json()['resultados'][0])
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 2)
+
+        ChaveIdempotencia.objects.update(criado_em=timezone.now() - timedelta(days=8))
+        self.assertEqual(limpar_chaves(7), 2)
+
+    def test_exige_autenticacao(self):
+        self.client.logout()
+        self.assertEqual(self.enviar([]).status_code, 401)
+
+
+class SincronizacaoIncrementalTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('aplicativo')
+        self.client.force_login(self.usuario)
+        self.url = reverse('estoque:sincronizacao_alteracoes')
+        self.p1, self.p2 = criar_produto('P001'), criar_produto('P002')
+        criar_produto('P003', ativo=False)
+        registrar_movimentacao(self.p1, 'ENTRADA', 1, self.usuario, 'Antes da réplica')
+
+    def sincronizar(self, cursor=None, **params):
+        if cursor:
+            params['cursor'] = cursor
+        resposta = self.client.get(self.url, params)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def test_carga_inicial_e_alteracoes_desde_o_cursor(self):
+        # Carga inicial paginada, sem histórico de movimentações; o inativo vai só pelo id
+        primeira = self.sincronizar(limite=2)
+        self.assertTrue(primeira['tem_mais'])
+        segunda = self.sincronizar(primeira['cursor'], limite=2)
+        self.assertFalse(segunda['tem_mais'])
+        self.assertEqual(
+            [p['codigo'] for p in primeira['produtos'] + segunda['produtos']], ['P002', 'P001']
+        )
+        self.assertEqual(primeira['removidos'] + segunda['removidos'], [Produto.objects.get(codigo='P003').pk])
+        self.assertEqual(primeira['movimentacoes'] + segunda['movimentacoes'], [])
+
+        registrar_movimentacao(self.p2, 'SAIDA', 3, self.usuario, 'Venda')
+        self.p1.ativo = False
+        self.p1.save()
+
+        alteracoes = self.sincronizar(segunda['cursor'])
+        self.assertEqual([p['codigo'] for p in alteracoes['produtos']], ['P002'])
+        self.assertEqual(alteracoes['produtos'][0]['quantidade_atual'], '7.00')
+        self.assertEqual(alteracoes['removidos'], [self.p1.pk])
+        self.assertEqual(
+            [(m['produto_id'], m['tipo']) for m in alteracoes['movimentacoes']], [(self.p2.pk, 'SAIDA')]
+        )
+
+        vazia = self.sincronizar(alteracoes['cursor'])
+        self.assertEqual((vazia['produtos'], vazia['removidos'], vazia['movimentacoes']), ([], [], []))
+
+    def test_produto_desativado_durante_a_carga_inicial_sai_da_replica(self):
+        primeira = self.sincronizar(limite=1)
+        self.assertEqual([p['codigo'] for p in primeira['produtos']], ['P002'])
+        self.p2.ativo = False
+        self.p2.save()
+
+        removidos, cursor, tem_mais = [], primeira['cursor'], True
+        while tem_mais:
+            pagina = self.sincronizar(cursor, limite=1)
+            removidos += pagina['removidos']
+            cursor, tem_mais = pagina['cursor'], pagina['tem_mais']
+        self.assertIn(self.p2.pk, removidos)
+
+    def test_transacao_longa_entra_pela_versao_e_nao_pelo_horario(self):
+        cursor = self.sincronizar()['cursor']
+        # Horários gravados no início de uma transação que terminou muito depois
+        inicio = timezone.now() - timedelta(minutes=10)
+        registrar_movimentacao(self.p2, 'ENTRADA', 2, self.usuario, 'Fechamento demorado')
+        Produto.objects.filter(pk=self.p2.pk).update(atualizado_em=inicio)
+        MovimentacaoEstoque.objects.filter(produto=self.p2).update(criado_em=inicio, data_movimentacao=inicio)
+
+        alteracoes = self.sincronizar(cursor)
+        self.assertEqual([p['codigo'] for p in alteracoes['produtos']], ['P002'])
+        self.assertEqual([m['produto_id'] for m in alteracoes['movimentacoes']], [self.p2.pk])
+        self.assertGreater(alteracoes['produtos'][0]['versao'], 0)
+
+    def test_cursor_invalido_e_autenticacao(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'adulterado'}).status_code, 410)
+        # Cursor do formato anterior (chaves por horário): nova carga completa
+        antigo = signing.dumps(
+            {'p': None, 'm': [timezone.now().isoformat(), 0], 'i': True}, salt=SALT_CURSOR, compress=True
+        )
+        self.assertEqual(self.client.get(self.url, {'cursor': antigo}).status_code, 410)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class DashboardCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caches['contadores'].clear()
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto(quantidade_atual=10, quantidade_minima=2, preco_custo=5)
+
+    def test_cache_e_invalidacao_por_movimentacao(self):
+        # Validador da ETag, leitura do cache, as quatro consultas do painel e
+        # a gravação no cache em banco (contagem para o descarte, SELECT e
+        # INSERT num savepoint)
+        with self.assertNumQueries(11):
+            resposta = self.client.get(reverse('estoque:dashboard'))
+        self.assertEqual(resposta.context['valor_total_estoque'], Decimal('50'))
+
+        # Só o validador da ETag e a leitura do cache
+        with self.assertNumQueries(2):
+            self.client.get(reverse('estoque:dashboard'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacao(self.produto, 'SAIDA', 9, self.usuario, 'Venda')
+
+        resposta = self.client.get(reverse('estoque:dashboard'))
+        self.assertEqual(resposta.context['valor_total_estoque'], Decimal('5'))
+        self.assertEqual(resposta.context['produtos_baixo_estoque'], 1)
+        self.assertEqual(resposta.context['total_movimentacoes'], 1)
+        self.assertEqual(contadores_cache(), {'acertos': 1, 'falhas': 2, 'taxa_acerto': 0.3333})
+
+    def test_movimentacao_em_lote_invalida(self):
+        self.client.get(reverse('estoque:dashboard'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacoes_em_lote(
+                [{'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '10', 'motivo': 'Compra'}],
+                self.usuario,
+            )
+
+        resposta = self.client.get(reverse('estoque:dashboard'))
+        self.assertEqual(resposta.context['valor_total_estoque'], Decimal('100'))
+
+    def test_cache_guarda_so_os_campos_exibidos(self):
+        self.usuario.first_name = 'Ana'
+        self.usuario.save()
+        registrar_movimentacao(self.produto, 'SAIDA', 9, self.usuario, 'Venda')
+
+        resposta = self.client.get(reverse('estoque:dashboard'))
+        self.assertContains(resposta, 'Venda - Ana')
+        self.assertContains(resposta, 'Saída')
+
+        guardadas = cache.get(CHAVE_DASHBOARD)
+        self.assertEqual(guardadas['ultimas_movimentacoes'][0]['usuario'], 'Ana')
+        self.assertNotIn(self.usuario.password, pickle.dumps(guardadas).decode('latin-1'))
+
+
+class SnapshotEstoqueTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        fornecedor = Fornecedor.objects.create(nome='TechMais')
+        self.produto = criar_produto('P001', quantidade_atual=10, preco_custo=5, preco_venda=8,
+                                     fornecedor=fornecedor)
+        criar_produto('P002', quantidade_atual=4, preco_custo=2, preco_venda=3)
+
+    def linha(self, dimensao, nome):
+        return SnapshotEstoque.objects.get(dimensao=dimensao, nome=nome)
+
+    def test_gerar_snapshot(self):
+        gerar_snapshot()
+
+        total = self.linha('TOTAL', 'Total')
+        self.assertEqual((total.total_produtos, total.valor_custo, total.valor_venda),
+                         (2, Decimal('58'), Decimal('92')))
+        self.assertEqual(self.linha('FORNECEDOR', 'TechMais').valor_custo, Decimal('50'))
+        self.assertEqual(self.linha('FORNECEDOR', 'Sem fornecedor').valor_custo, Decimal('8'))
+
+    def test_movimentacoes_atualizam_snapshot_incrementalmente(self):
+        gerar_snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacao(self.produto, 'SAIDA', 4, self.usuario, 'Venda')
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacoes_em_lote(
+                [{'produto': 'P002', 'tipo': 'ENTRADA', 'quantidade': '1', 'motivo': 'Compra'}],
+                self.usuario,
+            )
+
+        incremental = {
+            (linha.dimensao, linha.nome): (linha.quantidade, linha.valor_custo, linha.valor_venda)
+            for linha in SnapshotEstoque.objects.all()
+        }
+        gerar_snapshot()
+        recalculado = {
+            (linha.dimensao, linha.nome): (linha.quantidade, linha.valor_custo, linha.valor_venda)
+            for linha in SnapshotEstoque.objects.all()
+        }
+        self.assertEqual(incremental, recalculado)
+        self.assertEqual(incremental[('TOTAL', 'Total')][1], Decimal('40'))
+
+    def test_relatorio(self):
+        resposta = self.client.get(reverse('estoque:valor_estoque'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['total'].valor_custo, Decimal('58'))
+        self.assertEqual(len(resposta.context['historico']), 1)
+
+
+class GiroEstoqueTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista')
+        self.p1 = criar_produto('P001', quantidade_atual=10, preco_custo=5)
+        self.p2 = criar_produto('P002', quantidade_atual=10, preco_custo=1)
+        self.p3 = criar_produto('P003', quantidade_atual=10, preco_custo=100)
+        registrar_movimentacao(self.p1, 'SAIDA', 6, self.usuario, 'Venda')
+        registrar_movimentacoes_em_lote([
+            {'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '2', 'motivo': 'Compra'},
+            {'produto': 'P002', 'tipo': 'SAIDA', 'quantidade': '1', 'motivo': 'Venda'},
+            {'produto': 'P003', 'tipo': 'SAIDA', 'quantidade': '1', 'motivo': 'Venda'},
+        ], self.usuario)
+
+    def resumo(self):
+        return set(MovimentacaoDiaria.objects.values_list(
+            'produto__codigo', 'dia', 'tipo', 'quantidade', 'variacao', 'movimentacoes'
+        ))
+
+    def test_resumo_incremental_igual_ao_reconstruido(self):
+        registrar_movimentacao(self.p1, 'SAIDA', 1, self.usuario, 'Venda')
+        incremental = self.resumo()
+        hoje = timezone.localdate()
+        self.assertIn(('P001', hoje, 'SAIDA', Decimal('7'), Decimal('-7'), 2), incremental)
+
+        self.assertEqual(reconstruir_resumo(), 4)
+        self.assertEqual(self.resumo(), incremental)
+
+        # Gravado aos blocos, sem juntar o histórico inteiro antes
+        with mock.patch('estoque.giro.LINHAS_POR_GRAVACAO', 3), \
+                mock.patch('estoque.giro._somar', wraps=giro._somar) as somar:
+            self.assertEqual(reconstruir_resumo(), 4)
+        self.assertEqual([len(chamada.args[0]) for chamada in somar.call_args_list], [3, 1])
+        self.assertEqual(self.resumo(), incremental)
+
+    def test_relatorio_de_giro(self):
+        relatorio = relatorio_giro(dias=30)
+
+        movimentados = relatorio['mais_movimentados']
+        self.assertEqual([linha['produto'].codigo for linha in movimentados], ['P001', 'P002', 'P003'])
+        p1 = movimentados[0]
+        self.assertEqual((p1['entradas'], p1['saidas'], p1['total_movimentacoes']), (2, 6, 2))
+        # Estoque de 10 no início e 6 no fim: 6 saídas sobre a média de 8
+        self.assertEqual(p1['giro'], Decimal('0.75'))
+        self.assertEqual(p1['cobertura_dias'], 30)
+        self.assertEqual([linha['classe'] for linha in movimentados], ['A', 'C', 'A'])
+        self.assertEqual(
+            [(classe['classe'], classe['produtos'], classe['valor']) for classe in relatorio['curva_abc']],
+            [('A', 2, Decimal('130')), ('B', 0, 0), ('C', 1, Decimal('1'))],
+        )
+
+        resposta = self.client.get(reverse('estoque:giro_estoque'), {'dias': 'x'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['dias'], 90)
+        self.assertContains(resposta, 'Produto P001')
+
+
+@override_settings(
+    PREVISAO_JANELA_DIAS=10, PREVISAO_ALFA=0.5, PREVISAO_PRAZO_REPOSICAO_DIAS=4, PREVISAO_FATOR_SERVICO=2,
+)
+class PrevisaoDemandaTest(TestCase):
+    def test_previsao_e_reposicao_sugerida(self):
+        hoje = timezone.localdate()
+        constante = criar_produto('P001', quantidade_atual=30, quantidade_minima=5)
+        pontual = criar_produto('P002', quantidade_atual=100)
+        parado = criar_produto('P003')
+        PrevisaoDemanda.objects.create(produto=parado, ponto_pedido=50, calculado_em=timezone.now())
+
+        MovimentacaoDiaria.objects.bulk_create(
+            [MovimentacaoDiaria(produto=constante, dia=hoje - timedelta(days=idade), tipo='SAIDA', quantidade=10)
+             for idade in range(0, 11)]
+            + [MovimentacaoDiaria(produto=pontual, dia=hoje - timedelta(days=1), tipo='SAIDA', quantidade=20)]
+        )
+
+        self.assertEqual(calcular_previsoes(hoje), 2)
+
+        # 10 por dia, sem variação: ponto de pedido = 10 x 4 dias
+        previsao = PrevisaoDemanda.objects.get(produto=constante)
+        self.assertEqual((previsao.media_diaria, previsao.demanda_diaria, previsao.desvio_diario),
+                         (Decimal('10'), Decimal('10'), Decimal('0')))
+        self.assertEqual((previsao.dias_com_saida, previsao.ponto_pedido), (10, Decimal('40')))
+        self.assertEqual(previsao.dias_cobertura, 3)
+        # Uma saída de 20 ontem: média 2, desvio 6, segurança 2 x 6 x raiz(4)
+        previsao = PrevisaoDemanda.objects.get(produto=pontual)
+        self.assertEqual((previsao.media_diaria, previsao.desvio_diario), (Decimal('2'), Decimal('6')))
+        self.assertEqual((previsao.estoque_seguranca, previsao.ponto_pedido), (Decimal('24'), Decimal('64.04')))
+        self.assertFalse(PrevisaoDemanda.objects.filter(produto=parado).exists())
+
+        resposta = self.client.get(reverse('estoque:estoque_baixo'))
+        self.assertEqual(list(resposta.context['reposicao_sugerida']), [constante])
+        self.assertContains(resposta, 'Sugerido: 40')
+
+
+@override_settings(PUSH_BACKEND='estoque.alertas.PushLocal', PUSH_VAPID_CHAVE_PUBLICA='BChavePublica')
+class AlertaEstoqueTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista')
+        self.p1 = criar_produto('P001', quantidade_atual=10, quantidade_minima=5)
+        criar_produto('P002', quantidade_atual=10, quantidade_minima=5)
+        enviadas = mock.patch.object(PushLocal, 'enviadas', [])
+        enviadas.start()
+        self.addCleanup(enviadas.stop)
+
+    def movimentar(self, tipo, quantidade):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacao(self.p1, tipo, quantidade, self.usuario, 'Teste')
+
+    def test_cruzamento_do_minimo_gera_um_resumo(self):
+        self.movimentar('SAIDA', 3)
+        self.assertFalse(AlertaEstoque.objects.exists())
+        self.movimentar('SAIDA', 3)
+        # Voltar acima do mínimo e cruzar de novo não repete o alerta pendente
+        self.movimentar('ENTRADA', 5)
+        self.movimentar('SAIDA', 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacoes_em_lote(
+                [{'produto': 'P002', 'tipo': 'SAIDA', 'quantidade': '6', 'motivo': 'Venda'}], self.usuario
+            )
+
+        self.assertEqual(
+            list(AlertaEstoque.objects.order_by('id').values_list('produto__codigo', 'quantidade')),
+            [('P001', Decimal('4')), ('P002', Decimal('4'))],
+        )
+        envio = Tarefa.objects.get(nome='enviar_alertas')
+        self.assertGreater(envio.executar_apos, timezone.now())
+
+        InscricaoPush.objects.create(usuario=self.usuario, endpoint='https://push.local/1', p256dh='x', auth='y')
+        InscricaoPush.objects.create(usuario=self.usuario, endpoint='https://push.local/2', p256dh='x', auth='y')
+        Tarefa.objects.filter(pk=envio.pk).update(executar_apos=timezone.now())
+        with mock.patch.object(PushLocal, 'expirados', {'https://push.local/2'}):
+            call_command('processar_tarefas', uma_vez=True, stdout=io.StringIO())
+
+        self.assertEqual(len(PushLocal.enviadas), 1)
+        endpoint, mensagem = PushLocal.enviadas[0]
+        self.assertEqual(endpoint, 'https://push.local/1')
+        self.assertEqual(mensagem['titulo'], '2 produtos com estoque baixo')
+        self.assertEqual(mensagem['corpo'], 'Produto P001 (4 UN), Produto P002 (4 UN)')
+        self.assertEqual(list(InscricaoPush.objects.values_list('endpoint', flat=True)), ['https://push.local/1'])
+        self.assertFalse(AlertaEstoque.objects.filter(enviado_em__isnull=True).exists())
+
+    def test_inscricao(self):
+        url = reverse('estoque:push_inscricao')
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).json(), {'chave_publica': 'BChavePublica'})
+        inscricao = {'endpoint': 'https://push.local/abc', 'keys': {'p256dh': 'chave', 'auth': 'segredo'}}
+        resposta = self.client.post(url, json.dumps(inscricao), content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(InscricaoPush.objects.get().usuario, self.usuario)
+
+        resposta = self.client.post(url, json.dumps({'endpoint': 'http://inseguro'}), content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        resposta = self.client.delete(url, json.dumps({'endpoint': inscricao['endpoint']}), content_type='application/json')
+        self.assertEqual(resposta.json(), {'removidas': 1})
+
+
+@override_settings(EVENTOS_CONSULTA_SEGUNDOS=0, EVENTOS_ESTATISTICAS_SEGUNDOS=0)
+class EventosTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista')
+        self.produto = criar_produto('P001', quantidade_atual=10, quantidade_minima=5)
+        self.outro = criar_produto('P002')
+
+    def movimentar(self, produto, quantidade):
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimentacao(produto, 'SAIDA', quantidade, self.usuario, 'Venda')
+
+    async def proximos(self, url, quantidade):
+        """Abre o stream, movimenta os dois produtos e lê ``quantidade`` eventos"""
+        resposta = await self.async_client.get(url)
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        stream = aiter(resposta.streaming_content)
+        try:
+            self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+            await sync_to_async(self.movimentar)(self.outro, 1)
+            await sync_to_async(self.movimentar)(self.produto, 6)
+            return [(await anext(stream)).decode() for _ in range(quantidade)]
+        finally:
+            await stream.aclose()
+
+    def test_sob_wsgi_responde_204(self):
+        self.assertEqual(self.client.get(reverse('estoque:eventos')).status_code, 204)
+
+    async def test_dashboard_recebe_movimentacoes_e_estatisticas(self):
+        eventos = await self.proximos(reverse('estoque:eventos'), 6)
+
+        self.assertEqual(
+            [evento.split('\n', 1)[0] for evento in eventos],
+            ['event: movimentacao', 'event: estatisticas', 'event: alerta'] * 2,
+        )
+        self.assertIn('Produto P001', eventos[3])
+        # Os cartões já trazem o produto que ficou abaixo do mínimo
+        self.assertIn('<h3>1</h3>', eventos[4])
+        self.assertIn('Produto P001', eventos[5])
+        self.assertTrue(all(evento.endswith('\n\n') for evento in eventos))
+
+    async def test_pagina_do_produto_recebe_so_o_produto(self):
+        eventos = await self.proximos(reverse('estoque:eventos_produto', args=[self.produto.pk]), 2)
+
+        self.assertTrue(eventos[0].startswith('event: movimentacao\ndata: <tr>'))
+        self.assertTrue(eventos[1].startswith('event: estoque\n'))
+        self.assertIn('4,00 UN', eventos[1])
+        self.assertIn('Estoque baixo!', eventos[1])
+
+    def test_consulta_ao_banco_ignora_as_ja_publicadas(self):
+        eventos = Central()
+        self.assertEqual(eventos.consultar_banco(), [])
+
+        # Gravada por outro processo, sem passar pelo signal deste
+        de_fora = MovimentacaoEstoque.objects.create(
+            produto=self.produto, tipo='ENTRADA', quantidade=1,
+            quantidade_anterior=10, quantidade_atual=11, motivo='Compra', usuario=self.usuario,
+        )
+        local = MovimentacaoEstoque.objects.create(
+            produto=self.outro, tipo='ENTRADA', quantidade=1,
+            quantidade_anterior=10, quantidade_atual=11, motivo='Compra', usuario=self.usuario,
+        )
+        eventos.publicar([local])
+
+        self.assertEqual(eventos.consultar_banco(), [de_fora])
+        self.assertEqual(eventos.consultar_banco(), [])
+
+    def test_renderiza_sem_consulta_por_movimentacao(self):
+        # Como as do fechamento de inventário: só os ids do produto e do usuário
+        for quantidade in range(1, 6):
+            for produto in (self.produto, self.outro):
+                MovimentacaoEstoque.objects.create(
+                    produto_id=produto.pk, usuario_id=self.usuario.pk, tipo='AJUSTE', quantidade=quantidade,
+                    quantidade_anterior=10, quantidade_atual=quantidade, motivo='Inventário',
+                )
+        movimentacoes = list(MovimentacaoEstoque.objects.all())
+
+        with CaptureQueriesContext(connection) as consultas:
+            eventos = Central()._renderizar(movimentacoes, {None, self.produto.pk})
+        # Produtos e usuários, uma vez cada
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(len(eventos[None]), 10)
+        self.assertIn('Produto P002', eventos[None][0][1])
+        self.assertEqual([nome for nome, _ in eventos[self.produto.pk]], ['movimentacao'] * 5 + ['estoque'])
+
+    def test_acumulo_grande_vira_uma_atualizacao(self):
+        eventos = Central()
+        eventos.consultar_banco()
+        MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                produto=self.produto, tipo='AJUSTE', quantidade=1, quantidade_anterior=10,
+                quantidade_atual=10, motivo='Inventário', usuario=self.usuario,
+            )
+            for _ in range(LIMITE_CONSULTA + 50)
+        ])
+        ultima = MovimentacaoEstoque.objects.latest('pk')
+
+        with mock.patch.object(eventos, 'publicar') as publicar:
+            recentes = eventos.consultar_banco()
+        self.assertEqual(len(recentes), RECENTES_NA_ATUALIZACAO)
+        self.assertEqual(recentes[-1], ultima)
+        publicar.assert_called_once_with(recentes, recarregar=True)
+        self.assertEqual(eventos.consultar_banco(), [])
+
+
+class CacheHttpTest(TestCase):
+    def setUp(self):
+        criar_produto('P001')
+
+    def test_etag_e_vary_para_o_service_worker(self):
+        url = reverse('estoque:produto_list')
+        resposta = self.client.get(url)
+        self.assertIn('ETag', resposta)
+
+        repetida = self.client.get(url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+        # A página inteira e o fragmento HTMX não podem dividir a entrada de cache
+        self.assertIn('HX-Request', resposta['Vary'])
+
+    def test_views_respondem_304_sem_renderizar(self):
+        usuario = User.objects.create_user('leitor')
+        self.client.force_login(usuario)
+        produto = Produto.objects.get(codigo='P001')
+        urls = [
+            reverse('estoque:dashboard'),
+            reverse('estoque:produto_list'),
+            reverse('estoque:produto_detail', args=[produto.pk]),
+            reverse('estoque:produto_card_htmx', args=[produto.pk]),
+        ]
+        # As primeiras respostas definem o cookie CSRF, que faz parte da ETag
+        for url in urls:
+            self.client.get(url)
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+
+        for url in urls:
+            # Só a consulta indexada do validador, sem templates
+            with CaptureQueriesContext(connection) as consultas:
+                resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(resposta.status_code, 304, url)
+            self.assertLessEqual(len(consultas), 1, url)
+
+        registrar_movimentacao(produto, 'ENTRADA', 1, usuario, 'Compra')
+        for url in urls:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code, 200, url)
+
+    def test_mensagem_pendente_impede_304(self):
+        produto = Produto.objects.get(codigo='P001')
+        url = reverse('estoque:produto_detail', args=[produto.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.client.post(reverse('estoque:ajuste_estoque', args=[produto.pk]), {'nova_quantidade': 'x'})
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Quantidade inválida')
+
+
+class ApiLeituraTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('integracao')
+        self.client.force_login(self.usuario)
+        fornecedor = Fornecedor.objects.create(nome='Distribuidora')
+        self.produtos = [
+            criar_produto(f'P{indice:03d}', quantidade_atual=indice, fornecedor=fornecedor)
+            for indice in range(1, 6)
+        ]
+        criar_produto('X001', ativo=False)
+        registrar_movimentacao(self.produtos[0], 'ENTRADA', 2, self.usuario, 'Compra')
+
+    def test_lista_com_campos_filtros_e_cursor(self):
+        url = reverse('estoque:api_produto_list')
+        # Sessão, usuário e a própria lista
+        with self.assertNumQueries(3):
+            primeira = self.client.get(url, {'fields': 'codigo,quantidade_atual', 'limite': 3}).json()
+        self.assertEqual(primeira['resultados'][0], {'codigo': 'P001', 'quantidade_atual': '3.00'})
+        self.assertIsNone(primeira['anterior'])
+
+        segunda = self.client.get(primeira['proxima']).json()
+        self.assertEqual([p['codigo'] for p in segunda['resultados']], ['P004', 'P005'])
+        self.assertIsNone(segunda['proxima'])
+
+        # Mesmos filtros de /produtos/
+        baixo = self.client.get(url, {'estoque_baixo': '1', 'fields': 'codigo'}).json()
+        self.assertEqual(baixo['resultados'], [{'codigo': 'P002'}])
+
+    def test_detalhes_e_demais_recursos(self):
+        produto = self.client.get(reverse('estoque:api_produto_detail', args=[self.produtos[0].pk])).json()
+        self.assertEqual((produto['fornecedor_nome'], produto['categoria_nome']), ('Distribuidora', 'Geral'))
+        inativo = Produto.objects.get(codigo='X001')
+        self.assertEqual(self.client.get(reverse('estoque:api_produto_detail', args=[inativo.pk])).status_code, 404)
+
+        movimentacoes = self.client.get(
+            reverse('estoque:api_movimentacao_list'), {'tipo': 'ENTRADA'}
+        ).json()['resultados']
+        self.assertEqual(
+            [(m['produto_codigo'], m['usuario'], m['quantidade']) for m in movimentacoes],
+            [('P001', 'integracao', '2.00')],
+        )
+        self.assertEqual(
+            self.client.get(reverse('estoque:api_categoria_list')).json()['resultados'][0]['nome'], 'Geral'
+        )
+        self.assertEqual(len(self.client.get(reverse('estoque:api_fornecedor_list')).json()['resultados']), 1)
+
+    def test_erros(self):
+        url = reverse('estoque:api_produto_list')
+        resposta = self.client.get(url, {'fields': 'codigo,senha'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('senha', resposta.json()['erro'])
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_filtros_fora_do_formato_respondem_400(self):
+        produtos = reverse('estoque:api_produto_list')
+        movimentacoes = reverse('estoque:api_movimentacao_list')
+        for url, params, campo in [
+            (produtos, {'categoria': 'abc'}, 'categoria'),
+            (produtos, {'fornecedor': '1.5'}, 'fornecedor'),
+            (produtos, {'estoque_baixo': 'talvez'}, 'estoque_baixo'),
+            (movimentacoes, {'produto': 'abc'}, 'produto'),
+            (movimentacoes, {'tipo': 'DOACAO'}, 'tipo'),
+            (movimentacoes, {'data_inicio': '31/12/2025'}, 'data_inicio'),
+        ]:
+            resposta = self.client.get(url, params)
+            self.assertEqual(resposta.status_code, 400, params)
+            self.assertIn(campo, resposta.json()['erro'])
+
+        # As páginas HTML usam os mesmos filtros
+        self.assertEqual(self.client.get(reverse('estoque:produto_list'), {'categoria': 'abc'}).status_code, 400)
+
+        hoje = timezone.localdate().isoformat()
+        periodo = self.client.get(movimentacoes, {'data_inicio': hoje, 'data_fim': hoje}).json()
+        self.assertEqual(len(periodo['resultados']), 1)
+        ontem = (timezone.localdate() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get(movimentacoes, {'data_fim': ontem}).json()['resultados'], [])
+
+
+class ApiMovimentacaoTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('erp')
+        self.client.force_login(self.usuario)
+        self.produto = criar_produto('P001')
+        self.url = reverse('estoque:api_movimentacao_list')
+
+    def enviar(self, dados, chave=None):
+        cabecalhos = {'HTTP_IDEMPOTENCY_KEY': chave} if chave else {}
+        return self.client.post(self.url, json.dumps(dados), content_type='application/json', **cabecalhos)
+
+    def test_repeticao_com_a_mesma_chave_nao_duplica(self):
+        venda = {'produto': 'P001', 'tipo': 'SAIDA', 'quantidade': '4', 'motivo': 'Venda', 'documento': 'NF-1'}
+
+        primeira = self.enviar(venda, 'venda-1')
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual(primeira.json()['quantidade_atual'], '6.00')
+
+        repetida = self.enviar(venda, 'venda-1')
+        self.assertEqual((repetida.status_code, repetida['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(repetida.json(), primeira.json())
+        self.assertEqual(MovimentacaoEstoque.objects.count(), 1)
+
+        self.assertEqual(self.enviar({**venda, 'quantidade': '1'}, 'venda-1').status_code, 422)
+        # A fila offline do mesmo usuário tem chaves próprias
+        self.assertTrue(ChaveIdempotencia.objects.filter(chave='api:venda-1').exists())
+
+    def test_lote_e_erros(self):
+        lote = self.enviar({'itens': [
+            {'produto': 'P001', 'tipo': 'ENTRADA', 'quantidade': '5', 'motivo': 'Compra'},
+            {'produto': 'P001', 'tipo': 'SAIDA', 'quantidade': '50', 'motivo': 'Venda'},
+        ]}, 'lote-1').json()
+        self.assertEqual((lote['aplicadas'], lote['rejeitadas']), (1, 1))
+        self.assertEqual(lote['resultados'][0]['quantidade_atual'], '15.00')
+
+        sem_estoque = self.enviar({'produto': 'P001', 'tipo': 'SAIDA', 'quantidade': '99', 'motivo': 'Venda'})
+        self.assertEqual(sem_estoque.status_code, 400)
+        self.assertIn('insuficiente', sem_estoque.json()['erros'][0])
+        self.assertEqual(self.enviar({'itens': 'x'}).status_code, 400)
+        self.assertEqual(self.enviar({'produto': 'P001'}, 'x' * 80).status_code, 400)
+
+
+@override_settings(IMAGENS_EM_SEGUNDO_PLANO=False)
+class ImagemProdutoTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        configuracao = override_settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def foto(self):
+        from PIL import Image
+        imagem = Image.new('RGB', (2400, 1200), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientação: girar 90°
+        exif[0x010F] = 'Celular'
+        buffer = io.BytesIO()
+        imagem.save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('IMG_0001.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_gera_miniaturas_sem_exif(self):
+        from PIL import Image
+        with self.captureOnCommitCallbacks(execute=True):
+            produto = criar_produto('P001', imagem=self.foto())
+        enviada = produto.imagem.name
+
+        produto.refresh_from_db()
+        armazenamento = produto.imagem.storage
+        self.assertRegex(produto.imagem.name, r'^produtos/[0-9a-f]{20}\.jpg$')
+        self.assertEqual(produto.imagem_variantes, {'largura': 800, 'altura': 1600, 'larguras': [160, 320, 640]})
+        self.assertFalse(armazenamento.exists(enviada))
+        with armazenamento.open(produto.imagem.name) as arquivo, Image.open(arquivo) as imagem:
+            self.assertEqual(imagem.size, (800, 1600))
+            self.assertEqual(len(imagem.getexif()), 0)
+        for extensao in ('webp', 'jpg'):
+            self.assertTrue(armazenamento.exists(nome_variante(produto.imagem.name, 320, extensao)))
+
+        html = Template('{% load produto_imagens %}{% imagem_produto produto sizes="50vw" %}').render(
+            Context({'produto': produto})
+        )
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f'{armazenamento.url(nome_variante(produto.imagem.name, 160, "webp"))} 160w', html)
+        self.assertIn('loading="lazy"', html)
+
+        # Salvar sem trocar a imagem não reprocessa
+        with mock.patch('estoque.signals.agendar_processamento') as agendar:
+            produto.save()
+        agendar.assert_not_called()
+
+    def test_arquivo_invalido_mantem_original(self):
+        arquivo = SimpleUploadedFile('foto.jpg', b'nao e imagem', content_type='image/jpeg')
+        with self.assertLogs('estoque.imagens', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            produto = criar_produto('P001', imagem=arquivo)
+        produto.refresh_from_db()
+        self.assertEqual(produto.imagem_variantes, {})
+        html = Template('{% load produto_imagens %}{% imagem_produto produto %}').render(Context({'produto': produto}))
+        self.assertIn(f'src="{produto.imagem.url}"', html)
+
+
+class FilaTarefasTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('operador')
+        registro = mock.patch.dict(TAREFAS)
+        registro.start()
+        self.addCleanup(registro.stop)
+
+    def test_falha_repete_com_espera_ate_o_limite(self):
+        @tarefa(nome='instavel', tentativas=2)
+        def instavel(tarefa_atual):
+            raise RuntimeError('serviço fora do ar')
+
+        criada = enfileirar('instavel')
+        with self.assertLogs('estoque.fila', 'WARNING'):
+            executar(reservar())
+
+        criada.refresh_from_db()
+        self.assertEqual((criada.status, criada.tentativas), ('PENDENTE', 1))
+        self.assertIn('serviço fora do ar', criada.erro)
+        self.assertGreater(criada.executar_apos, timezone.now())
+        self.assertIsNone(reservar())
+
+        Tarefa.objects.filter(pk=criada.pk).update(executar_apos=timezone.now())
+        with self.assertLogs('estoque.fila', 'ERROR'):
+            executar(reservar())
+        criada.refresh_from_db()
+        self.assertEqual((criada.status, criada.tentativas), ('FALHOU', 2))
+
+    def test_reserva_expirada_volta_para_a_fila(self):
+        @tarefa(nome='soma')
+        def soma(tarefa_atual, a, b):
+            tarefa_atual.registrar_progresso(50, 'Somando')
+            return a + b
+
+        criada = enfileirar('soma', a=2, b=3)
+        reservar(worker='worker-parado')
+        self.assertIsNone(reservar())
+        Tarefa.objects.filter(pk=criada.pk).update(expira_em=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(recuperar_expiradas(), 1)
+        call_command('processar_tarefas', uma_vez=True, stdout=io.StringIO())
+
+        criada.refresh_from_db()
+        self.assertEqual((criada.status, criada.resultado, criada.tentativas), ('CONCLUIDA', 5, 2))
+
+    def test_fechamento_de_inventario_pelo_worker(self):
+        criar_produto('P001', quantidade_atual=10)
+        inventario, _ = abrir_inventario('Geral', self.usuario)
+        registrar_contagens(inventario, [{'produto': 'P001', 'quantidade': 4}], self.usuario)
+        self.client.force_login(self.usuario)
+
+        self.client.post(reverse('estoque:inventario_fechar', args=[inventario.pk]))
+        self.client.post(reverse('estoque:inventario_fechar', args=[inventario.pk]))
+        fechamento = Tarefa.objects.get()
+        self.assertEqual(fechamento.criado_por, self.usuario)
+        inventario.refresh_from_db()
+        self.assertEqual(inventario.status, 'EM_ANDAMENTO')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('processar_tarefas', uma_vez=True, stdout=io.StringIO())
+
+        inventario.refresh_from_db()
+        self.assertEqual(inventario.status, 'CONCLUIDO')
+        self.assertEqual(Produto.objects.get(codigo='P001').quantidade_atual, 4)
+
+        dados = self.client.get(reverse('estoque:tarefa_status', args=[fechamento.pk])).json()
+        self.assertEqual((dados['status'], dados['resultado'], dados['encerrada']), ('CONCLUIDA', {'ajustes': 1}, True))
+
+        self.client.force_login(User.objects.create_user('outro'))
+        resposta = self.client.get(reverse('estoque:tarefa_status', args=[fechamento.pk]))
+        self.assertEqual(resposta.status_code, 404)
+        self.client.logout()
+        resposta = self.client.get(reverse('estoque:tarefa_status', args=[fechamento.pk]))
+        self.assertEqual(resposta.status_code, 401)
+
+
+class ExportacaoTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto('P001', nome='Mouse & Teclado <USB>')
+        criar_produto('P002', nome='Cabo', quantidade_atual=1, quantidade_minima=5)
+        registrar_movimentacao(self.produto, 'ENTRADA', 2, self.usuario, 'Compra')
+
+    def conteudo(self, resposta):
+        return b''.join(resposta.streaming_content)
+
+    def test_csv_respeita_filtros_da_lista(self):
+        resposta = self.client.get(
+            reverse('estoque:exportar_produtos', args=['csv']), {'estoque_baixo': '1'}
+        )
+        linhas = self.conteudo(resposta).decode('utf-8-sig').splitlines()
+
+        self.assertEqual(resposta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(len(linhas), 2)
+        self.assertTrue(linhas[1].startswith('P002;Cabo;Geral;'))
+
+    def test_xlsx_valido_e_dividido_em_planilhas(self):
+        with mock.patch.object(exportacao, 'LINHAS_POR_PLANILHA', 1):
+            resposta = self.client.get(reverse('estoque:exportar_produtos', args=['xlsx']))
+            pacote = zipfile.ZipFile(io.BytesIO(self.conteudo(resposta)))
+
+        self.assertIsNone(pacote.testzip())
+        self.assertIn('xl/worksheets/sheet2.xml', pacote.namelist())
+        self.assertIn('Produtos 2', pacote.read('xl/workbook.xml').decode())
+        planilhas = pacote.read('xl/worksheets/sheet1.xml').decode() + pacote.read('xl/worksheets/sheet2.xml').decode()
+        self.assertIn('Mouse &amp; Teclado &lt;USB&gt;', planilhas)
+
+    def test_movimentacoes_sem_instanciar_modelos(self):
+        with mock.patch.object(MovimentacaoEstoque, '__init__', side_effect=AssertionError):
+            resposta = self.client.get(
+                reverse('estoque:exportar_movimentacoes', args=['xlsx']), {'tipo': 'ENTRADA'}
+            )
+            pacote = zipfile.ZipFile(io.BytesIO(self.conteudo(resposta)))
+
+        self.assertIn('Compra', pacote.read('xl/worksheets/sheet1.xml').decode())
+
+    def test_formato_invalido(self):
+        resposta = self.client.get(reverse('estoque:exportar_produtos', args=['pdf']))
+        self.assertEqual(resposta.status_code, 404)
+
+    async def test_sob_asgi_entrega_aos_pedacos(self):
+        # Um iterador síncrono seria lido inteiro pelo Django antes do primeiro byte
+        lidas = mock.Mock(wraps=exportacao.formatar_valor)
+        with mock.patch.object(exportacao, 'LINHAS_POR_PEDACO', 1), \
+                mock.patch.object(exportacao, 'formatar_valor', lidas):
+            resposta = await self.async_client.get(reverse('estoque:exportar_produtos', args=['csv']))
+            self.assertTrue(resposta.is_async)
+            pedacos = aiter(resposta.streaming_content)
+
+            self.assertTrue((await anext(pedacos)).decode('utf-8-sig').startswith('Código;Nome;'))
+            self.assertEqual(lidas.call_count, 0)
+            self.assertTrue((await anext(pedacos)).decode().startswith('P002;Cabo;'))
+            self.assertEqual(lidas.call_count, 12)
+            restantes = [pedaco async for pedaco in pedacos]
+
+        self.assertEqual(len(restantes), 1)
+        self.assertIn('Mouse & Teclado <USB>', restantes[0].decode())
+
+
+class PaginacaoCursorTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto('P001')
+        agora = timezone.now()
+        # Datas repetidas obrigam o desempate pelo id
+        MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                produto=self.produto, tipo='ENTRADA', quantidade=1,
+                quantidade_anterior=0, quantidade_atual=1, motivo=f'Mov {i}',
+                usuario=self.usuario, data_movimentacao=agora - timedelta(minutes=i // 3),
+            )
+            for i in range(70)
+        ])
+
+    def percorrer(self, url, params=None):
+        vistos, paginas = [], 0
+        resposta = self.client.get(url, params or {})
+        while True:
+            paginas += 1
+            pagina = resposta.context['page_obj']
+            vistos.extend(objeto.pk for objeto in pagina)
+            if not pagina.tem_proxima:
+                return vistos, paginas, pagina
+            resposta = self.client.get(url + pagina.url_proxima)
+
+    def test_movimentacoes_sem_repetir_nem_pular(self):
+        vistos, paginas, ultima = self.percorrer(reverse('estoque:movimentacao_list'))
+
+        esperado = list(MovimentacaoEstoque.objects.order_by('-data_movimentacao', '-id').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(paginas, 3)
+
+        anterior = self.client.get(reverse('estoque:movimentacao_list') + ultima.url_anterior)
+        self.assertEqual([m.pk for m in anterior.context['page_obj']], esperado[30:60])
+
+    def test_produtos_na_ordem_escolhida(self):
+        for i in range(2, 46):
+            criar_produto(f'P{i:03d}', nome=f'Produto {i % 7}', quantidade_atual=i % 5)
+
+        vistos, paginas, _ = self.percorrer(reverse('estoque:produto_list'), {'ordem': '-quantidade_atual'})
+
+        esperado = list(Produto.objects.order_by('-quantidade_atual', '-id').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(paginas, 3)
+
+    def test_cursor_de_outra_ordem_volta_ao_inicio(self):
+        for i in range(2, 46):
+            criar_produto(f'P{i:03d}', quantidade_atual=i % 5)
+        url = reverse('estoque:produto_list')
+        cursor = self.client.get(url, {'ordem': 'nome'}).context['page_obj'].cursor_proxima
+
+        resposta = self.client.get(url, {'ordem': 'quantidade_atual', 'cursor': cursor})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(resposta.context['page_obj'].tem_anterior)
+
+        self.client.force_login(User.objects.create_user('integracao'))
+        resposta = self.client.get(
+            reverse('estoque:api_produto_list'), {'ordem': 'quantidade_atual', 'cursor': cursor}
+        )
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_sem_offset_e_cursor_adulterado(self):
+        url = reverse('estoque:movimentacao_list')
+        pagina = self.client.get(url).context['page_obj']
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url + pagina.url_proxima)
+        self.assertFalse(any('OFFSET' in consulta['sql'] for consulta in consultas.captured_queries))
+
+        resposta = self.client.get(url, {'cursor': pagina.cursor_proxima + 'x'})
+        self.assertFalse(resposta.context['page_obj'].tem_anterior)
+
+    def test_rolagem_infinita_htmx(self):
+        url = reverse('estoque:movimentacao_list')
+        pagina = self.client.get(url, {'tipo': 'ENTRADA'}).context['page_obj']
+
+        resposta = self.client.get(url + pagina.url_proxima, HTTP_HX_REQUEST='true')
+
+        self.assertTemplateUsed(resposta, 'estoque/partials/movimentacao_linhas.html')
+        self.assertTemplateNotUsed(resposta, 'base.html')
+        self.assertContains(resposta, 'tipo=ENTRADA')
+        self.assertContains(resposta, 'hx-trigger="revealed"')
+
+
+class ImportacaoProdutosTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto('P001', quantidade_atual=5, preco_venda=10)
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        configuracao = override_settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def importar(self, texto):
+        return importar_produtos(ler_planilha(io.BytesIO(texto.encode('utf-8-sig')), 'produtos.csv'))
+
+    def test_upsert_por_codigo_com_relatorio_de_erros(self):
+        resultado = self.importar(
+            'Código;Nome;Categoria;Quantidade Atual;Preço de Venda\n'
+            'P001;;;99;12,50\n'
+            'P002;Teclado Óptico;Periféricos;3;1.234,56\n'
+            'P003;Cabo;Geral;1;abc\n'
+            'P004;Monitor;;1;10\n'
+        )
+
+        self.assertEqual((resultado['criados'], resultado['atualizados']), (1, 1))
+        self.assertEqual([erro['linha'] for erro in resultado['erros']], [4, 5])
+        self.assertIn('preco_venda', resultado['erros'][0]['erros'])
+        self.assertIn('categoria', resultado['erros'][1]['erros'])
+
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.preco_venda, Decimal('12.50'))
+        self.assertEqual(self.produto.quantidade_atual, 5)
+        self.assertEqual(self.produto.nome, 'Produto P001')
+
+        novo = Produto.objects.get(codigo='P002')
+        self.assertEqual(novo.categoria.nome, 'Periféricos')
+        self.assertEqual(novo.preco_venda, Decimal('1234.56'))
+        self.assertTrue(novo.qr_code.startswith('PROD-P002-'))
+        self.assertEqual(list(buscar_produtos(Produto.objects.all(), 'teclado')), [novo])
+
+    def test_reimporta_a_exportacao_pela_tela(self):
+        criar_produto('P002', nome='Cabo', fornecedor=Fornecedor.objects.create(nome='ACME'))
+        exportado = b''.join(self.client.get(
+            reverse('estoque:exportar_produtos', args=['xlsx'])
+        ).streaming_content)
+        Produto.objects.update(nome='Alterado')
+
+        # O envio só guarda a planilha e enfileira a importação
+        arquivo = SimpleUploadedFile('produtos.xlsx', exportado)
+        resposta = self.client.post(reverse('estoque:produto_importar'), {'arquivo': arquivo})
+        importacao = Tarefa.objects.get(nome='importar_produtos')
+        self.assertRedirects(resposta, f"{reverse('estoque:produto_importar')}?tarefa={importacao.pk}")
+        self.assertContains(self.client.get(resposta.url), 'Importando a planilha')
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(executar(reservar()))
+        self.assertLess(len(consultas), 25)
+
+        resultado = self.client.get(resposta.url).context['importacao'].resultado
+        self.assertEqual(
+            (resultado['criados'], resultado['atualizados'], resultado['ignoradas']), (0, 2, 0)
+        )
+        self.assertEqual(
+            sorted(Produto.objects.values_list('nome', flat=True)), ['Cabo', 'Produto P001']
+        )
+        # A planilha guardada é apagada depois da importação
+        self.assertEqual(os.listdir(os.path.join(self.media, 'importacoes')), [])
+
+    def test_progresso_por_lote_e_planilha_apagada_na_ultima_falha(self):
+        linhas = ''.join(f'P{numero:03};Produto {numero};Geral;1;10\n' for numero in range(10, 40))
+        caminho = default_storage.save(
+            'importacoes/produtos.csv', ContentFile(f'Código;Nome;Categoria;Quantidade Atual;Preço\n{linhas}')
+        )
+        importacao = enfileirar('importar_produtos', caminho=caminho, nome_arquivo='produtos.csv')
+        Tarefa.objects.filter(pk=importacao.pk).update(maximo_tentativas=2)
+
+        progresso = []
+        registrar = Tarefa.registrar_progresso
+
+        def lote_de_dez(linhas, progresso=None):
+            return importar_produtos(linhas, tamanho_lote=10, progresso=progresso)
+
+        def gravar(tarefa_atual, percentual, mensagem=''):
+            progresso.append(percentual)
+            registrar(tarefa_atual, percentual, mensagem)
+
+        with mock.patch('estoque.tarefas.importar_produtos', side_effect=RuntimeError('banco fora do ar')):
+            with self.assertLogs('estoque.fila', 'WARNING'):
+                self.assertFalse(executar(reservar()))
+        # Há nova tentativa: a planilha continua guardada
+        self.assertTrue(default_storage.exists(caminho))
+
+        Tarefa.objects.filter(pk=importacao.pk).update(executar_apos=timezone.now())
+        with mock.patch('estoque.tarefas.importar_produtos', lote_de_dez), \
+                mock.patch.object(Tarefa, 'registrar_progresso', gravar):
+            self.assertTrue(executar(reservar()))
+        self.assertEqual(len(progresso), 4)
+        self.assertEqual(progresso, sorted(progresso))
+        self.assertGreater(progresso[-1], 10)
+        self.assertFalse(default_storage.exists(caminho))
+
+        caminho = default_storage.save('importacoes/produtos.csv', ContentFile('Código\nP100\n'))
+        enfileirar('importar_produtos', caminho=caminho, nome_arquivo='produtos.csv')
+        Tarefa.objects.filter(nome='importar_produtos', status='PENDENTE').update(maximo_tentativas=1)
+        with mock.patch('estoque.tarefas.importar_produtos', side_effect=RuntimeError('banco fora do ar')):
+            with self.assertLogs('estoque.fila', 'ERROR'):
+                self.assertFalse(executar(reservar()))
+        # Sem novas tentativas, ninguém mais vai ler a planilha
+        self.assertFalse(default_storage.exists(caminho))
+
+    @override_settings(TAREFAS_NA_REQUISICAO=True)
+    def test_sem_worker_importa_na_requisicao(self):
+        arquivo = SimpleUploadedFile('produtos.csv', 'Nome;Preço\nCabo;1\n'.encode())
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(reverse('estoque:produto_importar'), {'arquivo': arquivo})
+        self.assertEqual(Tarefa.objects.get(nome='importar_produtos').status, 'CONCLUIDA')
+        self.assertContains(self.client.get(resposta.url), 'O arquivo precisa da coluna')
+
+
+class DadosSinteticosBenchmarkTest(TestCase):
+
+    def test_catalogo_reproduzivel_com_saldos_coerentes(self):
+        gerar_catalogo(categorias=2, fornecedores=3, produtos=30, movimentacoes=300, prefixo='A')
+        gerar_catalogo(categorias=2, fornecedores=3, produtos=30, movimentacoes=300, prefixo='B')
+
+        nomes = lambda prefixo: list(
+            Produto.objects.filter(codigo__startswith=f'{prefixo}-').order_by('pk').values_list('nome', 'preco_venda')
+        )
+        self.assertEqual(nomes('A'), nomes('B'))
+
+        for produto in Produto.objects.filter(codigo__startswith='A-'):
+            movimentacoes = list(produto.movimentacoes.order_by('data_movimentacao'))
+            for anterior, seguinte in zip(movimentacoes, movimentacoes[1:]):
+                self.assertEqual(anterior.quantidade_atual, seguinte.quantidade_anterior)
+            if movimentacoes:
+                self.assertEqual(movimentacoes[-1].quantidade_atual, produto.quantidade_atual)
+            self.assertGreaterEqual(produto.quantidade_atual, 0)
+
+    def test_benchmark_executa_todos_os_cenarios(self):
+        gerar_catalogo(categorias=2, fornecedores=2, produtos=40, movimentacoes=100)
+
+        resultados = Benchmark(semente=1).executar(repeticoes=2, aquecimento=0)
+
+        self.assertEqual(list(resultados), Benchmark.CENARIOS)
+        # As quatro do painel, o validador da ETag e as seis do cache em banco
+        self.assertEqual(resultados['dashboard_sem_cache']['consultas'], 11)
+        linhas = comparar(resultados, resultados)
+        self.assertFalse(any(piorou for *_, piorou in linhas))
+
+
+@override_settings(
+    INSTRUMENTACAO_ATIVA=True, INSTRUMENTACAO_FALHAR_ORCAMENTO=True, INSTRUMENTACAO_SERVER_TIMING=True
+)
+class InstrumentacaoTest(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.client.force_login(self.usuario)
+        for i in range(12):
+            registrar_movimentacao(criar_produto(f'P{i:03d}'), 'ENTRADA', 1, self.usuario, 'Compra')
+
+    def test_views_principais_dentro_do_orcamento(self):
+        produto = Produto.objects.first()
+        requisicoes = [
+            ('get', reverse('estoque:dashboard'), {}),
+            ('get', reverse('estoque:produto_list'), {'search': 'produto'}),
+            ('get', reverse('estoque:movimentacao_list'), {}),
+            ('get', reverse('estoque:buscar_produtos_htmx'), {'search': 'P00'}),
+            ('post', reverse('estoque:buscar_qr'), {'qr_code': produto.qr_code}),
+            ('get', reverse('estoque:produto_detail', args=[produto.pk]), {}),
+        ]
+        for metodo, url, dados in requisicoes:
+            with self.subTest(url=url):
+                resposta = getattr(self.client, metodo)(url, dados)
+                self.assertIn('sql;dur=', resposta['Server-Timing'])
+                self.assertNotIn('n1;', resposta['Server-Timing'])
+
+        # Tempo dos templates medido pelo backend TemplatesInstrumentados
+        resposta = self.client.get(reverse('estoque:dashboard'))
+        self.assertGreater(float(re.search(r'tpl;dur=([\d.]+)', resposta['Server-Timing']).group(1)), 0)
+
+    def test_orcamento_excedido_falha(self):
+        with override_settings(INSTRUMENTACAO_ORCAMENTO_CONSULTAS={'estoque:produto_list': 1}):
+            with self.assertRaises(OrcamentoConsultasExcedido), self.assertLogs('estoque.instrumentacao', 'WARNING'):
+                self.client.get(reverse('estoque:produto_list'))
+
+    def test_detecta_n_mais_um(self):
+        def view_com_n_mais_um(request):
+            nomes = [produto.categoria.nome for produto in Produto.objects.all()]
+            return HttpResponse(len(nomes))
+
+        middleware = InstrumentacaoMiddleware(view_com_n_mais_um)
+        with self.assertLogs('estoque.instrumentacao', 'WARNING') as logs:
+            resposta = middleware(RequestFactory().get('/'))
+
+        self.assertIn('n1;desc="1 consultas repetidas"', resposta['Server-Timing'])
+        registro = json.loads(logs.records[0].getMessage())
+        self.assertEqual(registro['consultas'], 13)
+        self.assertEqual(registro['repetidas'][0]['vezes'], 12)
+        self.assertIn('"estoque_categoria"', registro['repetidas'][0]['sql'])
+
+
+class InventarioTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('inventariante')
+        self.p1 = criar_produto('P001', quantidade_atual=10, localizacao='A1')
+        self.p2 = criar_produto('P002', quantidade_atual=5, localizacao='A2', qr_code='QR-P002')
+        self.p3 = criar_produto('P003', quantidade_atual=7, localizacao='B1')
+        criar_produto('P004', ativo=False, localizacao='A3')
+
+    def test_abertura_filtra_produtos_ativos(self):
+        inventario, total = abrir_inventario('Corredor A', self.usuario, localizacao='A')
+
+        self.assertEqual(total, 2)
+        self.assertEqual(inventario.status, 'EM_ANDAMENTO')
+        self.assertEqual(
+            dict(inventario.itens.values_list('produto__codigo', 'quantidade_sistema')),
+            {'P001': Decimal('10'), 'P002': Decimal('5')},
+        )
+
+    def test_contagem_e_fechamento_ajustam_estoque(self):
+        inventario, _ = abrir_inventario('Geral', self.usuario)
+        resultados = registrar_contagens(inventario, [
+            {'produto': 'P001', 'quantidade': '8'},
+            {'produto': 'QR-P002', 'quantidade': 3},
+            {'produto': 'QR-P002', 'quantidade': 3, 'somar': True},
+            {'produto': 'P004', 'quantidade': 1},
+            {'produto': 'P003', 'quantidade': '-1'},
+        ], self.usuario)
+
+        self.assertEqual([r['status'] for r in resultados], ['ok', 'ok', 'ok', 'erro', 'erro'])
+        self.assertEqual(resumo_inventario(inventario)['divergentes'], 2)
+
+        # Saída durante o inventário não pode virar divergência no fechamento
+        registrar_movimentacao(self.p1, 'SAIDA', 1, self.usuario, 'Venda')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ajustes = fechar_inventario(inventario, self.usuario)
+
+        self.assertEqual(ajustes, 2)
+        for produto, esperado in ((self.p1, 7), (self.p2, 6), (self.p3, 7)):
+            produto.refresh_from_db()
+            self.assertEqual(produto.quantidade_atual, esperado)
+        ajuste = MovimentacaoEstoque.objects.get(produto=self.p2, tipo='AJUSTE')
+        self.assertEqual((ajuste.quantidade_anterior, ajuste.quantidade_atual), (5, 6))
+        self.assertEqual(ajuste.documento, f'INV-{inventario.pk}')
+        self.assertEqual(SnapshotEstoque.objects.get(dimensao='TOTAL').quantidade, 20)
+
+        with self.assertRaises(InventarioEncerrado):
+            fechar_inventario(inventario, self.usuario)
+        with self.assertRaises(InventarioEncerrado):
+            registrar_contagens(inventario, [{'produto': 'P001', 'quantidade': 1}], self.usuario)
+
+    def test_contagem_bloqueia_os_produtos(self):
+        inventario, _ = abrir_inventario('Geral', self.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_contagens(inventario, [{'produto': 'P001', 'quantidade': 8}], self.usuario)
+
+        # FOR UPDATE, ou o UPDATE que toma o lock de escrita no SQLite, antes
+        # de copiar a quantidade do sistema
+        travas = [
+            consulta['sql'] for consulta in consultas.captured_queries
+            if '"estoque_produto"' in consulta['sql']
+            and ('FOR UPDATE' in consulta['sql'] or consulta['sql'].startswith('UPDATE'))
+        ]
+        self.assertTrue(travas)
+
+    def test_fechamento_informa_o_progresso_por_lote(self):
+        inventario, _ = abrir_inventario('Geral', self.usuario)
+        registrar_contagens(inventario, [
+            {'produto': codigo, 'quantidade': 1} for codigo in ('P001', 'P002', 'P003')
+        ], self.usuario)
+
+        progresso = []
+        with mock.patch('estoque.inventario.TAMANHO_LOTE', 2):
+            fechar_inventario(inventario, self.usuario, progresso=lambda *args: progresso.append(args))
+        self.assertEqual(progresso, [(2, 3)])
+
+    def test_endpoint_de_contagens(self):
+        inventario, _ = abrir_inventario('Coletor', self.usuario)
+        self.client.force_login(self.usuario)
+        url = reverse('estoque:inventario_contagens', args=[inventario.pk])
+
+        resposta = self.client.post(
+            url, json.dumps({'contagens': [{'produto': 'P003', 'quantidade': 9}]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['registradas'], 1)
+        resposta = self.client.get(reverse('estoque:inventario_detail', args=[inventario.pk]), {'situacao': 'divergentes'})
+        self.assertContains(resposta, 'P003')
+        self.assertNotContains(resposta, 'P001')
+
+    def test_cancelamento_exige_login(self):
+        inventario, _ = abrir_inventario('Geral', self.usuario)
+        url = reverse('estoque:inventario_cancelar', args=[inventario.pk])
+
+        self.client.post(url)
+        inventario.refresh_from_db()
+        self.assertEqual(inventario.status, 'EM_ANDAMENTO')
+
+        self.client.force_login(self.usuario)
+        self.client.post(url)
+        inventario.refresh_from_db()
+        self.assertEqual(inventario.status, 'CANCELADO')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Índice FTS5 só existe no SQLite')
+class BuscaSQLiteTest(TestCase):
+
+    def setUp(self):
+        self.mouse = criar_produto('MOU-001', nome='Mouse Óptico USB')
+        self.teclado = criar_produto('TEC-002', nome='Teclado ABNT', descricao='Teclado com fio USB')
+
+    def codigos(self, termo, ranquear=False):
+        funcao = ranquear_produtos if ranquear else buscar_produtos
+        return list(funcao(Produto.objects.all(), termo).values_list('codigo', flat=True))
+
+    def test_prefixo_sem_acento(self):
+        self.assertEqual(self.codigos('opti'), ['MOU-001'])
+        self.assertEqual(self.codigos('MOU'), ['MOU-001'])
+        self.assertEqual(self.codigos(self.teclado.qr_code), ['TEC-002'])
+
+    def test_relevancia_prioriza_codigo_e_nome(self):
+        self.assertEqual(self.codigos('usb', ranquear=True), ['MOU-001', 'TEC-002'])
+
+    def test_signals_mantem_indice(self):
+        self.mouse.nome = 'Mouse Sem Fio'
+        self.mouse.save()
+        self.assertEqual(self.codigos('optico'), [])
+        self.assertEqual(self.codigos('sem fio'), ['MOU-001'])
+
+        self.teclado.delete()
+        self.assertEqual(self.codigos('teclado'), [])
+
+    def test_reindexar_inclui_produtos_criados_em_lote(self):
+        Produto.objects.bulk_create([Produto(codigo='CAB-003', nome='Cabo HDMI', categoria=self.mouse.categoria)])
+        self.assertEqual(self.codigos('hdmi'), [])
+
+        BuscaSQLite().reindexar()
+        self.assertEqual(self.codigos('hdmi'), ['CAB-003'])
+
+
+class MovimentacaoConcorrenteTest(TransactionTestCase):
+    """Vários leitores de QR movimentando o mesmo SKU ao mesmo tempo"""
+
+    WORKERS = 8
+    MOVIMENTOS_POR_WORKER = 10
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha123')
+        self.produto = criar_produto(quantidade_atual=1000)
+
+    def _executar_em_paralelo(self, alvo):
+        barreira = threading.Barrier(self.WORKERS)
+        erros = []
+
+        def worker(indice):
+            try:
+                barreira.wait()
+                for _ in range(self.MOVIMENTOS_POR_WORKER):
+                    alvo(indice)
+            except Exception as exc:
+                erros.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(erros, [])
+
+    def test_sem_atualizacoes_perdidas(self):
+        def movimentar(indice):
+            produto = Produto.objects.get(pk=self.produto.pk)
+            tipo = 'ENTRADA' if indice % 2 else 'SAIDA'
+            registrar_movimentacao(produto, tipo, 3, self.usuario, 'Teste de concorrência')
+
+        self._executar_em_paralelo(movimentar)
+
+        total = self.WORKERS * self.MOVIMENTOS_POR_WORKER
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.quantidade_atual, Decimal('1000'))
+        self.assertEqual(MovimentacaoEstoque.objects.count(), total)
+
+        # Cada movimentação deve partir exatamente do saldo deixado pela anterior
+        saldo = Decimal('1000')
+        for anterior, atual in MovimentacaoEstoque.objects.order_by('id').values_list(
+            'quantidade_anterior', 'quantidade_atual'
+        ):
+            self.assertEqual(anterior, saldo)
+            saldo = atual
+        self.assertEqual(saldo, self.produto.quantidade_atual)
+
+    @skipUnless(connection.vendor == 'postgresql', 'versões sem lock global só no PostgreSQL')
+    def test_skus_diferentes_nao_esperam_transacao_longa(self):
+        outro = criar_produto('P002', quantidade_atual=1000)
+        aberta, liberar = threading.Event(), threading.Event()
+
+        def transacao_longa():
+            try:
+                with transaction.atomic():
+                    produto = Produto.objects.get(pk=self.produto.pk)
+                    registrar_movimentacao(produto, 'SAIDA', 1, self.usuario, 'Fechamento longo')
+                    aberta.set()
+                    liberar.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=transacao_longa)
+        thread.start()
+        try:
+            self.assertTrue(aberta.wait(10))
+            inicio = time.monotonic()
+            registrar_movimentacao(outro, 'SAIDA', 1, self.usuario, 'Caixa')
+            self.assertLess(time.monotonic() - inicio, 2)
+
+            # A do caixa já terminou, mas tem versão maior que a transação
+            # aberta: a sincronização espera o commit dela para entregar
+            pagina = alteracoes_desde()
+            self.assertEqual([p['codigo'] for p in pagina['produtos']], ['P001'])
+        finally:
+            liberar.set()
+            thread.join()
+
+        seguinte = alteracoes_desde(pagina['cursor'])
+        self.assertEqual({p['codigo'] for p in seguinte['produtos']}, {'P001', 'P002'})
+        self.assertEqual(len(seguinte['movimentacoes']), 2)
@@ -1,15 +1,18 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'estoque'
 
 urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/cache/', views.estatisticas_cache, name='estatisticas_cache'),
     
     # Produtos
     path('produtos/', views.produto_list, name='produto_list'),
     path('produtos/criar/', views.produto_create, name='produto_create'),
+    path('produtos/importar/', views.produto_importar, name='produto_importar'),
+    path('produtos/exportar/<str:formato>/', views.exportar_produtos, name='exportar_produtos'),
     path('produtos/<int:pk>/', views.produto_detail, name='produto_detail'),
     path('produtos/<int:pk>/editar/', views.produto_update, name='produto_update'),
     path('produtos/<int:pk>/deletar/', views.produto_delete, name='produto_delete'),
@@ -19,9 +22,25 @@ urlpatterns = [
     
     # Movimentações
     path('movimentacoes/', views.movimentacao_list, name='movimentacao_list'),
+    path('movimentacoes/exportar/<str:formato>/', views.exportar_movimentacoes, name='exportar_movimentacoes'),
     path('movimentacoes/entrada/<int:produto_id>/', views.entrada_estoque, name='entrada_estoque'),
     path('movimentacoes/saida/<int:produto_id>/', views.saida_estoque, name='saida_estoque'),
     path('movimentacoes/ajuste/<int:produto_id>/', views.ajuste_estoque, name='ajuste_estoque'),
+    path('movimentacoes/lote/', views.movimentacao_lote, name='movimentacao_lote'),
+    path('movimentacoes/sincronizar/', views.movimentacao_sincronizar, name='movimentacao_sincronizar'),
+    
+    # Sincronização incremental do aplicativo
+    path('sincronizacao/', views.sincronizacao_alteracoes, name='sincronizacao_alteracoes'),
+    
+    # Inventário físico
+    path('inventarios/', views.inventario_list, name='inventario_list'),
+    path('inventarios/<int:pk>/', views.inventario_detail, name='inventario_detail'),
+    path('inventarios/<int:pk>/contagens/', views.inventario_contagens, name='inventario_contagens'),
+    path('inventarios/<int:pk>/fechar/', views.inventario_fechar, name='inventario_fechar'),
+    path('inventarios/<int:pk>/cancelar/', views.inventario_cancelar, name='inventario_cancelar'),
+    
+    # Fila de tarefas
+    path('tarefas/<int:pk>/', views.tarefa_status, name='tarefa_status'),
     
     # Categorias e Fornecedores
     path('categorias/', views.categoria_list, name='categoria_list'),
@@ -30,6 +49,21 @@ urlpatterns = [
     # Relatórios
     path('relatorios/', views.relatorios, name='relatorios'),
     path('relatorios/estoque-baixo/', views.estoque_baixo, name='estoque_baixo'),
+    path('relatorios/valor-estoque/', views.valor_estoque, name='valor_estoque'),
+    path('relatorios/giro-estoque/', views.giro_estoque, name='giro_estoque'),
+    path('alertas/inscricao/', views.push_inscricao, name='push_inscricao'),
+    
+    # Atualizações ao vivo (Server-Sent Events, só sob ASGI)
+    path('eventos/', views.eventos, name='eventos'),
+    path('eventos/produto/<int:pk>/', views.eventos, name='eventos_produto'),
+    
+    # API JSON somente leitura (estoque/api.py)
+    path('api/v1/produtos/', api.produto_list, name='api_produto_list'),
+    path('api/v1/produtos/<int:pk>/', api.produto_detail, name='api_produto_detail'),
+    path('api/v1/categorias/', api.categoria_list, name='api_categoria_list'),
+    path('api/v1/fornecedores/', api.fornecedor_list, name='api_fornecedor_list'),
+    path('api/v1/movimentacoes/', api.movimentacao_list, name='api_movimentacao_list'),
+    path('api/v1/movimentacoes/<int:pk>/', api.movimentacao_detail, name='api_movimentacao_detail'),
     
     # HTMX endpoints
     path('htmx/produto-card/<int:pk>/', views.produto_card_htmx, name='produto_card_htmx'),
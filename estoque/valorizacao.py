@@ -0,0 +1,162 @@
+"""
+Snapshot diário do valor do estoque (``SnapshotEstoque``)
+
+``gerar_snapshot`` recalcula o dia a partir de ``Produto`` (comando
+``snapshot_estoque``, rodado diariamente). Entre uma execução e outra,
+``aplicar_movimentacoes`` soma ao snapshot do dia a variação de cada
+movimentação registrada. Alterações de preço ou cadastro fora de
+movimentações só entram na próxima execução do comando.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import Produto, SnapshotEstoque
+
+
+# Produtos consultados por vez ao aplicar movimentações
+TAMANHO_BLOCO = 900
+
+
+def _valores():
+    return {
+        'total_produtos': Count('id'),
+        'quantidade': Sum('quantidade_atual'),
+        'valor_custo': Sum(F('quantidade_atual') * F('preco_custo')),
+        'valor_venda': Sum(F('quantidade_atual') * F('preco_venda')),
+    }
+
+
+def _snapshot(data, dimensao, referencia_id, nome, valores):
+    return SnapshotEstoque(
+        data=data,
+        dimensao=dimensao,
+        referencia_id=referencia_id or 0,
+        nome=nome,
+        total_produtos=valores['total_produtos'] or 0,
+        quantidade=valores['quantidade'] or 0,
+        valor_custo=valores['valor_custo'] or 0,
+        valor_venda=valores['valor_venda'] or 0,
+    )
+
+
+def gerar_snapshot(data=None):
+    """Recalcula todas as linhas do dia a partir dos produtos ativos"""
+    data = data or timezone.localdate()
+    produtos = Produto.objects.filter(ativo=True).order_by()
+
+    linhas = [_snapshot(data, 'TOTAL', 0, 'Total', produtos.aggregate(**_valores()))]
+    for valores in produtos.values('categoria_id', 'categoria__nome').annotate(**_valores()):
+        linhas.append(_snapshot(
+            data, 'CATEGORIA', valores['categoria_id'], valores['categoria__nome'], valores
+        ))
+    for valores in produtos.values('fornecedor_id', 'fornecedor__nome').annotate(**_valores()):
+        linhas.append(_snapshot(
+            data, 'FORNECEDOR', valores['fornecedor_id'],
+            valores['fornecedor__nome'] or 'Sem fornecedor', valores
+        ))
+
+    with transaction.atomic():
+        SnapshotEstoque.objects.filter(data=data).delete()
+        SnapshotEstoque.objects.bulk_create(linhas)
+
+    return linhas
+
+
+def _garantir_snapshot_do_dia(data):
+    """
+    Copia o último snapshot para o dia, se ainda não existir.
+
+    Retorna False quando não havia nenhum snapshot e o dia foi calculado do
+    zero (já refletindo as movimentações confirmadas).
+    """
+    if SnapshotEstoque.objects.filter(data=data).exists():
+        return True
+
+    ultima_data = SnapshotEstoque.objects.aggregate(ultima=Max('data'))['ultima']
+    if ultima_data is None:
+        gerar_snapshot(data)
+        return False
+
+    SnapshotEstoque.objects.bulk_create(
+        [
+            SnapshotEstoque(
+                data=data,
+                dimensao=linha.dimensao,
+                referencia_id=linha.referencia_id,
+                nome=linha.nome,
+                total_produtos=linha.total_produtos,
+                quantidade=linha.quantidade,
+                valor_custo=linha.valor_custo,
+                valor_venda=linha.valor_venda,
+            )
+            for linha in SnapshotEstoque.objects.filter(data=ultima_data)
+        ],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def aplicar_movimentacoes(movimentacoes):
+    """Soma ao snapshot do dia a variação de estoque das movimentações"""
+    variacoes = defaultdict(Decimal)
+    for movimentacao in movimentacoes:
+        variacoes[movimentacao.produto_id] += movimentacao.quantidade_atual - movimentacao.quantidade_anterior
+
+    # Em blocos: o fechamento de um inventário pode movimentar centenas de
+    # milhares de produtos, além do limite de parâmetros de uma consulta
+    ids = list(variacoes)
+    produtos = (
+        produto
+        for inicio in range(0, len(ids), TAMANHO_BLOCO)
+        for produto in Produto.objects.filter(pk__in=ids[inicio:inicio + TAMANHO_BLOCO], ativo=True).values(
+            'id', 'preco_custo', 'preco_venda',
+            'categoria_id', 'categoria__nome', 'fornecedor_id', 'fornecedor__nome',
+        )
+    )
+
+    # (dimensao, referencia_id) -> [nome, quantidade, valor_custo, valor_venda]
+    deltas = {}
+    for produto in produtos:
+        quantidade = variacoes[produto['id']]
+        if not quantidade:
+            continue
+        for chave, nome in (
+            (('TOTAL', 0), 'Total'),
+            (('CATEGORIA', produto['categoria_id']), produto['categoria__nome']),
+            (('FORNECEDOR', produto['fornecedor_id'] or 0), produto['fornecedor__nome'] or 'Sem fornecedor'),
+        ):
+            delta = deltas.setdefault(chave, [nome, Decimal(0), Decimal(0), Decimal(0)])
+            delta[1] += quantidade
+            delta[2] += quantidade * produto['preco_custo']
+            delta[3] += quantidade * produto['preco_venda']
+
+    if not deltas:
+        return
+
+    data = timezone.localdate()
+    with transaction.atomic():
+        if not _garantir_snapshot_do_dia(data):
+            return
+
+        # Linhas de categorias/fornecedores que ainda não aparecem no snapshot
+        SnapshotEstoque.objects.bulk_create(
+            [
+                SnapshotEstoque(data=data, dimensao=dimensao, referencia_id=referencia_id, nome=delta[0])
+                for (dimensao, referencia_id), delta in deltas.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+        for (dimensao, referencia_id), (_, quantidade, valor_custo, valor_venda) in deltas.items():
+            SnapshotEstoque.objects.filter(
+                data=data, dimensao=dimensao, referencia_id=referencia_id
+            ).update(
+                quantidade=F('quantidade') + quantidade,
+                valor_custo=F('valor_custo') + valor_custo,
+                valor_venda=F('valor_venda') + valor_venda,
+                atualizado_em=timezone.now(),
+            )
@@ -1,107 +1,101 @@
+import json
+import uuid
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q, Sum, Count, F
-from django.core.paginator import Paginator
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET, require_http_methods, require_POST
+from django.views.decorators.vary import vary_on_headers
+from django.db.models import Q, Sum, Count, F, Max
+from django.urls import reverse
 from django.utils import timezone
-from .models import Produto, Categoria, Fornecedor, MovimentacaoEstoque
-from .forms import ProdutoForm, MovimentacaoForm, CategoriaForm, FornecedorForm
-
-
-
+from .models import (
+    Produto, Categoria, Fornecedor, MovimentacaoEstoque, SnapshotEstoque, InventarioFisico, Tarefa,
+    InscricaoPush,
+)
+from .forms import (
+    ProdutoForm, MovimentacaoForm, CategoriaForm, FornecedorForm, ImportacaoProdutosForm,
+    InventarioForm, ContagemForm,
+)
+from .busca import ranquear_produtos
+from .condicional import etag_estoque, etag_produto, ultima_modificacao_produto
+from .exportacao import exportar_csv, exportar_xlsx
+from .fila import enfileirar
+from .filtros import filtrar_movimentacoes, filtrar_produtos
+from .giro import relatorio_giro
+from .inventario import (
+    InventarioEncerrado, abrir_inventario, cancelar_inventario,
+    registrar_contagens, resumo_inventario,
+)
+from .paginacao import paginar_por_cursor, contar_aproximado
+from .sincronizacao import ALTERACOES_POR_PAGINA, CursorInvalido, alteracoes_desde
+from .estatisticas import estatisticas_dashboard, contadores_cache
+from .eventos import transmitir
+from .valorizacao import gerar_snapshot
+from .services import (
+    registrar_movimentacao, registrar_movimentacoes_em_lote, sincronizar_movimentacoes,
+    EstoqueInsuficiente,
+)
+
+
+
+@condition(etag_func=etag_estoque)
 def dashboard(request):
     """Dashboard principal com estatísticas gerais"""
     
-    # Estatísticas gerais
-    total_produtos = Produto.objects.filter(ativo=True).count()
-    produtos_baixo_estoque = Produto.objects.filter(
-        ativo=True,
-        quantidade_atual__lte=F('quantidade_minima')
-    ).count()
-    
-    valor_total_estoque = Produto.objects.filter(ativo=True).aggregate(
-        total=Sum(F('quantidade_atual') * F('preco_custo'))
-    )['total'] or 0
-    
-    # Produtos com estoque baixo
-    produtos_alerta = Produto.objects.filter(
-        ativo=True,
-        quantidade_atual__lte=F('quantidade_minima')
-    )[:5]
-    
-    # Últimas movimentações
-    ultimas_movimentacoes = MovimentacaoEstoque.objects.select_related(
-        'produto', 'usuario'
-    ).order_by('-data_movimentacao')[:10]
-    
-    context = {
-        'total_produtos': total_produtos,
-        'produtos_baixo_estoque': produtos_baixo_estoque,
-        'valor_total_estoque': valor_total_estoque,
-        'produtos_alerta': produtos_alerta,
-        'ultimas_movimentacoes': ultimas_movimentacoes,
-    }
+    # Estatísticas em cache, invalidadas a cada alteração de produto ou movimentação
+    context = dict(estatisticas_dashboard())
     
     return render(request, 'estoque/dashboard.html', context)
 
 
 
+def estatisticas_cache(request):
+    """Contadores de acerto/falha do cache do dashboard"""
+    return JsonResponse(contadores_cache())
+
+
+
+# A mesma URL devolve a página ou só as linhas seguintes (HTMX)
+@vary_on_headers('HX-Request')
+@condition(etag_func=etag_estoque)
 def produto_list(request):
     """Lista de produtos com busca e filtros"""
     
-    produtos = Produto.objects.filter(ativo=True).select_related('categoria', 'fornecedor')
-    
-    # Busca
-    search = request.GET.get('search', '')
-    if search:
-        produtos = produtos.filter(
-            Q(nome__icontains=search) |
-            Q(codigo__icontains=search) |
-            Q(qr_code__icontains=search)
-        )
+    produtos, filtros = filtrar_produtos(request.GET)
     
-    # Filtros
-    categoria_id = request.GET.get('categoria')
-    if categoria_id:
-        produtos = produtos.filter(categoria_id=categoria_id)
+    # Paginação por cursor, na mesma ordenação dos filtros
+    page_obj = paginar_por_cursor(produtos, produtos.query.order_by, request.GET, 20)
     
-    fornecedor_id = request.GET.get('fornecedor')
-    if fornecedor_id:
-        produtos = produtos.filter(fornecedor_id=fornecedor_id)
-    
-    estoque_baixo = request.GET.get('estoque_baixo')
-    if estoque_baixo == '1':
-        produtos = produtos.filter(quantidade_atual__lte=F('quantidade_minima'))
-    
-    # Ordenação
-    ordem = request.GET.get('ordem', 'nome')
-    if ordem in ['nome', '-nome', 'quantidade_atual', '-quantidade_atual', 'codigo', '-codigo']:
-        produtos = produtos.order_by(ordem)
-    
-    # Paginação
-    paginator = Paginator(produtos, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Rolagem infinita: o HTMX pede só os próximos cards
+    if request.headers.get('HX-Request'):
+        return render(request, 'estoque/partials/produto_cards.html', {'page_obj': page_obj})
     
     # Para filtros
     categorias = Categoria.objects.all()
     fornecedores = Fornecedor.objects.filter(ativo=True)
+    total, total_exato = contar_aproximado(produtos)
     
     context = {
         'page_obj': page_obj,
+        'total': total,
+        'total_exato': total_exato,
         'categorias': categorias,
         'fornecedores': fornecedores,
-        'search': search,
-        'categoria_id': categoria_id,
-        'fornecedor_id': fornecedor_id,
-        'estoque_baixo': estoque_baixo,
-        'ordem': ordem,
+        **filtros,
     }
     
     return render(request, 'estoque/produto_list.html', context)
 
 
 
+@condition(etag_func=etag_produto, last_modified_func=ultima_modificacao_produto)
 def produto_detail(request, pk):
     """Detalhes do produto"""
     produto = get_object_or_404(Produto, pk=pk, ativo=True)
@@ -134,6 +128,41 @@ def produto_create(request):
 
 
 
+def produto_importar(request):
+    """Criar ou atualizar produtos em massa a partir de uma planilha"""
+    if request.method == 'POST':
+        form = ImportacaoProdutosForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Planilhas grandes não cabem no tempo de uma requisição: vai para a fila
+            arquivo = form.cleaned_data['arquivo']
+            caminho = default_storage.save(f'importacoes/{uuid.uuid4().hex}-{arquivo.name}', arquivo)
+            importacao = enfileirar(
+                'importar_produtos', usuario=request.user, caminho=caminho, nome_arquivo=arquivo.name,
+            )
+            return redirect(f"{reverse('estoque:produto_importar')}?tarefa={importacao.pk}")
+    else:
+        form = ImportacaoProdutosForm()
+    
+    context = {'form': form, 'importacao': _importacao(request)}
+    return render(request, 'estoque/produto_importar.html', context)
+
+
+
+def _importacao(request):
+    """Tarefa de importação indicada em ``?tarefa=``, se for do usuário"""
+    try:
+        pk = int(request.GET.get('tarefa', ''))
+    except ValueError:
+        return None
+    tarefas = Tarefa.objects.filter(pk=pk, nome='importar_produtos')
+    if not request.user.is_authenticated:
+        tarefas = tarefas.filter(criado_por__isnull=True)
+    elif not request.user.is_staff:
+        tarefas = tarefas.filter(criado_por=request.user)
+    return tarefas.first()
+
+
+
 def produto_update(request, pk):
     """Atualizar produto"""
     produto = get_object_or_404(Produto, pk=pk, ativo=True)
@@ -184,36 +213,85 @@ def buscar_qr(request):
 
 
 
+# A mesma URL devolve a página ou só as linhas seguintes (HTMX)
+@vary_on_headers('HX-Request')
 def movimentacao_list(request):
     """Lista de movimentações"""
-    movimentacoes = MovimentacaoEstoque.objects.select_related(
-        'produto', 'usuario'
-    ).order_by('-data_movimentacao')
+    movimentacoes, filtros = filtrar_movimentacoes(request.GET)
     
-    # Filtros
-    produto_id = request.GET.get('produto')
-    if produto_id:
-        movimentacoes = movimentacoes.filter(produto_id=produto_id)
+    # Paginação por cursor: (data, id) decrescentes seguem o índice mov_data_idx
+    page_obj = paginar_por_cursor(movimentacoes, movimentacoes.query.order_by, request.GET, 30)
     
-    tipo = request.GET.get('tipo')
-    if tipo and tipo in ['ENTRADA', 'SAIDA', 'AJUSTE']:
-        movimentacoes = movimentacoes.filter(tipo=tipo)
+    # Rolagem infinita: o HTMX pede só as próximas linhas
+    if request.headers.get('HX-Request'):
+        return render(request, 'estoque/partials/movimentacao_linhas.html', {'page_obj': page_obj})
     
-    # Paginação
-    paginator = Paginator(movimentacoes, 30)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    total, total_exato = contar_aproximado(movimentacoes)
     
     context = {
         'page_obj': page_obj,
-        'tipo': tipo,
-        'produto_id': produto_id,
+        'total': total,
+        'total_exato': total_exato,
+        **filtros,
     }
     
     return render(request, 'estoque/movimentacao_list.html', context)
 
 
 
+FORMATOS_EXPORTACAO = ('csv', 'xlsx')
+
+
+def _exportar(request, formato, nome, titulo, cabecalho, linhas):
+    nome_arquivo = f'{nome}-{timezone.localtime():%Y%m%d-%H%M}.{formato}'
+    # Sob ASGI o corpo precisa ser um iterador assíncrono para sair aos pedaços
+    assincrono = isinstance(request, ASGIRequest)
+    if formato == 'xlsx':
+        return exportar_xlsx(nome_arquivo, titulo, cabecalho, linhas, assincrono)
+    return exportar_csv(nome_arquivo, cabecalho, linhas, assincrono)
+
+
+
+def exportar_produtos(request, formato):
+    """Exporta os produtos com os mesmos filtros da lista"""
+    if formato not in FORMATOS_EXPORTACAO:
+        raise Http404('Formato de exportação inválido.')
+    
+    produtos, _ = filtrar_produtos(request.GET)
+    linhas = produtos.values_list(
+        'codigo', 'nome', 'categoria__nome', 'fornecedor__nome', 'unidade_medida',
+        'quantidade_atual', 'quantidade_minima', 'preco_custo', 'preco_venda',
+        'localizacao', 'qr_code', 'atualizado_em',
+    ).iterator(chunk_size=2000)
+    
+    cabecalho = [
+        'Código', 'Nome', 'Categoria', 'Fornecedor', 'Unidade',
+        'Quantidade Atual', 'Quantidade Mínima', 'Preço de Custo', 'Preço de Venda',
+        'Localização', 'QR Code', 'Atualizado em',
+    ]
+    return _exportar(request, formato, 'produtos', 'Produtos', cabecalho, linhas)
+
+
+
+def exportar_movimentacoes(request, formato):
+    """Exporta as movimentações com os mesmos filtros da lista"""
+    if formato not in FORMATOS_EXPORTACAO:
+        raise Http404('Formato de exportação inválido.')
+    
+    movimentacoes, _ = filtrar_movimentacoes(request.GET)
+    linhas = movimentacoes.values_list(
+        'data_movimentacao', 'produto__codigo', 'produto__nome', 'tipo', 'quantidade',
+        'quantidade_anterior', 'quantidade_atual', 'motivo', 'documento', 'usuario__username',
+    ).iterator(chunk_size=2000)
+    
+    cabecalho = [
+        'Data', 'Código', 'Produto', 'Tipo', 'Quantidade',
+        'Quantidade Anterior', 'Quantidade Atual', 'Motivo', 'Documento', 'Usuário',
+    ]
+    return _exportar(request, formato, 'movimentacoes', 'Movimentações', cabecalho, linhas)
+
+
+
 def entrada_estoque(request, produto_id):
     """Entrada de estoque"""
     produto = get_object_or_404(Produto, pk=produto_id, ativo=True)
@@ -221,18 +299,9 @@ def entrada_estoque(request, produto_id):
     if request.method == 'POST':
         form = MovimentacaoForm(request.POST)
         if form.is_valid():
-            movimentacao = form.save(commit=False)
-            movimentacao.produto = produto
-            movimentacao.tipo = 'ENTRADA'
-            movimentacao.usuario = request.user
-            movimentacao.quantidade_anterior = produto.quantidade_atual
-            
-            # Atualizar quantidade do produto
-            produto.quantidade_atual += movimentacao.quantidade
-            movimentacao.quantidade_atual = produto.quantidade_atual
-            
-            movimentacao.save()
-            produto.save()
+            registrar_movimentacao(
+                produto, 'ENTRADA', usuario=request.user, **form.cleaned_data
+            )
             
             messages.success(request, f'Entrada registrada! Novo estoque: {produto.quantidade_atual}')
             return redirect('estoque:produto_detail', pk=produto.pk)
@@ -256,27 +325,16 @@ def saida_estoque(request, produto_id):
     if request.method == 'POST':
         form = MovimentacaoForm(request.POST)
         if form.is_valid():
-            movimentacao = form.save(commit=False)
-            
-            # Verificar se há estoque suficiente
-            if movimentacao.quantidade > produto.quantidade_atual:
+            try:
+                registrar_movimentacao(
+                    produto, 'SAIDA', usuario=request.user, **form.cleaned_data
+                )
+            except EstoqueInsuficiente:
                 messages.error(request, 'Quantidade insuficiente em estoque!')
                 return render(request, 'estoque/movimentacao_form.html', {
                     'form': form, 'produto': produto, 'titulo': 'Saída de Estoque', 'tipo': 'SAIDA'
                 })
             
-            movimentacao.produto = produto
-            movimentacao.tipo = 'SAIDA'
-            movimentacao.usuario = request.user
-            movimentacao.quantidade_anterior = produto.quantidade_atual
-            
-            # Atualizar quantidade do produto
-            produto.quantidade_atual -= movimentacao.quantidade
-            movimentacao.quantidade_atual = produto.quantidade_atual
-            
-            movimentacao.save()
-            produto.save()
-            
             messages.success(request, f'Saída registrada! Novo estoque: {produto.quantidade_atual}')
             return redirect('estoque:produto_detail', pk=produto.pk)
     else:
@@ -301,35 +359,108 @@ def ajuste_estoque(request, produto_id):
         motivo = request.POST.get('motivo')
         
         try:
-            nova_quantidade = float(nova_quantidade)
+            nova_quantidade = Decimal(nova_quantidade)
+            if not nova_quantidade.is_finite():
+                raise InvalidOperation
             
             if nova_quantidade < 0:
                 messages.error(request, 'A quantidade não pode ser negativa!')
                 return redirect('estoque:produto_detail', pk=produto.pk)
             
             # Criar movimentação de ajuste
-            MovimentacaoEstoque.objects.create(
-                produto=produto,
-                tipo='AJUSTE',
-                quantidade=abs(nova_quantidade - produto.quantidade_atual),
-                quantidade_anterior=produto.quantidade_atual,
-                quantidade_atual=nova_quantidade,
+            registrar_movimentacao(
+                produto, 'AJUSTE', nova_quantidade,
+                usuario=request.user,
                 motivo=motivo or 'Ajuste de estoque',
-                usuario=request.user
             )
             
-            produto.quantidade_atual = nova_quantidade
-            produto.save()
-            
             messages.success(request, f'Estoque ajustado! Nova quantidade: {nova_quantidade}')
             
-        except (ValueError, TypeError):
+        except (InvalidOperation, TypeError):
             messages.error(request, 'Quantidade inválida!')
     
     return redirect('estoque:produto_detail', pk=produto.pk)
 
 
 
+@require_POST
+def movimentacao_lote(request):
+    """Entradas e saídas em lote via JSON: {"itens": [{produto, tipo, quantidade, motivo, documento}]}"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+    
+    try:
+        itens = json.loads(request.body)['itens']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'erro': 'JSON inválido: esperado {"itens": [...]}'}, status=400)
+    
+    if not isinstance(itens, list):
+        return JsonResponse({'erro': '"itens" deve ser uma lista.'}, status=400)
+    
+    try:
+        resultados = registrar_movimentacoes_em_lote(itens, request.user)
+    except ValueError as exc:
+        return JsonResponse({'erro': str(exc)}, status=400)
+    
+    aplicadas = sum(1 for resultado in resultados if resultado['status'] == 'ok')
+    return JsonResponse({
+        'aplicadas': aplicadas,
+        'rejeitadas': len(resultados) - aplicadas,
+        'resultados': resultados,
+    })
+
+
+
+@require_POST
+def movimentacao_sincronizar(request):
+    """Fila offline do aplicativo: {"itens": [{id, produto, tipo, quantidade, motivo, ...}]}"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+    
+    try:
+        itens = json.loads(request.body)['itens']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'erro': 'JSON inválido: esperado {"itens": [...]}'}, status=400)
+    
+    if not isinstance(itens, list):
+        return JsonResponse({'erro': '"itens" deve ser uma lista.'}, status=400)
+    
+    try:
+        resultados = sincronizar_movimentacoes(itens, request.user)
+    except ValueError as exc:
+        return JsonResponse({'erro': str(exc)}, status=400)
+    
+    aplicadas = sum(1 for resultado in resultados if resultado['status'] == 'ok')
+    return JsonResponse({
+        'aplicadas': aplicadas,
+        'rejeitadas': len(resultados) - aplicadas,
+        'resultados': resultados,
+    })
+
+
+
+@require_GET
+@gzip_page
+def sincronizacao_alteracoes(request):
+    """Alterações do catálogo desde ?cursor= para a réplica local do aplicativo"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+    
+    try:
+        por_pagina = int(request.GET.get('limite', ALTERACOES_POR_PAGINA))
+    except ValueError:
+        return JsonResponse({'erro': '"limite" deve ser um número inteiro.'}, status=400)
+    
+    try:
+        alteracoes = alteracoes_desde(request.GET.get('cursor'), por_pagina)
+    except CursorInvalido as exc:
+        # O aplicativo descarta a réplica e recomeça sem cursor
+        return JsonResponse({'erro': str(exc)}, status=410)
+    
+    return JsonResponse(alteracoes, json_dumps_params={'separators': (',', ':')})
+
+
+
 def categoria_list(request):
     """Lista de categorias"""
     categorias = Categoria.objects.all()
@@ -350,19 +481,310 @@ def relatorios(request):
 
 
 
+def valor_estoque(request):
+    """Valor do estoque por categoria e fornecedor, com histórico, a partir do snapshot diário"""
+    ultima_data = SnapshotEstoque.objects.aggregate(ultima=Max('data'))['ultima']
+    if ultima_data is None:
+        gerar_snapshot()
+        ultima_data = timezone.localdate()
+    
+    linhas = list(SnapshotEstoque.objects.filter(data=ultima_data))
+    total = next((linha for linha in linhas if linha.dimensao == 'TOTAL'), None)
+    
+    try:
+        dias = min(max(int(request.GET.get('dias', 90)), 7), 365)
+    except ValueError:
+        dias = 90
+    
+    historico = list(SnapshotEstoque.objects.filter(
+        dimensao='TOTAL',
+        data__gt=ultima_data - timedelta(days=dias)
+    ).order_by('data').values('data', 'valor_custo', 'valor_venda'))
+    
+    maior_valor = max((dia['valor_custo'] for dia in historico), default=0)
+    for dia in historico:
+        dia['percentual'] = float(dia['valor_custo'] / maior_valor * 100) if maior_valor else 0
+    
+    context = {
+        'data': ultima_data,
+        'total': total,
+        'categorias': sorted(
+            (linha for linha in linhas if linha.dimensao == 'CATEGORIA'),
+            key=lambda linha: linha.valor_custo, reverse=True
+        ),
+        'fornecedores': sorted(
+            (linha for linha in linhas if linha.dimensao == 'FORNECEDOR'),
+            key=lambda linha: linha.valor_custo, reverse=True
+        ),
+        'historico': historico,
+        'dias': dias,
+    }
+    return render(request, 'estoque/valor_estoque.html', context)
+
+
+
+def giro_estoque(request):
+    """Produtos mais movimentados, curva ABC e giro, a partir do resumo diário"""
+    try:
+        dias = min(max(int(request.GET.get('dias', 90)), 7), 365)
+    except ValueError:
+        dias = 90
+    
+    context = relatorio_giro(dias)
+    context['dias'] = dias
+    return render(request, 'estoque/giro_estoque.html', context)
+
+
+
 def estoque_baixo(request):
-    """Produtos com estoque baixo"""
+    """Produtos com estoque baixo e os que já chegaram ao ponto de pedido previsto"""
     produtos = Produto.objects.filter(
         ativo=True,
-        quantidade_atual__lte=F('quantidade_minima')
-    ).select_related('categoria')
+        abaixo_minimo=True
+    ).select_related('categoria', 'previsao')
     
-    context = {'produtos': produtos}
+    # Acima do mínimo digitado, mas sem estoque para o prazo de reposição
+    reposicao_sugerida = Produto.objects.filter(
+        ativo=True,
+        abaixo_minimo=False,
+        quantidade_atual__lte=F('previsao__ponto_pedido'),
+    ).select_related('categoria', 'previsao')
+    
+    context = {'produtos': produtos, 'reposicao_sugerida': reposicao_sugerida}
     return render(request, 'estoque/estoque_baixo.html', context)
 
 
+@require_http_methods(['GET', 'POST', 'DELETE'])
+def push_inscricao(request):
+    """
+    Inscrição do navegador nos alertas de estoque baixo.
+
+    GET devolve a chave pública VAPID; POST grava a ``PushSubscription``
+    ({endpoint, keys: {p256dh, auth}}) e DELETE remove a do ``endpoint``.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+    
+    if request.method == 'GET':
+        return JsonResponse({'chave_publica': settings.PUSH_VAPID_CHAVE_PUBLICA})
+    
+    try:
+        dados = json.loads(request.body)
+        endpoint = dados['endpoint']
+        chaves = dados.get('keys') or {}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'erro': 'JSON inválido: esperado {"endpoint": ..., "keys": {...}}'}, status=400)
+    if not isinstance(endpoint, str) or not endpoint.startswith('https://') or len(endpoint) > 500:
+        return JsonResponse({'erro': 'Endpoint inválido.'}, status=400)
+    
+    if request.method == 'DELETE':
+        removidas, _ = InscricaoPush.objects.filter(usuario=request.user, endpoint=endpoint).delete()
+        return JsonResponse({'removidas': removidas})
+    
+    if not chaves.get('p256dh') or not chaves.get('auth'):
+        return JsonResponse({'erro': 'Informe as chaves p256dh e auth da inscrição.'}, status=400)
+    InscricaoPush.objects.update_or_create(
+        endpoint=endpoint,
+        defaults={'usuario': request.user, 'p256dh': chaves['p256dh'][:200], 'auth': chaves['auth'][:100]},
+    )
+    return JsonResponse({'inscrito': True}, status=201)
+
+
+@require_GET
+async def eventos(request, pk=None):
+    """
+    Server-Sent Events do dashboard ou, com ``pk``, da página do produto
+    (ver ``estoque/eventos.py``).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI a conexão prenderia um worker inteiro; com 204 o
+        # EventSource não tenta de novo e a página fica estática
+        return HttpResponse(status=204)
+    
+    return StreamingHttpResponse(
+        transmitir(pk),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# Inventário físico
+
+SITUACOES_ITEM = {
+    'pendentes': Q(quantidade_contada__isnull=True),
+    'contados': Q(quantidade_contada__isnull=False),
+    'divergentes': Q(quantidade_contada__isnull=False) & ~Q(diferenca=0),
+}
+
+
+def inventario_list(request):
+    """Inventários realizados e abertura de um novo"""
+    if request.method == 'POST':
+        form = InventarioForm(request.POST)
+        if not request.user.is_authenticated:
+            messages.error(request, 'Faça login para abrir um inventário.')
+        elif form.is_valid():
+            inventario, total = abrir_inventario(
+                form.cleaned_data['nome'],
+                request.user,
+                descricao=form.cleaned_data['descricao'],
+                categoria=form.cleaned_data['categoria'],
+                fornecedor=form.cleaned_data['fornecedor'],
+                localizacao=form.cleaned_data['localizacao'],
+            )
+            messages.success(request, f'Inventário aberto com {total} produtos para contagem.')
+            return redirect('estoque:inventario_detail', pk=inventario.pk)
+    else:
+        form = InventarioForm()
+    
+    inventarios = InventarioFisico.objects.select_related('criado_por', 'realizado_por')[:50]
+    context = {'form': form, 'inventarios': inventarios}
+    return render(request, 'estoque/inventario_list.html', context)
+
+
+
+def inventario_detail(request, pk):
+    """Progresso do inventário, itens e contagem manual"""
+    inventario = get_object_or_404(InventarioFisico, pk=pk)
+    
+    if request.method == 'POST':
+        form = ContagemForm(request.POST)
+        if not request.user.is_authenticated:
+            messages.error(request, 'Faça login para registrar contagens.')
+        elif form.is_valid():
+            try:
+                resultado, = registrar_contagens(inventario, [form.cleaned_data], request.user)
+            except InventarioEncerrado as e:
+                messages.error(request, str(e))
+            else:
+                if resultado['status'] == 'ok':
+                    messages.success(
+                        request,
+                        f'{resultado["produto"]}: contagem {resultado["quantidade_contada"]} '
+                        f'(diferença {resultado["diferenca"]})'
+                    )
+                else:
+                    messages.error(request, f'{resultado["produto"]}: {" ".join(resultado["erros"])}')
+            return redirect(f'{request.path}?{request.GET.urlencode()}')
+    else:
+        form = ContagemForm()
+    
+    situacao = request.GET.get('situacao', '')
+    itens = inventario.itens.select_related('produto', 'contado_por')
+    if situacao in SITUACOES_ITEM:
+        itens = itens.filter(SITUACOES_ITEM[situacao])
+    
+    context = {
+        'inventario': inventario,
+        'form': form,
+        'resumo': resumo_inventario(inventario),
+        'itens': paginar_por_cursor(itens, ['id'], request.GET, 50),
+        'situacao': situacao,
+        'fechamento': _fechamento_pendente(inventario) if inventario.status == 'EM_ANDAMENTO' else None,
+    }
+    return render(request, 'estoque/inventario_detail.html', context)
+
+
+
+@require_POST
+def inventario_contagens(request, pk):
+    """Contagens dos coletores via JSON: {"contagens": [{produto, quantidade, somar, observacao}]}"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+    
+    inventario = get_object_or_404(InventarioFisico, pk=pk)
+    try:
+        contagens = json.loads(request.body)['contagens']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'erro': 'JSON inválido: esperado {"contagens": [...]}'}, status=400)
+    
+    if not isinstance(contagens, list):
+        return JsonResponse({'erro': '"contagens" deve ser uma lista.'}, status=400)
+    
+    try:
+        resultados = registrar_contagens(inventario, contagens, request.user)
+    except InventarioEncerrado as exc:
+        return JsonResponse({'erro': str(exc)}, status=409)
+    except ValueError as exc:
+        return JsonResponse({'erro': str(exc)}, status=400)
+    
+    registradas = sum(1 for resultado in resultados if resultado['status'] == 'ok')
+    return JsonResponse({
+        'registradas': registradas,
+        'rejeitadas': len(resultados) - registradas,
+        'resultados': resultados,
+    })
+
+
+
+def _fechamento_pendente(inventario):
+    return Tarefa.objects.filter(
+        nome='fechar_inventario', argumentos__inventario_id=inventario.pk,
+        status__in=['PENDENTE', 'EXECUTANDO'],
+    ).first()
+
+
+
+@require_POST
+def inventario_fechar(request, pk):
+    """Conclui o inventário e ajusta o estoque pelas contagens"""
+    inventario = get_object_or_404(InventarioFisico, pk=pk)
+    if not request.user.is_authenticated:
+        messages.error(request, 'Faça login para concluir o inventário.')
+        return redirect('estoque:inventario_detail', pk=pk)
+    
+    # Milhares de ajustes não cabem no tempo de uma requisição: vai para a fila
+    if inventario.status != 'EM_ANDAMENTO':
+        messages.error(request, 'O inventário não está em andamento.')
+    elif _fechamento_pendente(inventario):
+        messages.info(request, 'O fechamento deste inventário já está em andamento.')
+    else:
+        enfileirar(
+            'fechar_inventario', usuario=request.user,
+            inventario_id=inventario.pk, usuario_id=request.user.pk,
+        )
+        messages.info(request, 'Fechamento iniciado: o estoque será ajustado em instantes.')
+    return redirect('estoque:inventario_detail', pk=pk)
+
+
+
+@require_POST
+def inventario_cancelar(request, pk):
+    """Cancela o inventário sem alterar o estoque"""
+    inventario = get_object_or_404(InventarioFisico, pk=pk)
+    if not request.user.is_authenticated:
+        messages.error(request, 'Faça login para cancelar o inventário.')
+        return redirect('estoque:inventario_detail', pk=pk)
+    
+    try:
+        cancelar_inventario(inventario)
+    except InventarioEncerrado as e:
+        messages.error(request, str(e))
+    else:
+        messages.success(request, 'Inventário cancelado.')
+    return redirect('estoque:inventario_detail', pk=pk)
+
+
+def tarefa_status(request, pk):
+    """Andamento de uma tarefa da fila, consultado pela interface"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+    
+    tarefas = Tarefa.objects.all() if request.user.is_staff else Tarefa.objects.filter(criado_por=request.user)
+    tarefa = tarefas.filter(pk=pk).values(
+        'id', 'nome', 'status', 'progresso', 'mensagem', 'resultado', 'tentativas', 'concluida_em'
+    ).first()
+    if tarefa is None:
+        return JsonResponse({'erro': 'Tarefa não encontrada.'}, status=404)
+    
+    tarefa['encerrada'] = tarefa['status'] in ('CONCLUIDA', 'FALHOU')
+    return JsonResponse(tarefa)
+
+
+
 # HTMX Views
 
+@condition(etag_func=etag_produto, last_modified_func=ultima_modificacao_produto)
 def produto_card_htmx(request, pk):
     """Card do produto para HTMX"""
     produto = get_object_or_404(Produto, pk=pk, ativo=True)
@@ -376,12 +798,7 @@ def buscar_produtos_htmx(request):
     produtos = []
     
     if len(search) >= 2:
-        produtos = Produto.objects.filter(
-            Q(nome__icontains=search) |
-            Q(codigo__icontains=search) |
-            Q(qr_code__icontains=search),
-            ativo=True
-        )[:10]
+        produtos = ranquear_produtos(Produto.objects.filter(ativo=True), search)[:10]
     
     return render(request, 'estoque/partials/produto_search_results.html', {
         'produtos': produtos, 'search': search
@@ -44,8 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'estoque.middleware.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,7 +60,8 @@ ROOT_URLCONF = 'gestao_estoque.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que mede o tempo de renderização para a instrumentação
+        'BACKEND': 'estoque.middleware.TemplatesInstrumentados',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,6 +88,148 @@ DATABASES = {
     )
 }
 
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    # Banco de testes em arquivo: no SQLite em memória compartilhada as threads
+    # recebem "table is locked" na hora em vez de aguardar o lock de escrita
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Compartilhado no banco por padrão: os workers do gunicorn e o worker da fila
+# invalidam as estatísticas do dashboard uns dos outros. A tabela é criada por
+# "python manage.py createcachetable" (já no deploy). LocMemCache só serve a
+# um único processo. "contadores" guarda os acertos e falhas do cache do
+# dashboard de cada processo.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='cache_estoque'),
+    },
+    'contadores': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'contadores-estoque',
+    },
+}
+
+# Tempo máximo (segundos) das estatísticas do dashboard em cache
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=300, cast=int)
+
+# Dias que as chaves de idempotência da fila offline ficam guardadas
+# (comando limpar_idempotencia)
+IDEMPOTENCIA_VALIDADE_DIAS = config('IDEMPOTENCIA_VALIDADE_DIAS', default=7, cast=int)
+
+# Armazenamento da mídia (imagens e planilhas enviadas). O disco local só é
+# visto pelo próprio serviço; com um worker separado use um armazenamento
+# compartilhado, p.ex. S3 ou compatível (pacote django-storages):
+# ARMAZENAMENTO_BACKEND=storages.backends.s3.S3Storage e as variáveis AWS_*
+ARMAZENAMENTO_BACKEND = config('ARMAZENAMENTO_BACKEND', default='django.core.files.storage.FileSystemStorage')
+AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default=None)
+AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default=None)
+AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default=None)
+AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default=None)
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+ARMAZENAMENTO_COMPARTILHADO = ARMAZENAMENTO_BACKEND != 'django.core.files.storage.FileSystemStorage'
+
+# Fila de tarefas no banco (estoque/fila.py), executada por
+# "python manage.py processar_tarefas --processos N --threads M".
+# Segundos que uma tarefa pode ficar sem dar notícias antes de voltar para a
+# fila, e espera base entre as novas tentativas (dobra a cada falha)
+TAREFAS_TEMPO_LIMITE = config('TAREFAS_TEMPO_LIMITE', default=600, cast=int)
+TAREFAS_ATRASO_BASE = config('TAREFAS_ATRASO_BASE', default=10, cast=int)
+# Sem worker rodando: True executa cada tarefa no processo que a criou, logo
+# depois do commit (a requisição espera por ela). É o padrão enquanto a mídia
+# ficar no disco local, que o worker não enxerga
+TAREFAS_NA_REQUISICAO = config('TAREFAS_NA_REQUISICAO', default=not ARMAZENAMENTO_COMPARTILHADO, cast=bool)
+
+# Imagens de produtos redimensionadas pela fila de tarefas depois do upload
+# (estoque/imagens.py); False processa na própria requisição
+IMAGENS_EM_SEGUNDO_PLANO = config('IMAGENS_EM_SEGUNDO_PLANO', default=True, cast=bool)
+
+# Previsão de demanda (estoque/previsao.py, comando calcular_previsoes):
+# dias de histórico de saídas, peso da média exponencial, prazo de reposição
+# em dias e fator do nível de serviço do estoque de segurança (1.65 ≈ 95%)
+PREVISAO_JANELA_DIAS = config('PREVISAO_JANELA_DIAS', default=90, cast=int)
+PREVISAO_ALFA = config('PREVISAO_ALFA', default=0.1, cast=float)
+PREVISAO_PRAZO_REPOSICAO_DIAS = config('PREVISAO_PRAZO_REPOSICAO_DIAS', default=7, cast=int)
+PREVISAO_FATOR_SERVICO = config('PREVISAO_FATOR_SERVICO', default=1.65, cast=float)
+
+# Alertas de estoque baixo por Web Push (estoque/alertas.py): espera para
+# juntar os alertas em uma notificação e horas até o mesmo produto alertar
+# de novo. O envio real usa o pacote pywebpush e um par de chaves VAPID
+# (ex.: "vapid --gen"); PUSH_BACKEND=estoque.alertas.PushLocal não envia nada
+ALERTAS_INTERVALO_SEGUNDOS = config('ALERTAS_INTERVALO_SEGUNDOS', default=300, cast=int)
+ALERTAS_REPETICAO_HORAS = config('ALERTAS_REPETICAO_HORAS', default=12, cast=int)
+PUSH_BACKEND = config('PUSH_BACKEND', default='estoque.alertas.WebPush')
+PUSH_VAPID_CHAVE_PUBLICA = config('PUSH_VAPID_CHAVE_PUBLICA', default='')
+PUSH_VAPID_CHAVE_PRIVADA = config('PUSH_VAPID_CHAVE_PRIVADA', default='')
+PUSH_VAPID_CONTATO = config('PUSH_VAPID_CONTATO', default='mailto:admin@example.com')
+
+# Atualizações ao vivo por Server-Sent Events (estoque/eventos.py, só sob ASGI):
+# intervalo da consulta ao banco pelas movimentações de outros processos
+# (0 desliga, com um único processo), do comentário que mantém a conexão viva
+# e do recálculo dos cartões do dashboard (0 recalcula a cada movimentação)
+EVENTOS_CONSULTA_SEGUNDOS = config('EVENTOS_CONSULTA_SEGUNDOS', default=5, cast=int)
+EVENTOS_PING_SEGUNDOS = config('EVENTOS_PING_SEGUNDOS', default=15, cast=int)
+EVENTOS_ESTATISTICAS_SEGUNDOS = config('EVENTOS_ESTATISTICAS_SEGUNDOS', default=5, cast=int)
+
+# Instrumentação por requisição (estoque/middleware.py): consultas, tempos e N+1.
+# Com INSTRUMENTACAO_LOG_NIVEL=INFO cada requisição gera uma linha JSON no log;
+# em WARNING só as que repetem consultas ou passam do orçamento. Ligada por
+# padrão só em desenvolvimento.
+INSTRUMENTACAO_ATIVA = config('INSTRUMENTACAO_ATIVA', default=DEBUG, cast=bool)
+INSTRUMENTACAO_SERVER_TIMING = config('INSTRUMENTACAO_SERVER_TIMING', default=DEBUG, cast=bool)
+INSTRUMENTACAO_LIMITE_REPETICOES = config('INSTRUMENTACAO_LIMITE_REPETICOES', default=5, cast=int)
+INSTRUMENTACAO_FALHAR_ORCAMENTO = config('INSTRUMENTACAO_FALHAR_ORCAMENTO', default=False, cast=bool)
+
+# Máximo de consultas por view (nome da URL); '*' vale para as demais. O do
+# dashboard inclui a leitura e a gravação das estatísticas no cache em banco
+INSTRUMENTACAO_ORCAMENTO_CONSULTAS = {
+    'estoque:dashboard': 12,
+    'estoque:produto_list': 8,
+    'estoque:movimentacao_list': 6,
+    'estoque:buscar_produtos_htmx': 4,
+    'estoque:buscar_qr': 4,
+    'estoque:movimentacao_lote': 15,
+    '*': 25,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'estoque.instrumentacao': {
+            'handlers': ['console'],
+            'level': config('INSTRUMENTACAO_LOG_NIVEL', default='WARNING'),
+            'propagate': False,
+        },
+        'estoque.imagens': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'estoque.fila': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'estoque.alertas': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'estoque.eventos': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,8 +272,31 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
-# Whitenoise configuration
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Whitenoise configuration: em produção os arquivos estáticos ganham o hash
+# do conteúdo no nome e podem ficar em cache para sempre (navegador e Service
+# Worker); em desenvolvimento os nomes originais dispensam o collectstatic
+STORAGES = {
+    'default': {
+        'BACKEND': ARMAZENAMENTO_BACKEND,
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
+
+def _cabecalhos_estaticos(headers, path, url):
+    # O Service Worker fica em /static/ mas controla o site inteiro, e o
+    # navegador precisa revalidá-lo para receber novas versões
+    if url.endswith('/sw.js'):
+        headers['Service-Worker-Allowed'] = '/'
+        headers['Cache-Control'] = 'no-cache'
+
+
+WHITENOISE_ADD_HEADERS_FUNCTION = _cabecalhos_estaticos
 
 # Media files
 MEDIA_URL = '/media/'
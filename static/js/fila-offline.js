@@ -0,0 +1,127 @@
+// Fila offline de movimentações (IndexedDB)
+//
+// Usada pela página, que enfileira as movimentações registradas sem
+// conexão, e pelo Service Worker, que as envia em lotes para
+// /movimentacoes/sincronizar/ quando a conexão volta (Background Sync).
+// Cada item leva um id gerado no dispositivo que o servidor usa como chave
+// de idempotência: reenviar um lote já aplicado não duplica movimentações.
+(function(escopo) {
+  const NOME_BANCO = 'gestao-estoque';
+  const VERSAO_BANCO = 1;
+  const FILA = 'movimentacoes';
+  const URL_SINCRONIZAR = '/movimentacoes/sincronizar/';
+  // Abaixo do limite de 1000 itens por requisição do servidor
+  const ITENS_POR_ENVIO = 500;
+
+  function abrirBanco() {
+    return new Promise(function(resolve, reject) {
+      const requisicao = indexedDB.open(NOME_BANCO, VERSAO_BANCO);
+      requisicao.onupgradeneeded = function() {
+        requisicao.result.createObjectStore(FILA, { keyPath: 'id' });
+      };
+      requisicao.onsuccess = function() { resolve(requisicao.result); };
+      requisicao.onerror = function() { reject(requisicao.error); };
+    });
+  }
+
+  function transacao(modo, operacao) {
+    return abrirBanco().then(function(banco) {
+      return new Promise(function(resolve, reject) {
+        const tx = banco.transaction(FILA, modo);
+        const resultado = operacao(tx.objectStore(FILA));
+        tx.oncomplete = function() {
+          banco.close();
+          resolve(resultado && 'result' in resultado ? resultado.result : undefined);
+        };
+        tx.onerror = tx.onabort = function() {
+          banco.close();
+          reject(tx.error);
+        };
+      });
+    });
+  }
+
+  function gerarId() {
+    if (escopo.crypto && crypto.randomUUID) {
+      return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+  }
+
+  function adicionar(movimentacao) {
+    const item = Object.assign({ id: gerarId(), registrado_em: new Date().toISOString() }, movimentacao);
+    return transacao('readwrite', function(fila) { fila.put(item); }).then(function() { return item; });
+  }
+
+  function listar() {
+    return transacao('readonly', function(fila) { return fila.getAll(); });
+  }
+
+  function contar() {
+    return transacao('readonly', function(fila) { return fila.count(); });
+  }
+
+  function remover(ids) {
+    return transacao('readwrite', function(fila) {
+      ids.forEach(function(id) { fila.delete(id); });
+    });
+  }
+
+  // Envia a fila em lotes. Itens respondidos pelo servidor (aplicados ou
+  // rejeitados) saem da fila; falhas de rede ou de sessão rejeitam a promise
+  // para o Background Sync tentar de novo mais tarde.
+  function sincronizar() {
+    const resumo = { aplicadas: 0, rejeitadas: [] };
+
+    function enviar(itens) {
+      if (!itens.length) {
+        return Promise.resolve(resumo);
+      }
+      const lote = itens.slice(0, ITENS_POR_ENVIO);
+      const csrf = lote[lote.length - 1].csrf;
+
+      return fetch(URL_SINCRONIZAR, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrf || '' },
+        body: JSON.stringify({
+          itens: lote.map(function(item) {
+            const dados = Object.assign({}, item);
+            delete dados.csrf;
+            return dados;
+          })
+        })
+      }).then(function(resposta) {
+        if (!resposta.ok) {
+          throw new Error('Sincronização recusada: HTTP ' + resposta.status);
+        }
+        return resposta.json();
+      }).then(function(dados) {
+        dados.resultados.forEach(function(resultado) {
+          if (resultado.status === 'ok') {
+            resumo.aplicadas += 1;
+          } else {
+            resumo.rejeitadas.push(resultado);
+          }
+        });
+        return remover(dados.resultados.map(function(resultado) { return resultado.id; }));
+      }).then(function() {
+        return enviar(itens.slice(ITENS_POR_ENVIO));
+      });
+    }
+
+    return listar().then(function(itens) {
+      // Na ordem em que foram registradas: uma saída pode depender de uma entrada anterior
+      itens.sort(function(a, b) { return a.registrado_em < b.registrado_em ? -1 : 1; });
+      return enviar(itens);
+    });
+  }
+
+  escopo.FilaOffline = {
+    adicionar: adicionar,
+    listar: listar,
+    contar: contar,
+    remover: remover,
+    sincronizar: sincronizar
+  };
+})(self);
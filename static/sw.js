@@ -1,11 +1,24 @@
 // Service Worker para PWA - Versão Mobile Otimizada
-const CACHE_NAME = 'gestao-estoque-mobile-v2';
-const urlsToCache = [
-  '/',
+importScripts('/static/js/fila-offline.js');
+
+// Cada tipo de recurso tem sua estratégia e seu cache, com um limite de
+// entradas; ao passar do limite saem as menos usadas (LRU). Mudar a versão
+// descarta os caches anteriores na ativação.
+const VERSAO = 'v5';
+const CACHES = {
+  paginas: { nome: 'gestao-estoque-paginas-' + VERSAO, limite: 50 },
+  dados: { nome: 'gestao-estoque-dados-' + VERSAO, limite: 100 },
+  estaticos: { nome: 'gestao-estoque-estaticos-' + VERSAO, limite: 150 },
+  midia: { nome: 'gestao-estoque-midia-' + VERSAO, limite: 200 }
+};
+
+// Dados de estoque: acima disso a última resposta em cache é usada
+const TEMPO_LIMITE_REDE = 3000;
+
+const PAGINAS_INICIAIS = ['/', '/produtos/', '/movimentacoes/', '/buscar-qr/'];
+const ESTATICOS_INICIAIS = [
   '/static/manifest.json',
-  '/produtos/',
-  '/buscar-qr/',
-  '/movimentacoes/',
+  '/static/js/fila-offline.js',
   'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
   'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/bootstrap-icons.css',
   'https://unpkg.com/htmx.org@1.9.6/dist/htmx.min.js',
@@ -13,90 +26,277 @@ const urlsToCache = [
   'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js'
 ];
 
+// Nome com o hash do conteúdo (CompressedManifestStaticFilesStorage): nunca muda
+const ESTATICO_VERSIONADO = /\.[0-9a-f]{12}\.[a-z0-9]+$/;
+// Bibliotecas de CDN com a versão fixada na URL
+const CDN_VERSIONADO = /^https:\/\/(cdn\.jsdelivr\.net|unpkg\.com)\/.+@\d/;
+
 // Instalar Service Worker
 self.addEventListener('install', function(event) {
+  // Uma URL indisponível não impede a instalação
+  function preencher(config, urls) {
+    return caches.open(config.nome).then(function(cache) {
+      return Promise.all(urls.map(function(url) {
+        return cache.add(url).catch(function() {
+          console.log('Não foi possível guardar ' + url);
+        });
+      }));
+    });
+  }
+
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(function(cache) {
-        console.log('Cache aberto');
-        return cache.addAll(urlsToCache);
-      })
+    Promise.all([
+      preencher(CACHES.paginas, PAGINAS_INICIAIS),
+      preencher(CACHES.estaticos, ESTATICOS_INICIAIS)
+    ]).then(function() {
+      return self.skipWaiting();
+    })
   );
 });
 
-// Interceptar requisições
-self.addEventListener('fetch', function(event) {
-  event.respondWith(
-    caches.match(event.request)
-      .then(function(response) {
-        // Cache hit - retorna resposta do cache
-        if (response) {
-          return response;
-        }
-
-        return fetch(event.request).then(
-          function(response) {
-            // Verificar se recebemos uma resposta válida
-            if(!response || response.status !== 200 || response.type !== 'basic') {
-              return response;
-            }
-
-            // IMPORTANTE: Clona a resposta. Uma resposta é um stream
-            // e pode ser consumida apenas uma vez. Precisamos de uma cópia
-            // para colocar no cache e outra para retornar ao navegador.
-            var responseToCache = response.clone();
-
-            caches.open(CACHE_NAME)
-              .then(function(cache) {
-                cache.put(event.request, responseToCache);
-              });
-
-            return response;
-          }
-        );
-      })
-    );
-});
-
 // Atualizar Service Worker
 self.addEventListener('activate', function(event) {
-  var cacheWhitelist = [CACHE_NAME];
+  const atuais = Object.keys(CACHES).map(function(tipo) { return CACHES[tipo].nome; });
 
   event.waitUntil(
     caches.keys().then(function(cacheNames) {
       return Promise.all(
         cacheNames.map(function(cacheName) {
-          if (cacheWhitelist.indexOf(cacheName) === -1) {
+          if (atuais.indexOf(cacheName) === -1) {
             return caches.delete(cacheName);
           }
         })
       );
+    }).then(function() {
+      return self.clients.claim();
     })
   );
 });
 
-// Sincronização em background
+// Interceptar requisições
+self.addEventListener('fetch', function(event) {
+  const rota = escolherRota(event.request);
+  if (rota) {
+    event.respondWith(rota.estrategia(event, rota.cache));
+  }
+});
+
+function escolherRota(request) {
+  const url = new URL(request.url);
+  const aceita = request.headers.get('Accept') || '';
+
+  if (request.method !== 'GET') {
+    return null;
+  }
+  if (url.origin !== self.location.origin) {
+    return CDN_VERSIONADO.test(url.href) ? { estrategia: cachePrimeiro, cache: CACHES.estaticos } : null;
+  }
+  // Admin, downloads (exportações em streaming) e Server-Sent Events vão direto para a rede
+  if (url.pathname.startsWith('/admin/') || url.pathname.indexOf('/exportar/') !== -1 ||
+      aceita.indexOf('text/event-stream') !== -1) {
+    return null;
+  }
+  if (url.pathname.startsWith('/static/')) {
+    if (ESTATICO_VERSIONADO.test(url.pathname)) {
+      return { estrategia: cachePrimeiro, cache: CACHES.estaticos };
+    }
+    return { estrategia: revalidarEmSegundoPlano, cache: CACHES.estaticos };
+  }
+  if (url.pathname.startsWith('/media/')) {
+    return { estrategia: cachePrimeiro, cache: CACHES.midia };
+  }
+  // Fragmentos HTMX e JSON trazem saldos de estoque: a rede tem prioridade
+  if (request.headers.get('HX-Request') || url.pathname.startsWith('/htmx/') ||
+      aceita.indexOf('application/json') !== -1) {
+    return { estrategia: redePrimeiro, cache: CACHES.dados };
+  }
+  // Páginas sempre da rede (saldos, mensagens depois de um POST, formulários
+  // com token CSRF); a cópia em cache só é usada sem conexão
+  if (request.mode === 'navigate' || aceita.indexOf('text/html') !== -1) {
+    return { estrategia: redeComCopiaOffline, cache: CACHES.paginas };
+  }
+  return { estrategia: redePrimeiro, cache: CACHES.dados };
+}
+
+function podeGuardar(resposta) {
+  // Respostas opacas: scripts e estilos de CDN pedidos sem CORS
+  return resposta.type === 'opaque' || (resposta.ok && !resposta.redirected);
+}
+
+function guardar(config, request, resposta) {
+  return caches.open(config.nome).then(function(cache) {
+    // put substitui a entrada e a leva para o fim da lista de chaves, então
+    // as primeiras chaves são sempre as usadas há mais tempo
+    return cache.put(request, resposta).then(function() {
+      return cache.keys();
+    }).then(function(chaves) {
+      const excedentes = chaves.slice(0, Math.max(0, chaves.length - config.limite));
+      return Promise.all(excedentes.map(function(chave) { return cache.delete(chave); }));
+    });
+  });
+}
+
+function buscarNoCache(config, request) {
+  return caches.open(config.nome).then(function(cache) {
+    return cache.match(request);
+  });
+}
+
+function semConexao(request) {
+  if (request.mode !== 'navigate') {
+    return Response.error();
+  }
+  return new Response(
+    '<!DOCTYPE html><html lang="pt-br"><head><meta charset="UTF-8">' +
+    '<meta name="viewport" content="width=device-width, initial-scale=1.0">' +
+    '<title>Sem conexão - Gestão de Estoque</title></head><body style="font-family: sans-serif; padding: 2rem;">' +
+    '<h1>Sem conexão</h1><p>Esta página ainda não foi aberta neste aparelho.</p>' +
+    '<p><a href="/">Voltar ao início</a></p></body></html>',
+    { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+  );
+}
+
+// Cache primeiro: arquivos versionados, que nunca mudam para a mesma URL
+function cachePrimeiro(event, config) {
+  const request = event.request;
+  return buscarNoCache(config, request).then(function(cacheada) {
+    if (cacheada) {
+      event.waitUntil(guardar(config, request, cacheada.clone()));
+      return cacheada;
+    }
+    return fetch(request).then(function(resposta) {
+      if (podeGuardar(resposta)) {
+        event.waitUntil(guardar(config, request, resposta.clone()));
+      }
+      return resposta;
+    });
+  });
+}
+
+// Stale-while-revalidate: estáticos sem hash no nome abrem na hora com a
+// versão em cache e são atualizados em segundo plano
+function revalidarEmSegundoPlano(event, config) {
+  const request = event.request;
+  const emCache = buscarNoCache(config, request);
+  const rede = fetch(request).then(function(resposta) {
+    return { resposta: resposta, copia: resposta.clone() };
+  });
+
+  event.waitUntil(rede.then(function(resultado) {
+    if (podeGuardar(resultado.copia)) {
+      return guardar(config, request, resultado.copia);
+    }
+  }).catch(function() {}));
+
+  return emCache.then(function(cacheada) {
+    if (cacheada) {
+      return cacheada;
+    }
+    return rede.then(function(resultado) {
+      return resultado.resposta;
+    }).catch(function() {
+      return semConexao(request);
+    });
+  });
+}
+
+// Rede primeiro, sem tempo limite: a página em cache só aparece quando a
+// rede falha. Redirecionamentos (ex.: depois de um POST) não são guardados
+function redeComCopiaOffline(event, config) {
+  const request = event.request;
+  return fetch(request).then(function(resposta) {
+    if (podeGuardar(resposta)) {
+      event.waitUntil(guardar(config, request, resposta.clone()));
+    }
+    return resposta;
+  }).catch(function() {
+    return buscarNoCache(config, request).then(function(cacheada) {
+      return cacheada || semConexao(request);
+    });
+  });
+}
+
+// Rede primeiro com tempo limite: saldos de estoque atualizados sempre que a
+// rede responder a tempo, e a última resposta conhecida quando não
+function redePrimeiro(event, config) {
+  const request = event.request;
+  const rede = fetch(request).then(function(resposta) {
+    return { resposta: resposta, copia: resposta.clone() };
+  });
+
+  event.waitUntil(rede.then(function(resultado) {
+    if (podeGuardar(resultado.copia)) {
+      return guardar(config, request, resultado.copia);
+    }
+  }).catch(function() {}));
+
+  const respostaDaRede = rede.then(function(resultado) {
+    return resultado.resposta;
+  });
+  const aposTempoLimite = new Promise(function(resolve) {
+    setTimeout(resolve, TEMPO_LIMITE_REDE);
+  }).then(function() {
+    return buscarNoCache(config, request);
+  }).then(function(cacheada) {
+    return cacheada || respostaDaRede;
+  });
+
+  return Promise.race([respostaDaRede, aposTempoLimite]).catch(function() {
+    return buscarNoCache(config, request).then(function(cacheada) {
+      return cacheada || semConexao(request);
+    });
+  });
+}
+
+// Sincronização em background: envia a fila offline de movimentações
 self.addEventListener('sync', function(event) {
   if (event.tag == 'background-sync') {
     event.waitUntil(doBackgroundSync());
   }
 });
 
+// Navegadores sem Background Sync pedem a sincronização ao voltar online
+self.addEventListener('message', function(event) {
+  if (event.data && event.data.tipo === 'sincronizar') {
+    event.waitUntil(doBackgroundSync());
+  }
+});
+
 function doBackgroundSync() {
-  // Implementar sincronização de dados quando voltar online
-  return Promise.resolve();
+  return FilaOffline.sincronizar().then(function(resumo) {
+    return avisarPaginas(Object.assign({ tipo: 'fila-sincronizada' }, resumo));
+  });
 }
 
-// Notificações push (para futuras implementações)
+function avisarPaginas(mensagem) {
+  return self.clients.matchAll({ type: 'window', includeUncontrolled: true }).then(function(paginas) {
+    paginas.forEach(function(pagina) { pagina.postMessage(mensagem); });
+  });
+}
+
+// Notificações push: alertas de estoque baixo (estoque/alertas.py) chegam
+// como JSON {titulo, corpo, url, tag}; outras mensagens, como texto
 self.addEventListener('push', function(event) {
+  let mensagem = {};
+  if (event.data) {
+    try {
+      mensagem = event.data.json();
+    } catch (erro) {
+      mensagem = { corpo: event.data.text() };
+    }
+  }
+
   const options = {
-    body: event.data ? event.data.text() : 'Notificação do Gestão de Estoque',
+    body: mensagem.corpo || 'Notificação do Gestão de Estoque',
     icon: '/static/icons/icon-192x192.png',
     badge: '/static/icons/icon-72x72.png',
     vibrate: [100, 50, 100],
+    // Mesma tag: um resumo novo substitui o anterior em vez de empilhar
+    tag: mensagem.tag,
+    renotify: Boolean(mensagem.tag),
     data: {
       dateOfArrival: Date.now(),
-      primaryKey: 1
+      url: mensagem.url || '/'
     },
     actions: [
       {
@@ -113,7 +313,7 @@ self.addEventListener('push', function(event) {
   };
 
   event.waitUntil(
-    self.registration.showNotification('Gestão de Estoque', options)
+    self.registration.showNotification(mensagem.titulo || 'Gestão de Estoque', options)
   );
 });
 
@@ -121,15 +321,16 @@ self.addEventListener('push', function(event) {
 self.addEventListener('notificationclick', function(event) {
   event.notification.close();
 
+  const url = (event.notification.data && event.notification.data.url) || '/';
   if (event.action === 'explore') {
     event.waitUntil(
-      clients.openWindow('/')
+      clients.openWindow(url)
     );
   } else if (event.action === 'close') {
     event.notification.close();
   } else {
     event.waitUntil(
-      clients.openWindow('/')
+      clients.openWindow(url)
     );
   }
 });